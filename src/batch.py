@@ -0,0 +1,193 @@
+import contextlib
+import csv
+import glob
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+import cache
+import macro
+import cycle
+import lockstep
+
+# Batch mode runs one machine over many tapes. The machine is parsed once and
+# handed to a pool of worker processes, each of which runs whole tapes and
+# sends back one result record per tape. Records come back in the order the
+# tapes were listed, however many workers there are.
+
+FIELDS = ['tape', 'verdict', 'steps', 'exit', 'time']
+VERDICTS = {0: 'accept', 1: 'reject', 2: 'abort', 4: 'loop'}
+
+# The machine each worker process runs, set up once by init_worker.
+worker_machine = None
+worker_rle = 0
+worker_cycles = False
+# Results already found by the worker, by tape, if they are being remembered.
+worker_memo = None
+
+
+# List the tapes named by a batch source. Each tape is a (name, path, text)
+# tuple, where exactly one of path and text is given. The source may be a
+# directory (every file in it is a tape), a glob pattern (every matching
+# file is a tape), or a file holding one tape per line.
+def tape_jobs(source):
+    if os.path.isdir(source):
+        paths = [os.path.join(source, n) for n in sorted(os.listdir(source))]
+        return [(p, p, None) for p in paths if os.path.isfile(p)]
+    if os.path.isfile(source):
+        with open(source, 'r') as f:
+            lines = f.read().split('\n')
+        if lines and lines[-1] == '':
+            lines.pop()
+        return [('{}:{}'.format(source, i + 1), None, ''.join(line.split()))
+                for i, line in enumerate(lines)]
+    return [(p, p, None) for p in sorted(glob.glob(source)) if os.path.isfile(p)]
+
+
+def init_worker(machine, rle, cycles, memo):
+    global worker_machine, worker_rle, worker_cycles, worker_memo
+    worker_machine = machine
+    worker_rle = rle
+    worker_cycles = cycles
+    worker_memo = cache.LRU(memo) if memo > 0 else None
+
+
+# Run the worker's machine on a single tape from its initial state, and
+# return the result record. Anything the machine would print is swallowed,
+# and errors which would exit the program are recorded by their exit code,
+# with the steps taken before them. A tape the worker has already run is not run again if results are being
+# remembered.
+def run_job(job):
+    name, path, tape = job
+    machine = worker_machine
+    record = {'tape': name, 'verdict': 'error', 'steps': 0, 'exit': 0, 'time': 0.0}
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            machine.reset()
+            if path is not None:
+                try:
+                    with open(path, 'r') as tf:
+                        tape = ''.join(tf.read().split())
+                except FileNotFoundError:
+                    exit(21)
+            result = worker_memo.get(tape) if worker_memo is not None else None
+            if result is not None:
+                record['exit'], record['steps'] = result
+                record['verdict'] = VERDICTS[record['exit']]
+                record['time'] = round(time.perf_counter() - start, 6)
+                return record
+            machine.add_tape(tape)
+            if worker_cycles:
+                cycle.run_cycles(machine)
+            elif worker_rle > 0:
+                macro.run_macro(machine, worker_rle)
+            else:
+                machine.run_tape()
+            record['exit'] = machine.get_last_exit()
+            record['verdict'] = VERDICTS[record['exit']]
+            if worker_memo is not None:
+                worker_memo.put(tape, (record['exit'], machine.numsteps))
+        except SystemExit as e:
+            record['exit'] = e.code
+    record['steps'] = machine.numsteps
+    record['time'] = round(time.perf_counter() - start, 6)
+    return record
+
+
+# Run the worker's machine over a list of tapes in lockstep, returning one
+# record per tape. The time recorded for each tape is how long it took for
+# it to finish, counting from the start of the whole list.
+def run_chunk(jobs):
+    records = []
+    tapes = []
+    for name, path, tape in jobs:
+        records.append({'tape': name, 'verdict': 'error', 'steps': 0, 'exit': 21, 'time': 0.0})
+        if path is not None:
+            try:
+                with open(path, 'r') as tf:
+                    tape = ''.join(tf.read().split())
+            except FileNotFoundError:
+                tape = None
+        if tape is not None:
+            tapes.append((records[-1], tape))
+    results = lockstep.run_lockstep(worker_machine, [tape for record, tape in tapes])
+    for (record, tape), (code, steps, state, seconds) in zip(tapes, results):
+        record['verdict'] = VERDICTS.get(code, 'error')
+        record['steps'] = steps
+        record['exit'] = code
+        record['time'] = round(seconds, 6)
+    return records
+
+
+# Run a machine over every tape in a batch source with the given number of
+# worker processes, writing one record per tape to 'output' (as CSV if the
+# name ends in .csv, otherwise as JSON lines), or to stdout if no output is
+# given. If 'rows' is nonzero, each worker runs that many tapes at a time in
+# lockstep. If 'memo' is nonzero, each worker remembers the results of that
+# many tapes, and gives them again for the same tape without running it.
+# Returns the exit code for the program.
+def run_batch(machine, source, workers, output, rle=0, rows=0, cycles=False, memo=0):
+    jobs = tape_jobs(source)
+    if not jobs:
+        print("No tapes found for batch source '{}'. Exiting.".format(source))
+        return 26
+    # Lockstep rows are stepped by the compiled table alone, so they can
+    # neither watch for cycles nor run over run-length encoded tapes.
+    if rows > 0 and (cycles or rle > 0):
+        print("Lockstep mode can not be used with --cycles or --rle. Exiting.")
+        return 49
+    if rows > 0 and lockstep.numpy is None:
+        print("Lockstep mode needs NumPy, which could not be imported. Exiting.")
+        return 28
+    if workers is None or workers < 1:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+
+    try:
+        out = open(output, 'w', newline='') if output is not None else sys.stdout
+    except OSError:
+        print("Batch output file at {} could not be opened. Exiting.".format(output))
+        return 27
+    if output is not None and output.endswith('.csv'):
+        writer = csv.DictWriter(out, fieldnames=FIELDS)
+        writer.writeheader()
+        write = writer.writerow
+    else:
+        write = lambda record: out.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    task = run_job
+    chunksize = max(1, min(64, len(jobs) // (workers * 4)))
+    if rows > 0:
+        jobs = [jobs[i:i + rows] for i in range(0, len(jobs), rows)]
+        task = run_chunk
+        chunksize = 1
+        workers = min(workers, len(jobs))
+
+    counts = {}
+    if workers == 1:
+        init_worker(machine, rle, cycles, memo)
+        results = map(task, jobs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers, init_worker, (machine, rle, cycles, memo))
+        results = pool.imap(task, jobs, chunksize)
+    try:
+        for result in results:
+            for record in (result if rows > 0 else [result]):
+                write(record)
+                counts[record['verdict']] = counts.get(record['verdict'], 0) + 1
+    finally:
+        # Every result has been collected by now, unless we were
+        # interrupted, in which case the workers have nothing left to do.
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if output is not None:
+            out.close()
+
+    if output is not None:
+        print(', '.join('{} {}'.format(counts.get(v, 0), v) for v in ['accept', 'reject', 'abort', 'loop', 'error']))
+    return 0
@@ -0,0 +1,253 @@
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from machine import load_machine, MachineError
+import macro
+import cycle
+import codegen
+
+# The benchmark runs every machine in examples/ on every tape in inputs/ it
+# can read, and the machines below on tapes of growing size made for them,
+# under each engine in turn. Each run is made in a fresh worker process, so
+# the memory it takes can be told apart from that of the runs before it,
+# and the runs are made one at a time, so they do not compete for the CPU.
+# The results can be saved as JSON, and compared against those saved by an
+# earlier benchmark to find the runs which have become slower.
+
+ENGINES = ['reference', 'compiled', 'generated', 'linked', 'rle', 'cycles']
+
+# Engines which run machines with more than one tape.
+MULTITAPE = ['reference', 'compiled']
+
+# Steps each run is stopped after, unless --haltafter is given. Machines
+# which never halt, and the larger tapes, run to this many steps.
+LIMIT = 1000000
+
+# Each run is timed at least this many times, and for at least this many
+# seconds in all, and the fastest is kept.
+REPEAT = 3
+MEASURE = 0.2
+
+# Sizes of the tapes made for the machines below.
+SIZES = [100, 1000, 10000, 100000]
+
+# Runs which take less than this many seconds are too short to compare.
+SHORTEST = 0.01
+
+# Changes in peak memory of less than this many megabytes are not counted,
+# as the operating system hands out memory in large pieces.
+SLACK = 1.0
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EXAMPLES = os.path.join(HERE, '..', 'examples')
+INPUTS = os.path.join(HERE, '..', 'inputs')
+
+
+# A string of n bits, the same each time for the same n, with each bit
+# written twice, then 01, then the string itself, which is what the
+# bitwise-double machines accept.
+def doubled(n):
+    rng = random.Random(n)
+    bits = ''.join(rng.choice('01') for i in range(0, n))
+    return ''.join(bit + bit for bit in bits) + '01' + bits
+
+
+# Tapes of size n for machines in examples/, by file name.
+SCALED = {
+    '0n1n.txt': lambda n: '0' * n + '1' * n,
+    '0n1n-2tape.txt': lambda n: '0' * n + '1' * n,
+    'bitwise-double-0x1x.txt': doubled,
+    'bitwise-double-0xx1xx.txt': doubled,
+    'bitwise-double-0xxxxx1xx.txt': doubled,
+    'bitwise-double-oi.txt': doubled,
+}
+
+VERDICTS = {0: 'accept', 1: 'reject', 2: 'abort', 4: 'loop'}
+
+
+class BenchError(Exception):
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+# Peak memory the process has taken so far, in megabytes.
+def peak():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage / (1 << 20) if sys.platform == 'darwin' else usage / (1 << 10)
+
+
+# The tapes of a benchmark, as (machine path, tape name, tape, engines)
+# tuples, for the given machine files, or for every machine in examples/ if
+# none are given. Tapes a machine cannot read are left out.
+def workloads(paths):
+    if not paths:
+        paths = [os.path.join(EXAMPLES, n) for n in sorted(os.listdir(EXAMPLES))]
+    inputs = []
+    for name in sorted(os.listdir(INPUTS)):
+        with open(os.path.join(INPUTS, name), 'r') as f:
+            inputs.append((name, ''.join(f.read().split())))
+    jobs = []
+    for path in paths:
+        try:
+            definition = load_machine(path)
+        except MachineError as e:
+            raise BenchError(e.message, e.code)
+        tapes = list(inputs)
+        scale = SCALED.get(os.path.basename(path))
+        if scale is not None:
+            tapes.extend(('n={}'.format(n), scale(n)) for n in SIZES)
+        machine = definition.build()
+        engines = ENGINES if definition.tapes == 1 else MULTITAPE
+        for name, tape in tapes:
+            # A tape with symbols the machine does not know ends the
+            # program, which is how such tapes are found.
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    machine.add_tape(tape)
+            except SystemExit:
+                continue
+            jobs.append((path, name, tape, engines))
+    return jobs
+
+
+# Run one machine on one tape with one engine, timing it REPEAT times or
+# for MEASURE seconds, whichever takes longer, and return its record: the
+# steps taken, the verdict, the fastest time, the steps taken per second,
+# and how much more memory the process took to make the run. A machine
+# which would exit the program is stopped at its first run and recorded as
+# an error, with the code it would have exited with.
+def run_case(case):
+    path, name, tape, engine, limit = case
+    definition = load_machine(path)
+    best = None
+    before = peak()
+    total = 0.0
+    runs = 0
+    code = None
+    while runs < REPEAT or total < MEASURE:
+        machine = definition.build(0, 0, limit, None, False, engine == 'reference', engine == 'linked')
+        start = None
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                machine.add_tape(tape)
+                start = time.perf_counter()
+                if engine == 'rle':
+                    macro.run_macro(machine, 1)
+                elif engine == 'cycles':
+                    cycle.run_cycles(machine)
+                elif engine == 'generated':
+                    codegen.run_generated(machine)
+                else:
+                    machine.run_tape()
+        except SystemExit as e:
+            code = e.code
+        seconds = time.perf_counter() - start if start is not None else 0.0
+        total += seconds
+        runs += 1
+        if best is None or seconds < best:
+            best = seconds
+        if code is not None:
+            break
+    return {'machine': os.path.basename(path), 'tape': name, 'engine': engine, 'steps': machine.numsteps,
+            'verdict': 'error' if code is not None else VERDICTS.get(machine.get_last_exit(), 'error'),
+            'exit': code if code is not None else machine.get_last_exit(), 'time': round(best, 6),
+            'rate': round(machine.numsteps / best) if best > 0 else 0,
+            'memory': round(max(peak() - before, 0.0), 1)}
+
+
+# Read the results of an earlier benchmark, by machine, tape and engine.
+def read_baseline(path):
+    try:
+        with open(path, 'r') as f:
+            return {key(record): record for record in json.load(f)['results']}
+    except (OSError, ValueError, KeyError, TypeError):
+        raise BenchError("Benchmark baseline at {} could not be read. Exiting.".format(path), 41)
+
+
+# Compare the results of a benchmark against those of an earlier one, and
+# return a line for each run which is slower, takes more memory, or takes a
+# different number of steps than it did, by more than 'threshold' percent.
+# Runs too short to time well, and runs only one of them made, are not
+# compared.
+def compare(results, baseline, threshold):
+    lines = []
+    for record in results:
+        base = baseline.get(key(record))
+        if base is None:
+            continue
+        name = '{} {} {}'.format(*key(record))
+        if record['steps'] != base['steps']:
+            lines.append("{}: took {} steps, not {}".format(name, record['steps'], base['steps']))
+            continue
+        if base['time'] >= SHORTEST and record['time'] >= SHORTEST \
+                and record['rate'] < base['rate'] * (1 - threshold / 100):
+            lines.append("{}: {} steps/s, down {:.1f}% from {}".format(
+                name, record['rate'], 100 * (1 - record['rate'] / base['rate']), base['rate']))
+        if record['memory'] > base['memory'] * (1 + threshold / 100) and record['memory'] - base['memory'] > SLACK:
+            lines.append("{}: {} MB, up from {} MB".format(name, record['memory'], base['memory']))
+    return lines
+
+
+def row(record):
+    return "{:<30} {:<16} {:<10} {:>10} {:>8} {:>10.4f} {:>12} {:>8.1f}".format(
+        record['machine'], record['tape'], record['engine'], record['steps'], record['verdict'],
+        record['time'], record['rate'], record['memory'])
+
+
+# Run the benchmark for the given machine files (or every example, if there
+# are none), stopping each run after 'limit' steps, print a table of the
+# results, and write them as JSON to 'output' if it is given. If a baseline
+# is given, the results are compared against it, and the return code is 43
+# if any run has become worse by more than 'threshold' percent. Returns the
+# exit code for the program.
+def run_bench(paths, limit, output, baseline, threshold):
+    if limit <= 0:
+        limit = LIMIT
+    try:
+        jobs = workloads(paths)
+        base = read_baseline(baseline) if baseline else None
+    except BenchError as e:
+        print(e.message)
+        return e.code
+    cases = [(path, name, tape, engine, limit) for path, name, tape, engines in jobs for engine in engines]
+
+    print("{:<30} {:<16} {:<10} {:>10} {:>8} {:>10} {:>12} {:>8}".format(
+        'machine', 'tape', 'engine', 'steps', 'verdict', 'time (s)', 'steps/s', 'MB'))
+    results = []
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    try:
+        for record in pool.imap(run_case, cases):
+            print(row(record))
+            results.append(record)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    if output is not None:
+        try:
+            with open(output, 'w') as f:
+                json.dump({'python': platform.python_version(), 'limit': limit, 'repeat': REPEAT,
+                           'results': results}, f, indent=1)
+                f.write('\n')
+        except OSError:
+            print("Benchmark output file at {} could not be opened. Exiting.".format(output))
+            return 42
+    if base is None:
+        return 0
+    lines = compare(results, base, threshold)
+    print("")
+    print("{} runs compared against {}, {} worse by more than {}%.".format(
+        sum(1 for record in results if key(record) in base), baseline, len(lines), threshold))
+    for line in lines:
+        print("  " + line)
+    return 43 if lines else 0
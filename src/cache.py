@@ -0,0 +1,138 @@
+import collections
+import hashlib
+import os
+import pickle
+
+# An on-disk cache: a directory holding one pickled value per file, named by
+# its key. Reading an entry marks it as recently used by touching its file,
+# and writing one evicts the least recently used entries until the whole
+# directory fits in its size limit again. Entries are written to a temporary
+# file first and moved into place, so a reader never sees half an entry, and
+# any entry which cannot be read is thrown away as if it had never been
+# written. The cache is only there to save time, so if the directory cannot
+# be written to, nothing is saved and nothing else goes wrong.
+#
+# Only point the cache at a directory you own: entries are unpickled, so
+# anyone who can write to it can run code as you.
+
+# Bumped whenever what is stored in the cache changes, so old entries are
+# never read back as new ones.
+VERSION = 6
+
+# Default size limit, in megabytes.
+LIMIT = 256
+
+# Default number of entries kept by an in-memory LRU.
+ENTRIES = 4096
+
+
+# The directory the cache is kept in if no other is given.
+def default_directory():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'tm')
+
+
+# Make a key from any number of strings or bytes.
+def make_key(*parts):
+    h = hashlib.sha256(str(VERSION).encode())
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8', 'surrogateescape')
+        # Each part is preceded by its length, so no two lists of parts give
+        # the same bytes to hash.
+        h.update(len(part).to_bytes(8, 'little'))
+        h.update(part)
+    return h.hexdigest()
+
+
+class Store:
+
+    # 'limit' is the most the directory may hold, in megabytes.
+    def __init__(self, directory, limit=LIMIT):
+        self.directory = directory
+        self.limit = int(limit * 1024 * 1024)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    # Return the value stored under the key, or None if there is none.
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            self.remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        path = self.path(key)
+        temp = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp, 'wb') as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, path)
+        except OSError:
+            self.remove(temp)
+            return
+        self.evict()
+
+    # Remove the least recently used entries until the directory fits in the
+    # size limit. An entry bigger than the limit on its own is removed too.
+    def evict(self):
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith('.pickle'):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, entry.path, st.st_size))
+                    total += st.st_size
+        except OSError:
+            return
+        entries.sort()
+        for mtime, path, size in entries:
+            if total <= self.limit:
+                break
+            self.remove(path)
+            total -= size
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# An in-memory cache with the same get and put as Store, holding at most
+# 'size' entries and dropping the least recently used.
+class LRU:
+
+    def __init__(self, size=ENTRIES):
+        self.size = size
+        self.entries = collections.OrderedDict()
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
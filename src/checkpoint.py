@@ -0,0 +1,173 @@
+import json
+import os
+import signal
+import sys
+import time
+from array import array
+from tape import ArrayTape, Tape
+
+# A checkpoint holds everything needed to carry on a computation: which
+# machine it is (by the hash of its file), its state, the number of steps
+# taken, the tape and where the head is on it. The file is a line naming the
+# format, a line of JSON with everything but the tape, and then the cells of
+# the tape exactly as the array tape holds them, from its left end, as raw
+# bytes. It can be written and read front to back in one pass, and the tape,
+# which is almost all of it, is copied straight out of and back into memory.
+MAGIC = b'TM CHECKPOINT 1\n'
+
+# How often the clock and Ctrl+C are looked at while checkpointing, in
+# seconds.
+POLL = 0.05
+
+
+class CheckpointError(Exception):
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+# Write a checkpoint of a machine to the given path. It is written to a
+# temporary file and moved into place, so the path always holds a whole
+# checkpoint, even if the program is killed while writing one.
+def save(machine, key, path):
+    temp = path + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(MAGIC)
+        write(f, machine, key)
+    os.replace(temp, path)
+
+
+# Write the configuration of a machine to a binary file: the JSON line and
+# the cells which follow it.
+def write(f, machine, key):
+    tape = machine.curr_tape
+    if not isinstance(tape, ArrayTape):
+        tape = ArrayTape.from_linked(tape, machine.symbols, machine.symids)
+    cells = tape.cells[tape.left:]
+    head = tape.head - tape.left
+    # Blanks at the right end of the tape are left out.
+    if isinstance(cells, bytearray):
+        cells = cells[:max(len(cells.rstrip(b'\0')), head + 1)]
+    header = {'machine': key, 'state': machine.curr_state, 'steps': machine.numsteps, 'head': head,
+              'symbols': tape.symbols, 'width': width(cells), 'cells': len(cells), 'byteorder': sys.byteorder}
+    f.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n')
+    f.write(cells)
+
+
+# Number of bytes each cell of a tape buffer takes.
+def width(cells):
+    return 1 if isinstance(cells, bytearray) else cells.itemsize
+
+
+# Put a machine in the configuration saved at the given path. The machine
+# must have been built from the file with the given key.
+def load(machine, key, path):
+    try:
+        with open(path, 'rb') as f:
+            if f.readline() != MAGIC:
+                raise ValueError
+            header, source = read(f)
+    except (OSError, ValueError):
+        raise CheckpointError("Checkpoint file at {} could not be read. Exiting.".format(path), 30)
+    if header['machine'] != key or header['state'] not in machine.stateids:
+        raise CheckpointError("Checkpoint at {} was not taken of this machine. Exiting.".format(path), 31)
+    restore(machine, header, source)
+
+
+# Read a configuration written by write() from a binary file, returning its
+# JSON header and its cells. Raises ValueError if it is not whole and sound.
+def read(f):
+    try:
+        header = json.loads(f.readline().decode('utf-8'))
+        if not isinstance(header, dict):
+            raise ValueError
+        size = header['width']
+        data = f.read(header['cells'] * size)
+        if size == 1:
+            source = bytearray(data)
+        else:
+            source = array('H' if size == 2 else 'L')
+            if source.itemsize != size or len(data) % size:
+                raise ValueError
+            source.frombytes(data)
+            if header['byteorder'] != sys.byteorder:
+                source.byteswap()
+        # Every cell must hold one of the checkpoint's symbols. Deleting all
+        # the valid bytes of a byte buffer leaves nothing, which is much
+        # faster to find out than its largest cell.
+        nsym = len(header['symbols'])
+        if size == 1:
+            invalid = source.translate(None, bytes(range(0, min(nsym, 256))))
+        else:
+            invalid = max(source, default=0) >= nsym
+        if len(source) != header['cells'] or not 0 <= header['head'] < len(source) or invalid \
+                or not isinstance(header['state'], str) or not isinstance(header['steps'], int) \
+                or not isinstance(header['machine'], str) \
+                or not all(isinstance(sym, str) for sym in header['symbols']):
+            raise ValueError
+        return header, source
+    except (KeyError, TypeError):
+        raise ValueError
+
+
+# Put a machine in a configuration read by read(). The state must be one of
+# the machine's.
+def restore(machine, header, source):
+    tape = ArrayTape(machine.B, machine.symbols, machine.symids)
+    # The symbols of the tape are given ids in the order the checkpoint has
+    # them in, which is almost always the order the machine has them in
+    # already, in which case the cells are used as they are.
+    ids = [tape.intern(sym) for sym in header['symbols']]
+    cells = ArrayTape.blanks(len(machine.symbols), 0)
+    if ids == list(range(0, len(ids))) and width(cells) == width(source):
+        cells = source
+    elif isinstance(cells, bytearray):
+        cells = source.translate(bytes(ids + [0] * (256 - len(ids))))
+    else:
+        cells.extend(ArrayTape.blanks(len(machine.symbols), len(source)))
+        for i in range(0, len(source)):
+            cells[i] = ids[source[i]]
+    tape.cells = cells
+    tape.head = header['head']
+    machine.curr_tape = tape.to_linked(Tape(machine.B, machine.B)) if machine.linked else tape
+    machine.curr_state = header['state']
+    machine.numsteps = header['steps']
+
+
+# Run a machine, writing a checkpoint to the given path every 'every'
+# seconds (or never, if it is 0), and once more if Ctrl+C is pressed before
+# exiting. If 'remove' is set, the checkpoint is removed once the machine
+# halts; a file the run was resumed from is left alone. Returns what run_tape
+# would have.
+def run_checkpointed(machine, key, path, every, remove=True):
+    interrupted = []
+    previous = signal.signal(signal.SIGINT, lambda signum, frame: interrupted.append(signum))
+    due = time.perf_counter() + every
+    failed = False
+    try:
+        while True:
+            out = machine.run(deadline=time.perf_counter() + POLL)
+            if out is not None:
+                break
+            now = time.perf_counter()
+            if interrupted or (every > 0 and now >= due):
+                try:
+                    save(machine, key, path)
+                except OSError:
+                    if not failed:
+                        print("Checkpoint file at {} could not be written.".format(path))
+                    failed = True
+                due = now + every
+            if interrupted:
+                print("Keyboard interrupt caught. Exiting.")
+                exit(130)
+    finally:
+        signal.signal(signal.SIGINT, previous)
+    if remove:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return out
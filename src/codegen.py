@@ -0,0 +1,166 @@
+from tape import ArrayTape
+import cache
+import tm
+
+# The generated engine turns a machine's compiled tables into the source of
+# a Python function written for that machine alone, and runs that instead of
+# looking each step up in the tables. The state is found by a binary search
+# of if statements, and the symbol read by a chain of them, each ending in
+# the transition's write, move and next state written out as constants, so
+# a step costs a few comparisons and no lookups at all. Writes of the symbol
+# already there are left out, and self-loops sweep across their whole run as
+# they do in the compiled engine. Anything which ends the run (a halting
+# transition, a missing one, or the step limit) leaves the function, and the
+# machine is handed to the compiled engine to halt, exactly as it would have.
+#
+# The source is kept with the machine's tables, so it is only written once
+# for each machine (and saved in the cache directory with them, if there is
+# one), and the function compiled from it is kept by its source.
+
+# Number of steps of a self-loop taken one at a time before sweeping across
+# the rest of its run.
+SHORT = 32
+
+# Functions compiled from generated source, by source.
+functions = cache.LRU(64)
+
+PREAMBLE = """\
+def run(cells, head, left, size, numsteps, limit, state, tape):
+    grow_r = tape.grow_r
+    grow_to = tape.grow_to
+    run_length = tape.run_length
+    fill = tape.fill
+    while numsteps != limit:
+        c = cells[head]
+"""
+
+
+# Write the source of the function running a machine from its compiled
+# tables. It takes the tape's buffer and bounds, the number of steps taken,
+# the step limit (or -1) and the state id, and returns the state id, head
+# and number of steps once the run leaves it.
+def generate(machine):
+    lines = [PREAMBLE]
+    emit_states(machine, lines, 0, len(machine.states), 2)
+    lines.append("    return state, head, numsteps\n")
+    return ''.join(lines)
+
+
+# Write the code for the states with ids in [lo, hi), splitting them in two
+# until only one is left.
+def emit_states(machine, lines, lo, hi, depth):
+    pad = '    ' * depth
+    if hi - lo == 1:
+        emit_state(machine, lines, lo, depth)
+        return
+    mid = (lo + hi) // 2
+    lines.append("{}if state < {}:\n".format(pad, mid))
+    emit_states(machine, lines, lo, mid, depth + 1)
+    lines.append("{}else:\n".format(pad))
+    emit_states(machine, lines, mid, hi, depth + 1)
+
+
+def emit_state(machine, lines, q, depth):
+    pad = '    ' * depth
+    nsym = machine.nsym
+    haltat = machine.stateids.get(machine.haltat)
+    lines.append("{}# {}\n".format(pad, machine.states[q]))
+    branch = 'if'
+    for c in range(0, nsym):
+        i = q * nsym + c
+        ns = machine.nexts[i]
+        if ns < 0 and ns != tm.SWEEP and ns != tm.HALTAT:
+            continue
+        write = machine.writes[i]
+        move = machine.moves[i]
+        target = q if ns == tm.SWEEP else haltat if ns == tm.HALTAT else ns
+        lines.append("{}{} c == {}:  # {} -> {} {} {}\n".format(
+            pad, branch, c, machine.symbols[c], machine.states[target], machine.symbols[write], 'R' if move > 0 else 'L'))
+        branch = 'elif'
+        body = pad + '    '
+        if ns == tm.SWEEP:
+            emit_sweep(lines, body, c, write, move)
+            continue
+        if write != c:
+            lines.append("{}cells[head] = {}\n".format(body, write))
+        if move > 0:
+            lines.append("{0}head += 1\n{0}if head == size:\n{0}    size = grow_r()\n".format(body))
+        else:
+            lines.append("{0}if head != left:\n{0}    head -= 1\n".format(body))
+        lines.append("{}numsteps += 1\n".format(body))
+        if ns == tm.HALTAT:
+            lines.append("{0}state = {1}\n{0}break\n".format(body, haltat))
+        else:
+            if ns != q:
+                lines.append("{}state = {}\n".format(body, ns))
+            lines.append("{}continue\n".format(body))
+    lines.append("{}break\n".format(pad))
+
+
+# A self-loop is taken a step at a time for its first SHORT steps, which is
+# as far as most go, and past that rewrites the rest of the run of cells
+# holding the symbol it reads at once, stopping early if the step limit
+# falls inside it, as in the compiled engine, which a sweep right over the
+# blanks past the end of the tape always reaches.
+def emit_sweep(lines, pad, c, write, move):
+    body = pad + '    '
+    lines.append("{}last = numsteps + {}\n".format(pad, SHORT))
+    lines.append("{}while True:\n".format(pad))
+    if write != c:
+        lines.append("{}cells[head] = {}\n".format(body, write))
+    if move > 0:
+        lines.append("{0}head += 1\n{0}if head == size:\n{0}    size = grow_r()\n".format(body))
+    else:
+        lines.append("{0}if head != left:\n{0}    head -= 1\n".format(body))
+    lines.append("{0}numsteps += 1\n{0}if numsteps == limit or cells[head] != {1}:\n{0}    break\n".format(body, c))
+    lines.append("{}if numsteps == last:\n".format(body))
+    pad = body + '    '
+    lines.append("{}n = run_length(head, {}, {})\n".format(pad, c, move))
+    if move > 0 and c == 0:
+        lines.append("{0}if head + n == size:\n{0}    if limit < 0:\n{0}        forever()\n"
+                     "{0}    n = limit - numsteps\n{0}    size = grow_to(head + n + 1)\n".format(pad))
+    lines.append("{0}if 0 <= limit - numsteps < n:\n{0}    n = limit - numsteps\n".format(pad))
+    if move > 0:
+        if write != c:
+            lines.append("{}fill(head, head + n, {})\n".format(pad, write))
+        lines.append("{0}head += n\n{0}if head == size:\n{0}    size = grow_r()\n".format(pad))
+    else:
+        if write != c:
+            lines.append("{}fill(head - n + 1, head + 1, {})\n".format(pad, write))
+        lines.append("{0}head -= n\n{0}if head < left:\n{0}    head = left\n".format(pad))
+    lines.append("{0}numsteps += n\n{0}break\n".format(pad))
+    lines.append("{}continue\n".format(body[:-4]))
+
+
+# The function compiled from generated source.
+def function(source):
+    run = functions.get(source)
+    if run is None:
+        namespace = {'forever': tm.forever}
+        exec(compile(source, '<generated>', 'exec'), namespace)
+        run = namespace['run']
+        functions.put(source, run)
+    return run
+
+
+# Run a machine with code generated for it, and return what run_tape would
+# have.
+def run_generated(machine):
+    original = machine.curr_tape
+    tape = original
+    if not isinstance(tape, ArrayTape):
+        tape = machine.curr_tape = ArrayTape.from_linked(tape, machine.symbols, machine.symids)
+    if machine.haltat != machine.compiled_haltat or len(machine.symbols) != machine.nsym:
+        machine.compile()
+    if machine.source is None:
+        machine.source = generate(machine)
+    run = function(machine.source)
+    if machine.curr_state != machine.haltat:
+        limit = machine.haltafter if machine.haltafter > 0 else -1
+        state, tape.head, machine.numsteps = run(tape.cells, tape.head, tape.left, len(tape.cells), machine.numsteps,
+                                                 limit, machine.stateids[machine.curr_state], tape)
+        machine.curr_state = machine.states[state]
+    out = machine.run_compiled()
+    if tape is not original:
+        machine.curr_tape = tape.to_linked(original)
+    return out
@@ -0,0 +1,144 @@
+from tape import ArrayTape
+import tm
+
+# Cycle detection runs the machine with the compiled tables while keeping a
+# fingerprint of its whole configuration: the state, the head position, and
+# a polynomial hash of the tape, sum(cell[i] * BASE**i) modulo a prime. The
+# blank is symbol 0, so blank cells add nothing and the hash does not depend
+# on how much of the tape has been allocated, and a step only changes the
+# one cell under the head, so the hash is updated in constant time.
+#
+# Brent's algorithm then finds a repeated configuration while only keeping
+# one saved configuration, taken again every time the number of steps since
+# the last one reaches the next power of two. Fingerprints are only used to
+# rule configurations out; a match is always checked against the saved tape
+# itself, so a hash collision can never be reported as a loop. A machine in
+# a repeated configuration is deterministic, so it runs forever.
+MOD = (1 << 61) - 1
+BASE = 0x2545F4914F6CDD1D % MOD
+INV = pow(BASE, MOD - 2, MOD)
+
+
+class Config:
+    __slots__ = ('state', 'cells', 'head', 'power', 'hash', 'steps')
+
+    # Take a configuration from a machine and its array tape, measuring the
+    # tape from its left end.
+    def __init__(self, machine, tape):
+        self.state = machine.stateids[machine.curr_state]
+        self.cells = tape.cells[tape.left:]
+        self.head = tape.head - tape.left
+        self.power = pow(BASE, self.head, MOD)
+        h = 0
+        for c in reversed(self.cells):
+            h = (h * BASE + c) % MOD
+        self.hash = h
+        self.steps = machine.numsteps
+
+    def copy(self):
+        other = Config.__new__(Config)
+        other.state = self.state
+        other.cells = self.cells[:]
+        other.head = self.head
+        other.power = self.power
+        other.hash = self.hash
+        other.steps = self.steps
+        return other
+
+    # Whether two configurations are the same, ignoring blanks at the right
+    # end of the tape.
+    def same(self, other):
+        if (self.state != other.state or self.head != other.head
+                or self.hash != other.hash):
+            return False
+        n = min(len(self.cells), len(other.cells))
+        if self.cells[:n] != other.cells[:n]:
+            return False
+        longer = self.cells if len(self.cells) > n else other.cells
+        return not any(longer[n:])
+
+    # Take one step with the compiled tables. Self-loops are ordinary steps
+    # here. Returns False, without stepping, if the machine would halt, fail
+    # or go past the step limit, all of which are left to the compiled engine.
+    def step(self, machine, limit):
+        if self.steps == limit:
+            return False
+        cells = self.cells
+        head = self.head
+        i = self.state * machine.nsym + cells[head]
+        ns = machine.nexts[i]
+        if ns < 0:
+            if ns != tm.SWEEP:
+                return False
+            ns = self.state
+        new = machine.writes[i]
+        if new != cells[head]:
+            self.hash = (self.hash + (new - cells[head]) * self.power) % MOD
+            cells[head] = new
+        if machine.moves[i] > 0:
+            self.head = head + 1
+            self.power = self.power * BASE % MOD
+            if self.head == len(cells):
+                cells.extend(ArrayTape.blanks(machine.nsym, len(cells)))
+        elif head > 0:
+            self.head = head - 1
+            self.power = self.power * INV % MOD
+        self.state = ns
+        self.steps += 1
+        return True
+
+    # Put the configuration back on the machine, with an array tape.
+    def restore(self, machine):
+        tape = ArrayTape(machine.B, machine.symbols, machine.symids)
+        tape.cells = self.cells
+        tape.head = self.head
+        machine.curr_tape = tape
+        machine.curr_state = machine.states[self.state]
+        machine.numsteps = self.steps
+
+
+# Run a machine on its current tape, looking for a configuration which
+# repeats. If there is one, the machine is left in the configuration where
+# the repeat was found, its last exit code is 4, and machine.cycle is set to
+# (μ, λ): the configuration after step μ is the first to come round again,
+# every λ steps. Otherwise the computation is finished by the compiled
+# engine, exactly as machine.run_tape() would have.
+def run_cycles(machine):
+    if machine.haltat != machine.compiled_haltat or len(machine.symbols) != machine.nsym:
+        machine.compile()
+    limit = machine.haltafter if machine.haltafter > 0 else -1
+    if machine.curr_state == machine.haltat or machine.numsteps == limit:
+        return machine.run_compiled()
+    tape = machine.curr_tape
+    if not isinstance(tape, ArrayTape):
+        tape = ArrayTape.from_linked(tape, machine.symbols, machine.symids)
+    start = Config(machine, tape)
+
+    config = start.copy()
+    saved = start.copy()
+    power = 1
+    while config.step(machine, limit):
+        if config.hash == saved.hash and config.same(saved):
+            break
+        if config.steps - saved.steps == power:
+            saved = config.copy()
+            power *= 2
+    else:
+        config.restore(machine)
+        return machine.run_compiled()
+    period = config.steps - saved.steps
+
+    # The first configuration to repeat is found by running two copies of
+    # the machine from the start, one period apart, until they meet.
+    slow = start.copy()
+    fast = start.copy()
+    for i in range(0, period):
+        fast.step(machine, -1)
+    while not (slow.hash == fast.hash and slow.same(fast)):
+        slow.step(machine, -1)
+        fast.step(machine, -1)
+
+    config.restore(machine)
+    machine.cycle = (slow.steps, period)
+    machine.lastexit = 4
+    return machine.loopstr
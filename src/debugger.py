@@ -0,0 +1,384 @@
+import signal
+from array import array
+from tape import ArrayTape
+from render import Renderer, Display
+import colors
+import tm
+
+# The step debugger, for --step. It shows the transition the machine is
+# about to take, as debug level 2 (or 1) does, and then waits for a command:
+# to step forwards or backwards, to run on to a breakpoint, or to jump to any
+# step of the run.
+#
+# Stepping forwards keeps an undo log of the transition taken and where the
+# head was, which is all it takes to step back: the transition gives the
+# state and the symbol read, which goes back into the cell the head was on.
+# Running on does not keep the log, since the machine is run by the compiled
+# engine at full speed. A snapshot of the configuration is taken first
+# instead, and a step from before it is reached again by going back to the
+# latest snapshot before that step and running forwards from there; the
+# machine is deterministic, so it comes out the same way every time.
+#
+# Breakpoints on states, symbols read and transitions are compiled into the
+# engine's table, as BREAK codes in a copy of it, so the engine checks them
+# for free as it runs, and breakpoints on step counts are its pause. Halting
+# transitions are made breakpoints too, so that running on always stops
+# short of the end, where it can still be stepped back from. Only
+# breakpoints on the position of the head are checked after every step, by a
+# slower loop used just while there are any.
+
+HELP = """Commands:
+  (enter) or s [N]   step forwards (N steps)
+  b [N]              step backwards (N steps)
+  c                  run on to the next breakpoint
+  j N                jump to step N
+  break state Q      break when the machine is in state Q
+  break read S       break when the head reads symbol S
+  break on Q S       break before the transition from state Q on symbol S
+  break head N       break when the head is at cell N (from 0)
+  break step N       break after step N
+  list               list breakpoints
+  delete [N]         delete breakpoint N, or all of them
+  q                  stop the machine here"""
+
+# Steps run by the compiled engine between looks at whether Ctrl+C has been
+# pressed.
+SLICE = 1 << 20
+
+# Number of steps logged when going back to a step, so that the steps just
+# before it can be stepped back to without running forwards again.
+UNDO = 1024
+
+
+class Breakpoint:
+    __slots__ = ('kind', 'args')
+
+    def __init__(self, kind, args):
+        self.kind = kind
+        self.args = args
+
+    def __str__(self):
+        return ' '.join([self.kind] + [str(arg) for arg in self.args])
+
+    # The entries of the compiled table it covers.
+    def entries(self, machine):
+        nsym = machine.nsym
+        if self.kind == 'state':
+            q = machine.stateids[self.args[0]]
+            return range(q * nsym, (q + 1) * nsym)
+        elif self.kind == 'read':
+            bit = machine.symids[self.args[0]]
+            return range(bit, len(machine.states) * nsym, nsym)
+        elif self.kind == 'on':
+            return [machine.stateids[self.args[0]] * nsym + machine.symids[self.args[1]]]
+        return []
+
+
+class Debugger:
+
+    def __init__(self, machine):
+        if machine.haltat != machine.compiled_haltat or len(machine.symbols) != machine.nsym:
+            machine.compile()
+        if machine.debug == 0:
+            machine.debug = 2
+        self.machine = machine
+        self.original = machine.curr_tape
+        tape = machine.curr_tape
+        if not isinstance(tape, ArrayTape):
+            tape = machine.curr_tape = ArrayTape.from_linked(tape, machine.symbols, machine.symids)
+        self.tape = tape
+        self.renderer = Renderer(machine.B, machine.ΓsubΣ, machine.debug, machine.langlen)
+        self.display = Display(0, False, 0)
+        # The undo log holds a transition index and a head position for each
+        # step taken since the last snapshot was restored or run on from.
+        self.undo = array('q')
+        self.snapshots = []
+        self.snapshot()
+        self.breakpoints = []
+        self.interrupted = False
+
+    # Save the configuration as it is now, unless it already has been.
+    def snapshot(self):
+        m = self.machine
+        tape = self.tape
+        for snapshot in self.snapshots:
+            if snapshot[0] == m.numsteps:
+                return
+        self.snapshots.append((m.numsteps, m.curr_state, tape.cells[tape.left:], tape.head - tape.left))
+        self.snapshots.sort(key=lambda snapshot: snapshot[0])
+
+    def restore(self, snapshot):
+        m = self.machine
+        m.numsteps, m.curr_state, cells, head = snapshot
+        self.tape.cells = cells[:]
+        self.tape.left = 0
+        self.tape.head = head
+        del self.undo[:]
+
+    # The table index of the transition the machine is about to take.
+    def index(self):
+        m = self.machine
+        return m.stateids[m.curr_state] * m.nsym + self.tape.cells[self.tape.head]
+
+    # Whether the machine stops before taking another step: it is in the
+    # state to halt at, at the step limit, or about to halt or fail.
+    def halting(self):
+        m = self.machine
+        if m.curr_state == m.haltat or m.numsteps == m.haltafter > 0:
+            return True
+        ns = m.nexts[self.index()]
+        return ns < 0 and ns != tm.SWEEP and ns != tm.HALTAT
+
+    # Take one step, logging it. Returns False if the machine stops instead.
+    def step(self):
+        if self.halting():
+            return False
+        m = self.machine
+        tape = self.tape
+        i = self.index()
+        ns = m.nexts[i]
+        if ns == tm.SWEEP:
+            ns = i // m.nsym
+        elif ns == tm.HALTAT:
+            ns = m.stateids[m.haltat]
+        self.undo.append(i)
+        self.undo.append(tape.head)
+        tape.cells[tape.head] = m.writes[i]
+        tape.head += m.moves[i]
+        if tape.head < tape.left:
+            tape.head = tape.left
+        elif tape.head == len(tape.cells):
+            tape.grow_r()
+        m.curr_state = m.states[ns]
+        m.numsteps += 1
+        return True
+
+    # Take back one step. Returns False at the start of the run.
+    def back(self):
+        m = self.machine
+        if not self.undo:
+            if m.numsteps == self.snapshots[0][0]:
+                return False
+            self.jump(m.numsteps - 1)
+            return True
+        head = self.undo.pop()
+        i = self.undo.pop()
+        self.tape.cells[head] = i % m.nsym
+        self.tape.head = head
+        m.curr_state = m.states[i // m.nsym]
+        m.numsteps -= 1
+        return True
+
+    # Go to the given step, ignoring breakpoints, or as near to it as the
+    # machine gets before it stops.
+    def jump(self, target):
+        m = self.machine
+        if target < m.numsteps:
+            if m.numsteps - target <= len(self.undo) // 2:
+                while m.numsteps > target:
+                    self.back()
+                return
+            # Going a long way back, this is saved first so that coming back
+            # here is just as quick.
+            if m.numsteps - target > UNDO:
+                self.snapshot()
+            earlier = [s for s in self.snapshots if s[0] <= target] or self.snapshots[:1]
+            self.restore(earlier[-1])
+            # The last few steps are logged, so the steps just before the
+            # target can be stepped back to straight away.
+            self.advance(max(m.numsteps, target - UNDO), False)
+            while m.numsteps < target and self.step():
+                pass
+            return
+        later = [s for s in self.snapshots if m.numsteps < s[0] <= target]
+        if later:
+            self.restore(later[-1])
+        self.advance(target, False)
+
+    # The compiled table with every halting entry, and every entry covered by
+    # a breakpoint if 'breaks' is set, replaced by BREAK.
+    def table(self, breaks):
+        m = self.machine
+        nexts = [tm.BREAK if ns < 0 and ns != tm.SWEEP else ns for ns in m.nexts]
+        if breaks:
+            for bp in self.breakpoints:
+                for i in bp.entries(m):
+                    nexts[i] = tm.BREAK
+        return nexts
+
+    # Run on until the given step (or with no end, if it is -1), stopping
+    # short of halting, and at breakpoints if 'breaks' is set. Ctrl+C stops
+    # it where it is.
+    def advance(self, target, breaks):
+        m = self.machine
+        if m.haltafter > 0 and (target < 0 or target > m.haltafter):
+            target = m.haltafter
+        if self.halting() or m.numsteps == target:
+            return
+        self.snapshot()
+        del self.undo[:]
+        nexts = self.table(breaks)
+        heads = set(bp.args[0] for bp in self.breakpoints if bp.kind == 'head') if breaks else set()
+        self.interrupted = False
+        previous = signal.signal(signal.SIGINT, self.interrupt)
+        saved = m.nexts, m.haltafter
+        try:
+            if heads:
+                while m.numsteps != target and not self.interrupted:
+                    if nexts[self.index()] == tm.BREAK:
+                        break
+                    self.step()
+                    if self.tape.head - self.tape.left in heads:
+                        break
+                del self.undo[:]
+            else:
+                # The engine stops at the breakpoints in the table, or at the
+                # target step as its pause.
+                m.nexts, m.haltafter = nexts, 0
+                while m.numsteps != target and not self.interrupted:
+                    pause = m.numsteps + SLICE
+                    if 0 <= target < pause:
+                        pause = target
+                    m.run_compiled(pause)
+                    if m.numsteps != pause:
+                        break
+        finally:
+            m.nexts, m.haltafter = saved
+            signal.signal(signal.SIGINT, previous)
+        # A transition into the state to halt at is taken, so the machine is
+        # shown sitting in that state.
+        if m.numsteps != target and m.nexts[self.index()] == tm.HALTAT and m.curr_state != m.haltat:
+            if not (breaks and any(self.index() in bp.entries(m) for bp in self.breakpoints)):
+                self.step()
+
+    def interrupt(self, signum, frame):
+        self.interrupted = True
+
+    # The first breakpoint the machine is at, or None.
+    def hit(self):
+        m = self.machine
+        for n, bp in enumerate(self.breakpoints):
+            if (bp.kind == 'step' and bp.args[0] == m.numsteps
+                    or bp.kind == 'head' and bp.args[0] == self.tape.head - self.tape.left
+                    or self.index() in bp.entries(m)):
+                return n
+        return None
+
+    # Run on to the next breakpoint, and say which one stopped the machine.
+    def proceed(self):
+        m = self.machine
+        # Take the step off the breakpoint the machine may be sitting on.
+        if not self.step():
+            return
+        if self.hit() is None:
+            steps = [bp.args[0] for bp in self.breakpoints if bp.kind == 'step' and bp.args[0] > m.numsteps]
+            self.advance(min(steps) if steps else -1, True)
+            if self.interrupted:
+                print("Interrupted.")
+                return
+        n = self.hit()
+        if n is not None:
+            print("Breakpoint {}: {}".format(n, self.breakpoints[n]))
+
+    # Show the transition the machine is about to take.
+    def show(self):
+        m = self.machine
+        print(colors.state_text + "Step {}".format(m.numsteps) + colors.default)
+        bit = m.symbols[self.tape.cells[self.tape.head]]
+        move = m.δ.get(m.curr_state + ' ' + bit)
+        if move is None or m.curr_state == m.haltat or m.numsteps == m.haltafter > 0:
+            self.display.show(self.renderer.frame(self.tape) + ('\n' if m.debug == 2 else ''))
+            if m.curr_state == m.haltat:
+                print("Halting in state {}.".format(m.curr_state))
+            elif move is not None:
+                print("Halting after {} steps.".format(m.numsteps))
+            else:
+                print("No valid transition function found from state {} on input {}".format(m.curr_state, bit))
+            return
+        m.draw((bit,) + move, self.renderer, self.display)
+
+    # Add a breakpoint from the words of a break command.
+    def add(self, words):
+        m = self.machine
+        kinds = {'state': 1, 'read': 1, 'on': 2, 'head': 1, 'step': 1}
+        if not words or words[0] not in kinds or len(words) != kinds[words[0]] + 1:
+            print("Give a breakpoint as 'state Q', 'read S', 'on Q S', 'head N' or 'step N'.")
+            return
+        kind, args = words[0], words[1:]
+        if kind in ('state', 'on') and args[0] not in m.stateids:
+            print("State '{}' not found in Q.".format(args[0]))
+            return
+        if kind in ('read', 'on') and args[-1] not in m.symids:
+            print("Symbol '{}' not found in the tape alphabet.".format(args[-1]))
+            return
+        if kind in ('head', 'step'):
+            if not args[0].isdigit():
+                print("'{}' is not a number.".format(args[0]))
+                return
+            args = [int(args[0])]
+        self.breakpoints.append(Breakpoint(kind, args))
+        print("Breakpoint {}: {}".format(len(self.breakpoints) - 1, self.breakpoints[-1]))
+
+    # Read and carry out commands until the machine is stepped past its end,
+    # or stopped. Returns what run_tape would have.
+    def run(self):
+        m = self.machine
+        self.show()
+        while True:
+            try:
+                words = input(colors.state_text + "> " + colors.default).split()
+            except EOFError:
+                words = ['q']
+            command = words[0] if words else 's'
+            count = int(words[1]) if len(words) == 2 and words[1].isdigit() else 1
+            if command == 's' or command == 'c':
+                if self.halting():
+                    break
+                if command == 's':
+                    for n in range(0, count):
+                        if not self.step():
+                            break
+                else:
+                    self.proceed()
+            elif command == 'b':
+                start = self.snapshots[0][0]
+                if m.numsteps - count < start:
+                    print("This is the start of the run.")
+                self.jump(max(start, m.numsteps - count))
+            elif command == 'j' and len(words) == 2 and words[1].isdigit():
+                self.jump(int(words[1]))
+            elif command == 'break':
+                self.add(words[1:])
+                continue
+            elif command == 'list':
+                for n, bp in enumerate(self.breakpoints):
+                    print("Breakpoint {}: {}".format(n, bp))
+                continue
+            elif command == 'delete':
+                if len(words) == 1:
+                    self.breakpoints = []
+                elif words[1].isdigit() and int(words[1]) < len(self.breakpoints):
+                    del self.breakpoints[int(words[1])]
+                else:
+                    print("No breakpoint {}.".format(words[1]))
+                continue
+            elif command == 'q':
+                break
+            else:
+                print(HELP)
+                continue
+            self.show()
+        if command == 'q':
+            m.lastexit = 2
+            print()
+            out = m.halstr
+        else:
+            out = m.run_compiled()
+        if self.original is not self.tape:
+            m.curr_tape = self.tape.to_linked(self.original)
+        return out
+
+
+# Debug a machine on its current tape, as described above.
+def run_debugger(machine):
+    return Debugger(machine).run()
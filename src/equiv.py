@@ -0,0 +1,222 @@
+import contextlib
+import io
+import multiprocessing
+import os
+from array import array
+import batch
+import cycle
+import sweep
+
+# Two machines meant to decide the same language, such as a rewrite of one
+# to take fewer steps, are compared by running both on the inputs of a
+# sweep: every string over their input alphabet up to a length, sampling the
+# longer lengths as sweep does. The inputs are shared out over a pool of
+# worker processes just as in a sweep, each worker building both machines
+# once. The first input on which the machines give different verdicts (or,
+# if asked, accept or reject with different tapes) stops the comparison.
+# Inputs are run shortest first, so it is as short as any which was found,
+# but one from a sampled length may be longer than it needs to be, so it is
+# then shrunk by deleting symbols from it and replacing symbols with earlier
+# ones in the alphabet for as long as the machines still disagree.
+#
+# Whether or not they disagree, the steps each machine took are compared
+# for each length, so a rewrite which is slower shows up as well.
+
+WORDS = {'A': 'accepts', 'R': 'rejects', 'H': 'aborts', 'L': 'loops', 'E': 'stops with an error'}
+
+# The machines each worker process runs, set up once by init_worker.
+worker_machines = None
+worker_alphabet = None
+worker_cycles = False
+worker_tapes = False
+
+
+def init_worker(machines, alphabet, cycles, tapes):
+    global worker_machines, worker_alphabet, worker_cycles, worker_tapes
+    worker_machines = machines
+    worker_alphabet = alphabet
+    worker_cycles = cycles
+    worker_tapes = tapes
+
+
+# The symbols left on a machine's first tape, with the blanks at either end
+# left out and any others written as None, so that machines with different
+# blanks can be compared.
+def contents(machine):
+    syms = machine.get_result()[4]
+    if machine.tapes > 1:
+        syms = syms[0]
+    start = 0
+    end = len(syms)
+    while start < end and syms[start] == machine.B:
+        start += 1
+    while end > start and syms[end - 1] == machine.B:
+        end -= 1
+    return [None if sym == machine.B else sym for sym in syms[start:end]]
+
+
+# Run a machine on an input, and return the letter for its verdict, the steps
+# it took and, if asked for, what it left on its tape.
+def run(machine, tape, cycles, tapes):
+    try:
+        machine.reset()
+        machine.cycle = None
+        machine.add_tape(tape)
+        if cycles:
+            cycle.run_cycles(machine)
+        else:
+            machine.run_tape()
+    except SystemExit:
+        return sweep.LETTERS['error'], machine.numsteps, None
+    letter = sweep.LETTERS[batch.VERDICTS.get(machine.get_last_exit(), 'error')]
+    return letter, machine.numsteps, contents(machine) if tapes else None
+
+
+# Whether the runs of two machines on the same input disagree. Tapes are
+# only compared when both machines accept or both reject.
+def differ(first, second):
+    if first[0] != second[0]:
+        return True
+    return first[0] in 'AR' and first[2] != second[2]
+
+
+# Run the worker's machines on the inputs of one length with the given
+# numbers, stopping at the first on which they disagree. Returns the length,
+# the steps each machine took on each input, and the number of the input
+# they disagree on, or None.
+def run_inputs(job):
+    length, indices = job
+    first, second = worker_machines
+    steps = (array('q'), array('q'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        for index in indices:
+            tape = sweep.nth(worker_alphabet, length, index)
+            a = run(first, tape, worker_cycles, worker_tapes)
+            b = run(second, tape, worker_cycles, worker_tapes)
+            steps[0].append(a[1])
+            steps[1].append(b[1])
+            if differ(a, b):
+                return length, steps, index
+    return length, steps, None
+
+
+# Make an input the machines disagree on as short, and then as early in the
+# alphabet, as can be found: take out runs of symbols, halving their length
+# down to one, and lower each symbol in turn, keeping every change after
+# which the machines still disagree, until no change is kept.
+def shrink(machines, alphabet, tape, cycles, tapes):
+    def disagree(candidate):
+        return differ(*(run(machine, candidate, cycles, tapes) for machine in machines))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        changed = True
+        while changed:
+            changed = False
+            size = max(len(tape) // 2, 1)
+            while size >= 1 and tape:
+                i = 0
+                while i + size <= len(tape):
+                    candidate = tape[:i] + tape[i + size:]
+                    if disagree(candidate):
+                        tape = candidate
+                        changed = True
+                    else:
+                        i += 1
+                size //= 2
+            for i in range(0, len(tape)):
+                for sym in alphabet[:alphabet.index(tape[i])]:
+                    candidate = tape[:i] + sym + tape[i + 1:]
+                    if disagree(candidate):
+                        tape = candidate
+                        changed = True
+                        break
+    return tape
+
+
+def describe(path, result, blank):
+    text = "{} {} after {} step{}".format(path, WORDS[result[0]], result[1], '' if result[1] == 1 else 's')
+    if result[2] is not None:
+        text += ", leaving '{}'".format(' '.join(blank if sym is None else sym for sym in result[2]))
+    return text
+
+
+# Run two machines on every input up to 'length' symbols long (sampling
+# 'sample' inputs of any length with more) with the given number of worker
+# processes, stopping each after its haltafter steps, or sweep.LIMIT if it
+# has no limit. The steps each took on the inputs of each length are
+# printed, and the first input they disagree on, shrunk, if there is one.
+# The machines are named by the paths of their files. Returns the exit code
+# for the program.
+def run_diff(machines, paths, length, workers, sample=sweep.SAMPLE, cycles=False, tapes=False):
+    alphabet = []
+    for machine in machines:
+        alphabet += [c for c in machine.Σ if len(c) == 1 and c not in alphabet]
+        if machine.haltafter <= 0:
+            machine.haltafter = sweep.LIMIT
+    sample = max(sample, 1)
+    sampled = set()
+    jobs = []
+    for n in range(0, max(length, 0) + 1):
+        inputs = sweep.numbers(len(alphabet), n, sample)
+        if isinstance(inputs, list):
+            sampled.add(n)
+        for i in range(0, len(inputs), sweep.CHUNK):
+            jobs.append((n, inputs[i:i + sweep.CHUNK]))
+    if workers is None or workers < 1:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+
+    steps = {}
+    found = None
+    if workers == 1:
+        init_worker(machines, alphabet, cycles, tapes)
+        results = map(run_inputs, jobs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers, init_worker, (machines, alphabet, cycles, tapes))
+        results = pool.imap(run_inputs, jobs)
+    try:
+        for n, (first, second), index in results:
+            if n not in steps:
+                steps[n] = (array('q'), array('q'))
+            steps[n][0].extend(first)
+            steps[n][1].extend(second)
+            if index is not None:
+                found = sweep.nth(alphabet, n, index)
+                break
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    print("First:  {}".format(paths[0]))
+    print("Second: {}".format(paths[1]))
+    print("")
+    print("{:>6} {:>9} {:>11} {:>11} {:>8} {:>11} {:>11} {:>8} {:>10}".format(
+        'length', 'inputs', 'mean first', 'mean second', 'ratio', 'max first', 'max second', 'ratio',
+        'worst'))
+    for n in sorted(steps):
+        first, second = steps[n]
+        mean = (sum(first) / len(first), sum(second) / len(second))
+        top = (max(first), max(second))
+        ratios = [b / a for a, b in zip(first, second) if a > 0]
+        print("{:>6} {:>9} {:>11.1f} {:>11.1f} {:>8} {:>11} {:>11} {:>8} {:>10}".format(
+            str(n) + ('*' if n in sampled else ''), len(first), mean[0], mean[1],
+            '{:.3f}'.format(mean[1] / mean[0]) if mean[0] > 0 else '-', top[0], top[1],
+            '{:.3f}'.format(top[1] / top[0]) if top[0] > 0 else '-',
+            '{:.3f}'.format(max(ratios)) if ratios else '-'))
+    if sampled:
+        print("* sampled, {} inputs of each.".format(sample))
+    print("")
+
+    if found is None:
+        print("The machines agree on every input run.")
+        return 0
+    shrunk = shrink(machines, alphabet, found, cycles, tapes)
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [run(machine, shrunk, cycles, tapes) for machine in machines]
+    print("The machines disagree on '{}'{}.".format(
+        found, ", which shrinks to '{}'".format(shrunk) if shrunk != found else ''))
+    for path, result in zip(paths, results):
+        print(describe(path, result, machines[0].B))
+    return 47
@@ -0,0 +1,135 @@
+import contextlib
+import io
+import time
+import tm
+from tape import ArrayTape
+
+# NumPy is only needed for lockstep mode, so the rest of the program runs
+# without it.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Lockstep simulation runs many tapes of the same machine at once. The tapes
+# are the rows of one 2-D array of symbol ids, with a head position and state
+# per row, and every step of every row is done by a handful of whole-array
+# operations on the machine's compiled transition table. A row is retired as
+# soon as its machine halts, and the rest carry on without it. Since every
+# row starts together and takes one step at a time, all rows still running
+# have taken the same number of steps.
+
+
+# Once this few rows are left running, the per-step cost of the array
+# operations outweighs running each row on its own with the compiled engine.
+STRAGGLERS = 64
+
+
+# Run the machine over each tape string from its start state, and return one
+# (exit code, steps, final state, seconds) tuple per tape, matching what
+# machine.run_tape() would have given for that tape on its own. Tapes with
+# symbols outside the input alphabet get exit code 32 without being run.
+def run_lockstep(machine, tapes):
+    if machine.haltat != machine.compiled_haltat or len(machine.symbols) != machine.nsym:
+        machine.compile()
+    nsym = machine.nsym
+    start = time.perf_counter()
+    allowed = set(machine.Σ)
+    allowed.add(machine.B)
+    rows = [r for r in range(0, len(tapes)) if set(tapes[r]) <= allowed]
+    codes = numpy.full(len(tapes), 32, dtype=numpy.int64)
+    steps = numpy.zeros(len(tapes), dtype=numpy.int64)
+    finals = numpy.full(len(tapes), machine.stateids[machine.q_0], dtype=numpy.int64)
+    times = numpy.zeros(len(tapes))
+
+    # Lay the tapes out as rows of symbol ids, padded with blanks.
+    width = max([len(tapes[r]) for r in rows] + [0]) + 1
+    if nsym <= 256:
+        dtype = numpy.uint8
+        table = {ord(c): chr(i) for c, i in machine.symids.items() if len(c) == 1}
+        blob = ''.join(tapes[r].translate(table).ljust(width, '\0') for r in rows)
+        cells = numpy.frombuffer(blob.encode('latin-1'), dtype=dtype).reshape(len(rows), width).copy()
+    else:
+        dtype = numpy.uint32
+        cells = numpy.zeros((len(rows), width), dtype=dtype)
+        for j in range(0, len(rows)):
+            cells[j, :len(tapes[rows[j]])] = [machine.symids[c] for c in tapes[rows[j]]]
+
+    # Self-loops are just ordinary transitions here. Halting codes are
+    # looked up in 'ends' by their negation.
+    nexts = numpy.array(machine.nexts, dtype=numpy.int64)
+    sweep = nexts == tm.SWEEP
+    nexts[sweep] = (numpy.arange(len(nexts)) // nsym)[sweep]
+    writes = numpy.array(machine.writes, dtype=dtype)
+    moves = numpy.array(machine.moves, dtype=numpy.int64)
+    ends = numpy.array([0, 1, 34, 0, 1, 36, 2, 0], dtype=numpy.int64)
+    accept = machine.stateids[machine.q_a]
+    reject = machine.stateids[machine.q_r]
+    haltat = machine.stateids.get(machine.haltat, 0)
+
+    limit = machine.haltafter if machine.haltafter > 0 else -1
+    if machine.q_0 == machine.haltat:
+        limit = 0
+    rows = numpy.array(rows, dtype=numpy.int64)
+    # Active rows of 'cells', and the head and state of each of them.
+    act = numpy.arange(len(rows))
+    heads = numpy.zeros(len(rows), dtype=numpy.int64)
+    states = finals[rows]
+    t = 0
+
+    while act.size > STRAGGLERS and t != limit:
+        i = states * nsym + cells[act, heads]
+        ns = nexts[i]
+        special = ns < 0
+        if special.any():
+            done = rows[act[special]]
+            code = ns[special]
+            codes[done] = ends[-code]
+            steps[done] = t + (code == tm.HALTAT)
+            finals[done] = numpy.where(code == tm.ACCEPT, accept,
+                           numpy.where(code == tm.REJECT, reject,
+                           numpy.where(code == tm.HALTAT, haltat, states[special])))
+            times[done] = time.perf_counter() - start
+            keep = ~special
+            act = act[keep]
+            heads = heads[keep]
+            i = i[keep]
+            ns = ns[keep]
+
+        cells[act, heads] = writes[i]
+        heads += moves[i]
+        numpy.maximum(heads, 0, out=heads)
+        states = ns
+        t += 1
+        if heads.size and heads.max() == width:
+            cells = numpy.concatenate([cells, numpy.zeros_like(cells)], axis=1)
+            width *= 2
+
+    # Whatever is left either hit the step limit, or is finished one row at a
+    # time by the compiled engine.
+    for j in range(0, act.size):
+        r = rows[act[j]]
+        if t == limit:
+            codes[r] = 2
+            steps[r] = t
+            finals[r] = states[j]
+        else:
+            tape = ArrayTape(machine.B, machine.symbols, machine.symids)
+            tape.cells = ArrayTape.blanks(nsym, 0)
+            tape.cells.extend(cells[act[j]].tolist())
+            tape.head = int(heads[j])
+            machine.curr_tape = tape
+            machine.curr_state = machine.states[states[j]]
+            machine.numsteps = t
+            with contextlib.redirect_stdout(io.StringIO()):
+                try:
+                    machine.run_compiled()
+                    codes[r] = machine.get_last_exit()
+                except SystemExit as e:
+                    codes[r] = e.code
+            steps[r] = machine.numsteps
+            finals[r] = machine.stateids[machine.curr_state]
+        times[r] = time.perf_counter() - start
+
+    return [(c, n, machine.states[q], s) for c, n, q, s in
+            zip(codes.tolist(), steps.tolist(), finals.tolist(), times.tolist())]
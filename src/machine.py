@@ -0,0 +1,265 @@
+import io
+import cache
+import codegen
+import multitape
+import tm
+
+# Loading a machine file. This is what the command line program uses to read
+# its machine, and can be used on its own to load machines in-process:
+#
+#     from machine import load_machine
+#     m = load_machine('examples/0n1n.txt').build()
+#     m.add_tape('0011')
+#     m.run_tape()
+#
+# Errors are raised as MachineError (or one of its subclasses below) rather
+# than exiting, carrying the exit code the command line program uses for
+# them and the number of the line in the file they were found on.
+
+
+class MachineError(Exception):
+
+    def __init__(self, message, code, line=None):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.line = line
+
+
+# The machine file does not exist.
+class MachineFileError(MachineError):
+    pass
+
+
+# One of the fields before DELTA is missing.
+class MissingFieldError(MachineError):
+    pass
+
+
+# A line of DELTA is not a valid transition.
+class DeltaError(MachineError):
+    pass
+
+
+# A state or symbol is not ASCII, when only ASCII was allowed.
+class AsciiError(MachineError):
+    pass
+
+
+# The number of tapes given by TAPES is not a positive whole number.
+class TapesError(MachineError):
+    pass
+
+
+# A machine as read from its file: its name, blank, and the 7-tuple. Q, Σ
+# and Γ are Python lists. δ is a dictionary indexed by the string
+# "state current_bit", i.e. the name of the state, a single space, and the
+# current bit the tape head is reading. Once compiled, it also keeps the
+# tables a TM works out from it (see tm.TABLES), which are handed to every TM
+# it builds, along with the source of its generated engine. The key is a
+# hash of the text the machine was read from.
+#
+# A machine with k tapes (see multitape.py) reads, writes and moves k
+# symbols at once, and the symbols read, the symbols to write and the
+# directions to move are each kept in δ as k separated by spaces.
+#
+# A key given more than once in DELTA is a nondeterministic choice. δ keeps
+# the last transition given for it, which is what every engine but ntm runs,
+# and choices maps the key to all of them, in the order given.
+class Definition:
+    __slots__ = ('name', 'B', 'Q', 'Σ', 'Γ', 'q_0', 'q_a', 'q_r', 'δ', 'choices', 'tapes', 'tables', 'key')
+
+    def __init__(self, name, B, Q, Σ, Γ, q_0, q_a, q_r, δ, choices=None, tapes=1):
+        self.name = name
+        self.B = B
+        self.Q = Q
+        self.Σ = Σ
+        self.Γ = Γ
+        self.q_0 = q_0
+        self.q_a = q_a
+        self.q_r = q_r
+        self.δ = δ
+        self.choices = choices if choices is not None else {}
+        self.tapes = tapes
+        self.tables = None
+        self.key = None
+
+    def compile(self):
+        machine = self.build()
+        if self.tapes == 1:
+            machine.source = codegen.generate(machine)
+        self.tables = machine.get_tables()
+
+    # Create a Turing machine to run this definition, with the same options
+    # as tm.TM. Machines with more than one tape are multitape.MultiTMs.
+    def build(self, debug=0, tflag=0, haltafter=0, haltat=None, step=False, reference=False, linked=False, fps=0):
+        if self.tapes > 1:
+            return multitape.MultiTM(self.tapes, debug, tflag, haltafter, haltat, step, self.name, self.B,
+                                     self.Q, self.Σ, self.Γ, self.q_0, self.q_a, self.q_r, self.δ,
+                                     reference, linked, fps, self.tables)
+        return tm.TM(debug, tflag, haltafter, haltat, step, self.name, self.B,
+                     self.Q, self.Σ, self.Γ, self.q_0, self.q_a, self.q_r, self.δ,
+                     reference, linked, fps, self.tables)
+
+
+FIELDS = [("NAME:", 14), ("STATE:", 15), ("SIGMA:", 16), ("GAMMA:", 17),
+          ("START:", 18), ("ACCEPT:", 19), ("REJECT:", 20)]
+
+
+# Load a machine from the path to its file, or from the text of the file
+# itself (anything with a newline in it is taken to be text). If 'ascii' is
+# set, states and symbols must be ASCII. Given a cache.Store, the compiled
+# definition is looked up there by the contents of the file, and saved there
+# if it is not found, so that a machine is only ever parsed and compiled once.
+def load_machine(path_or_text, ascii=False, store=None):
+    if '\n' in path_or_text:
+        data = path_or_text
+    else:
+        try:
+            with open(path_or_text, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise MachineFileError("Machine file at {} not found. Exiting.".format(path_or_text), 11)
+
+    key = cache.make_key('machine', data, 'ascii' if ascii else '')
+    if store is not None:
+        definition = store.get(key)
+        if isinstance(definition, Definition):
+            definition.key = key
+            return definition
+
+    # Decode the file just as opening it as text would have.
+    text = data if isinstance(data, str) else io.TextIOWrapper(io.BytesIO(data)).read()
+    definition = parse_machine(text, ascii)
+    definition.key = key
+    if store is not None:
+        definition.compile()
+        store.put(key, definition)
+    return definition
+
+
+# Check that every character of the given states or symbols is ASCII.
+def check_ascii(names, message, code, lineno):
+    for name in names:
+        if any(ord(char) >= 128 for char in name):
+            raise AsciiError(message.format(name), code, lineno)
+
+
+# Parse the text of a machine file.
+def parse_machine(text, ascii=False):
+    B = 'B'
+    name = ""
+    Q = []
+    Σ = []
+    Γ = []
+    q_0 = ""
+    q_a = ""
+    q_r = ""
+    δ = {}
+    choices = {}
+    tapes = 1
+    states = set()
+
+    # Keep track of which of the keywords (GAMMA, SIGMA, etc.) we have encountered
+    encountered = set()
+
+    lines = text.split('\n')
+    lineno = 0
+    for line in lines:
+        lineno += 1
+        # Ignore comments and die when 'END' is found.
+        if line.startswith(';') or line == "":
+            continue
+        if line.startswith("END"):
+            return Definition(name, B, Q, Σ, Γ, q_0, q_a, q_r, δ, choices, tapes)
+        elif line.startswith("NAME"):
+            name = line.replace("NAME:", "").strip()
+            encountered.add("NAME:")
+
+        elif line.startswith("STATE:"):
+            Q = line.replace("STATE:", "").split()
+            states = set(Q)
+            encountered.add("STATE:")
+            if ascii:
+                check_ascii(Q, "State '{}' read in DELTA contains non-ASCII character.", 23, lineno)
+
+        elif line.startswith("SIGMA:"):
+            Σ = line.replace("SIGMA:", "").split()
+            encountered.add("SIGMA:")
+            if ascii:
+                check_ascii(Σ, "Symbol '{}' read in SIGMA contains non-ASCII character.", 24, lineno)
+
+        elif line.startswith("GAMMA:"):
+            Γ = line.replace("GAMMA:", "").split()
+            encountered.add("GAMMA:")
+            if ascii:
+                check_ascii(Γ, "Symbol '{}' read in GAMMA contains non-ASCII character.", 25, lineno)
+
+        elif line.startswith("START:"):
+            q_0 = line.replace("START:", "").strip()
+            encountered.add("START:")
+
+        elif line.startswith("ACCEPT:"):
+            q_a = line.replace("ACCEPT:", "").strip()
+            encountered.add("ACCEPT:")
+
+        elif line.startswith("REJECT:"):
+            q_r = line.replace("REJECT:", "").strip()
+            encountered.add("REJECT:")
+
+        elif line.startswith("TAPES:"):
+            value = line.replace("TAPES:", "").strip()
+            try:
+                tapes = int(value)
+            except ValueError:
+                tapes = 0
+            if tapes < 1:
+                raise TapesError("Number of tapes '{}' given by TAPES is not a positive whole number. Exiting.".format(value), 45, lineno)
+
+        elif line.startswith("DELTA:"):
+            for field, code in FIELDS:
+                if field not in encountered:
+                    raise MissingFieldError("Field '{}' not found in Turing machine. Exiting.".format(field), code, lineno)
+            break
+
+    # The rest of the file is DELTA, which is most of a large machine, so it
+    # gets a loop of its own. Split each line on whitespace. If we have five
+    # elements (two for each extra tape, and one more for each of the
+    # symbols read, written and moves), assume they are formatted correctly
+    # and put them into delta.
+    for line in lines[lineno:]:
+        lineno += 1
+        if line.startswith(';'):
+            continue
+        if line.startswith("END"):
+            break
+        splitline = line.split()
+        if len(splitline) == 3 * tapes + 2:
+            state = splitline[0]
+            curbit = ' '.join(splitline[1:tapes + 1])
+            nextstate = splitline[tapes + 1]
+            writebit = ' '.join(splitline[tapes + 2:2 * tapes + 2])
+            direction = ' '.join(splitline[2 * tapes + 2:])
+            if state not in states:
+                raise DeltaError("State '{}' read in DELTA (line {}) not found in Q.".format(state, lineno), 12, lineno)
+            transition = (nextstate, writebit, direction)
+        elif tapes + 2 <= len(splitline) < 3 * tapes + 2:
+            state = splitline[0]
+            curbit = ' '.join(splitline[1:tapes + 1])
+            nextstate = splitline[tapes + 1]
+            if nextstate != q_a and nextstate != q_r:
+                raise DeltaError("In the following line of DELTA (line {}):\n".format(lineno)
+                                 + state + ' ' + curbit + ' ' + nextstate + '\n'
+                                 + "state with a destination that was not the accept ({}) or reject ({}) state gave no symbol to write or direction to move. Exiting.".format(q_a, q_r),
+                                 13, lineno)
+            # When we don't have a supplied write bit or direction, just use B and L,
+            # for the sake of having a consistent tuple.
+            transition = (nextstate, ' '.join([B] * tapes), ' '.join(['L'] * tapes))
+        else:
+            continue
+        key = state + ' ' + curbit
+        if key in δ:
+            choices.setdefault(key, [δ[key]]).append(transition)
+        δ[key] = transition
+
+    return Definition(name, B, Q, Σ, Γ, q_0, q_a, q_r, δ, choices, tapes)
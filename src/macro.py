@@ -0,0 +1,233 @@
+from tape import ArrayTape
+import tm
+
+# Number of macro steps over which to judge whether the run length encoded
+# simulation is still worth it, and the average number of machine steps each
+# macro step must stand for (per cell of a block) over that window.
+WINDOW = 4096
+PAYOFF = 2
+
+# The macro simulation splits the tape into blocks of k cells, each of which
+# is given a number the same way the compiled engine numbers symbols, and
+# stores the tape as runs of identical blocks: [block, count] pairs on a
+# stack to either side of the block under the head. A machine entering a
+# block in some state is simulated until it leaves the block, and the result
+# (state, new block, side it left by, steps taken) is cached, so each later
+# visit to the same block in the same state costs one dictionary lookup. When
+# the machine passes straight through a block in the same state, it would do
+# the same to every identical block after it, so a whole run is crossed at
+# once. Anything unusual inside a block (halting, a missing transition, the
+# step limit) hands the tape back to the compiled engine at the start of that
+# block, which finishes it exactly.
+class MacroTape:
+
+    def __init__(self, machine, k):
+        self.machine = machine
+        self.k = k
+        self.blocks = [(0,) * k]
+        self.blockids = {self.blocks[0]: 0}
+        self.cache = {}
+        # Runs to the left and right of the head's block. The top of each
+        # stack is the run nearest the head.
+        self.lefts = []
+        self.rights = []
+        self.cur = 0
+        self.pos = 0
+
+    # Return the number of a block, given as a tuple of symbol ids.
+    def block(self, cells):
+        if cells not in self.blockids:
+            self.blockids[cells] = len(self.blocks)
+            self.blocks.append(cells)
+        return self.blockids[cells]
+
+    # Split an array tape into runs of blocks, measured from its left end.
+    def load(self, tape):
+        k = self.k
+        cells = list(tape.cells[tape.left:])
+        end = len(cells)
+        while end > 0 and cells[end - 1] == 0:
+            end -= 1
+        head = tape.head - tape.left
+        end = max(end, head + 1)
+        cells = cells[:end] + [0] * (-end % k)
+        runs = []
+        for i in range(0, len(cells), k):
+            b = self.block(tuple(cells[i:i + k]))
+            if runs and runs[-1][0] == b:
+                runs[-1][1] += 1
+            else:
+                runs.append([b, 1])
+        # Find the run holding the head, and break it around the head block.
+        hb = head // k
+        self.pos = head % k
+        i = 0
+        while hb >= runs[i][1]:
+            hb -= runs[i][1]
+            i += 1
+        b, count = runs[i]
+        self.lefts = runs[:i]
+        if hb > 0:
+            self.lefts.append([b, hb])
+        self.rights = runs[i + 1:][::-1]
+        if count - hb - 1 > 0:
+            self.rights.append([b, count - hb - 1])
+        self.cur = b
+
+    # Expand the runs back out into an array tape sharing the machine's
+    # symbol ids.
+    def unload(self):
+        machine = self.machine
+        tape = ArrayTape(machine.B, machine.symbols, machine.symids)
+        nsym = len(machine.symbols)
+        cells = ArrayTape.blanks(nsym, 0)
+
+        def expand(b, count):
+            piece = ArrayTape.blanks(nsym, 0)
+            piece.extend(self.blocks[b])
+            cells.extend(piece * count)
+
+        for b, count in self.lefts:
+            expand(b, count)
+        tape.head = len(cells) + self.pos
+        expand(self.cur, 1)
+        for b, count in reversed(self.rights):
+            expand(b, count)
+        expand(0, 1)
+        tape.cells = cells
+        return tape
+
+    # Simulate the machine inside one block, starting in 'state' with the
+    # head at offset 'pos', until it leaves by one side. Returns the new
+    # state, new block, side left by (-1 or 1) and number of steps, or None
+    # if the machine halts, fails, or loops forever inside the block.
+    def simulate(self, state, b, pos):
+        machine = self.machine
+        k = self.k
+        nsym = machine.nsym
+        nexts = machine.nexts
+        writes = machine.writes
+        moves = machine.moves
+        cells = list(self.blocks[b])
+        bound = k * len(machine.states) * nsym ** k
+        steps = 0
+        while 0 <= pos < k:
+            if steps > bound:
+                return None
+            i = state * nsym + cells[pos]
+            ns = nexts[i]
+            if ns == tm.SWEEP:
+                ns = state
+            elif ns < 0:
+                return None
+            cells[pos] = writes[i]
+            pos += moves[i]
+            state = ns
+            steps += 1
+        return (state, self.block(tuple(cells)), 1 if pos == k else -1, steps)
+
+    # Put n copies of block b on top of a stack of runs.
+    @staticmethod
+    def push(runs, b, n):
+        if runs and runs[-1][0] == b:
+            runs[-1][1] += n
+        else:
+            runs.append([b, n])
+
+    # Take one block off the top of a stack of runs. Past the right end of
+    # the tape, there are always more blank blocks.
+    @staticmethod
+    def pop(runs):
+        if not runs:
+            return 0
+        b = runs[-1][0]
+        runs[-1][1] -= 1
+        if runs[-1][1] == 0:
+            runs.pop()
+        return b
+
+    # Run macro steps from the given state and step count until the machine
+    # has to be handed back to the compiled engine, returning the state and
+    # step count at the start of the block it was handed back in.
+    def run(self, state, numsteps, limit):
+        k = self.k
+        cache = self.cache
+        lefts = self.lefts
+        rights = self.rights
+        window = 0
+        gained = 0
+        while True:
+            key = (state, self.cur, self.pos)
+            if key not in cache:
+                cache[key] = self.simulate(state, self.cur, self.pos)
+            result = cache[key]
+            if result is None:
+                break
+            ns, nb, side, steps = result
+            if 0 <= limit - numsteps < steps:
+                break
+
+            # Passing straight through a block in the same state means the
+            # machine passes through every identical block after it too, and
+            # past the right end of the tape every block is blank.
+            count = 1
+            if ns == state and self.pos == (0 if side > 0 else k - 1):
+                runs = rights if side > 0 else lefts
+                if runs and runs[-1][0] == self.cur:
+                    count += runs[-1][1]
+                elif side > 0 and not runs and self.cur == 0:
+                    count = 1 << 32
+                if 0 <= limit - numsteps < count * steps:
+                    count = (limit - numsteps) // steps
+                if count > 1 and runs:
+                    runs[-1][1] -= count - 1
+                    if runs[-1][1] == 0:
+                        runs.pop()
+            numsteps += steps * count
+            gained += steps * count
+            state = ns
+
+            if side > 0:
+                MacroTape.push(lefts, nb, count)
+                self.cur = MacroTape.pop(rights)
+                self.pos = 0
+            elif not lefts:
+                # Moving left off the end of the tape leaves the head in
+                # the first cell, as if it had entered that block again.
+                if count > 1:
+                    MacroTape.push(rights, nb, count - 1)
+                self.cur = nb
+                self.pos = 0
+            else:
+                MacroTape.push(rights, nb, count)
+                self.cur = MacroTape.pop(lefts)
+                self.pos = k - 1
+
+            window += 1
+            if window == WINDOW:
+                if gained < WINDOW * PAYOFF * k:
+                    break
+                window = 0
+                gained = 0
+        return state, numsteps
+
+
+# Run a machine on its current tape with the macro simulation, using blocks
+# of k cells, and finish the computation with the compiled engine. The state,
+# step count, tape and result are exactly those of machine.run_tape().
+def run_macro(machine, k):
+    if machine.haltat != machine.compiled_haltat or len(machine.symbols) != machine.nsym:
+        machine.compile()
+    limit = machine.haltafter if machine.haltafter > 0 else -1
+    if machine.curr_state == machine.haltat or machine.numsteps == limit:
+        return machine.run_compiled()
+    tape = machine.curr_tape
+    if not isinstance(tape, ArrayTape):
+        tape = ArrayTape.from_linked(tape, machine.symbols, machine.symids)
+    macro = MacroTape(machine, k)
+    macro.load(tape)
+    state, numsteps = macro.run(machine.stateids[machine.curr_state], machine.numsteps, limit)
+    machine.curr_state = machine.states[state]
+    machine.numsteps = numsteps
+    machine.curr_tape = macro.unload()
+    return machine.run_compiled()
@@ -1,234 +1,297 @@
-import argparse
-import tm
-import colors
-import signal
-
-print(colors.default, end='')
-
-def catch_ctrl_c(signal, frame):
-    print("Keyboard interrupt caught. Exiting.")
-    exit(130)
-
-signal.signal(signal.SIGINT, catch_ctrl_c)
-
-parser = argparse.ArgumentParser(description="Interactive Turing Machine Interpreter and Debugger.", add_help=False)
-
-# Setting up command line flags and options. 
-parser.add_argument('-m', '--machine', type=str, help="Required argument, followed by the path to the file specifying the machine.")
-parser.add_argument('-t', '--tape', type=str, help="Optional argument, followed by the path to the file specifying the tape. If this option is not present, tape is instead read from stdin.")
-parser.add_argument('-d', '--debug', type=int, default=0, help="Debugging level. Takes an integer, default is 0 (no debugging). Maxmimum is 2.")
-parser.add_argument('-w', '--time', type=float, default=0.0, help="Time to wait between animation frames. Default is 0, meaning no animation.")
-parser.add_argument('-l', '--haltafter', type=int, default=0.0, help="Number of steps to run the computation before halting.")
-parser.add_argument('-s', '--haltat', type=str, help="State at which to halt the machine.")
-parser.add_argument('-i', '--step', action="store_true", help="Run animation mode, but wait for input between each frame.")
-parser.add_argument('-a', '--ascii', action="store_true", help="Strictly enforce the 170 standard that only ASCII characters are allowed in alphabets and states.")
-parser.add_argument('-n', '--dark', action="store_true", help="Prints output in a 'dark mode', with black text. Default is light gray.")
-parser.add_argument('-h', '--help', action="store_true", help="Shows this help message and exit.")
-
-try:
-    args = parser.parse_args()
-except SystemExit:
-    print("Invalid arguments given to program.")
-    exit(9)
-
-if args.help:
-    parser.print_help()
-    exit(3)
-
-machine_file = args.machine
-
-if args.dark:
-    colors.default = colors.black_16
-    colors.state_text = colors.dark_blue_16
-    colors.changed_bit = colors.dark_dark_green
-    colors.tape_box_2 = colors.dark_blue_16
-    colors.tape_head_2 = colors.dark_red_16
-    colors.tape_box_1 = colors.dark_red_16
-    colors.tape_1 = colors.grey
-    colors.accept = colors.dark_dark_green
-    colors.reject = colors.dark_red_16
-    colors.abort = colors.dark_red_16
-    colors.hlighted = colors.dark_red_16
-    colors.selected = colors.dark_dark_green
-
-print(colors.default, end='')
-
-debug = args.debug
-if debug < 0 or debug > 2:
-    debug = 0
-
-tflag = args.time
-if tflag < 0:
-    tflag = 0
-
-haltafter = args.haltafter
-if haltafter < 0:
-    haltafter = 0
-
-haltat = args.haltat
-
-# Initialize turing machine structure. Q, Σ, and Γ are Python lists. δ is
-# a dictionary indexed by the string "state current_bit", i.e. the name of
-# the state, a single space, and the current bit the tape head is reading.
-B = 'B'
-tape = ""
-name = ""
-Q = []
-Σ = []
-Γ = []
-q_0 = ""
-q_a = ""
-q_r = ""
-δ = {}
-
-# Keep track of which of the keywords (GAMMA, SIGMA, etc.) we have encountered 
-encountered = []
-
-# Open the machine file. We have not yet begun reading in the delta states,
-# so we wish to keep track of that.
-if args.machine is None:
-    print(colors.default + "No Turing machine file specified (-m option). Exiting.")
-    exit(10)
-try:
-    f = open(args.machine, 'r')
-except FileNotFoundError:
-    print(colors.default + "Machine file at {} not found. Exiting.".format(args.machine))
-    exit(11)
-
-isdelta = False
-for line in f:
-    # Remove newlines so we don't confuse our Turing machine.
-    line = line.replace('\n', '')
-    # Ignore comments and die when 'END' is found.
-    if line.startswith(';') or line == "":
-        continue
-    if line.startswith("END"):
-        break
-    # If we are reading lines in delta, split the line on whitespace. If we have five elements,
-    # assume they are formatted correctly and put them into delta.
-    elif isdelta:
-        splitline = line.split()
-        if len(splitline) == 5:
-            state = splitline[0]
-            if state not in Q:
-                print("State '{}' read in DELTA not found in Q.".format(state))
-                exit(12)
-            curbit = splitline[1]
-            nextstate = splitline[2]
-            writebit = splitline[3]
-            direction = splitline[4]
-            δ[state + ' ' + curbit] = (nextstate, writebit, direction)
-        elif len(splitline) == 3 or len(splitline) == 4:
-            state = splitline[0]
-            curbit = splitline[1]
-            nextstate = splitline[2]
-            if nextstate != q_a and nextstate != q_r:
-                print("In the following line of DELTA:")
-                print(splitline[0] + ' ' + splitline[1] + ' ' + splitline[2])
-                print("state with a destination that was not the accept ({}) or reject ({}) state gave no symbol to write or direction to move. Exiting.".format(q_a, q_r))
-                exit(13)
-            # When we don't have a supplied write bit or direction, just use B and L,
-            # for the sake of having a consistent tuple.
-            else:
-                δ[state + ' ' + curbit] = (nextstate, B, 'L')
-        else:
-            continue
-    elif line.startswith("NAME"):
-        name = line.replace("NAME:", "").strip()
-        encountered.append("NAME:")
-
-    elif line.startswith("STATE:"):
-        s = line.replace("STATE:", "")
-        encountered.append("STATE:")
-        Q = s.split()
-        for state in Q:
-            for char in state:
-                if args.ascii and ord(char) >= 128:
-                    print("State '{}' read in DELTA contains non-ASCII character.".format(state))
-                    exit(23)
-
-    elif line.startswith("SIGMA:"):
-        s = line.replace("SIGMA:", "")
-        encountered.append("SIGMA:")
-        Σ = s.split()
-        for sym in Σ:
-            for char in sym:
-                if args.ascii and ord(char) >= 128:
-                    print("Symbol '{}' read in SIGMA contains non-ASCII character.".format(sym))
-                    exit(24)
-
-
-    elif line.startswith("GAMMA:"):
-        s = line.replace("GAMMA:", "")
-        encountered.append("GAMMA:")
-        Γ = s.split()
-        for sym in Γ:
-            for char in sym:
-                if args.ascii and ord(char) >= 128:
-                    print("Symbol '{}' read in GAMMA contains non-ASCII character.".format(sym))
-                    exit(25)
-
-    elif line.startswith("START:"):
-        q_0 = line.replace("START:", "").strip()
-        encountered.append("START:")
-
-    elif line.startswith("ACCEPT:"):
-        q_a = line.replace("ACCEPT:", "").strip()
-        encountered.append("ACCEPT:")
-
-    elif line.startswith("REJECT:"):
-        q_r = line.replace("REJECT:", "").strip()
-        encountered.append("REJECT:")
-
-    elif line.startswith("DELTA:"):
-        encountered.append("DELTA:")
-        if not "NAME:" in encountered:
-            print("Field 'NAME:' not found in Turing machine. Exiting.")
-            exit(14)
-        if not "STATE:" in encountered:
-            print("Field 'STATE:' not found in Turing machine. Exiting.")
-            exit(15)    
-        if not "SIGMA:" in encountered:
-            print("Field 'SIGMA:' not found in Turing machine. Exiting.")
-            exit(16)    
-        if not "GAMMA:" in encountered:
-            print("Field 'GAMMA:' not found in Turing machine. Exiting.")
-            exit(17)    
-        if not "START:" in encountered:
-            print("Field 'START:' not found in Turing machine. Exiting.")
-            exit(18)    
-        if not "ACCEPT:" in encountered:
-            print("Field 'ACCEPT:' not found in Turing machine. Exiting.")
-            exit(19)    
-        if not "REJECT:" in encountered:
-            print("Field 'REJECT:' not found in Turing machine. Exiting.")
-            exit(20)        
-        isdelta = True
-f.close()
-
-# If we specify a file name for the tape, read from that file. Otherwise
-# read from stdin.
-if args.tape is not None:
-    tape_file = args.tape
-    try:
-        tf = open(tape_file, 'r')
-        tape = tf.read()
-        tf.close()
-        tape = tape.replace('\n', '')
-    except FileNotFoundError:
-        print(colors.default + "Tape file at {} not found. Exiting.".format(tape_file))
-        exit(21)
-else:
-    tape = input(colors.default + "Input: ")
-    tape = ''.join(tape.split())
-
-if haltat not in Q and haltat != None:
-    print("State to halt at '{}' not found in Q.".format(haltat))
-    exit(22)
-
-# Create our turing machine, add our tape to it, and run the tape.
-machine = tm.TM(debug, tflag, haltafter, haltat, args.step, name, B, Q, Σ, Γ, q_0, q_a, q_r, δ)
-machine.add_tape(tape)
-out = machine.run_tape()
-print(out)
-exit(machine.get_last_exit())
+import argparse
+import os
+from machine import load_machine, MachineError, MachineFileError
+import cache
+import macro
+import cycle
+import batch
+import server
+import checkpoint
+import tracefile
+import debugger
+import profiler
+import bench
+import codegen
+import ntm
+import sweep
+import equiv
+from render import Renderer
+import colors
+import signal
+
+def catch_ctrl_c(signal, frame):
+    print("Keyboard interrupt caught. Exiting.")
+    exit(130)
+
+def main():
+    signal.signal(signal.SIGINT, catch_ctrl_c)
+
+    parser = argparse.ArgumentParser(description="Interactive Turing Machine Interpreter and Debugger.", add_help=False)
+
+    # Setting up command line flags and options. 
+    parser.add_argument('-m', '--machine', type=str, action='append', help="Required argument, followed by the path to the file specifying the machine. May be given more than once with --serve, and twice with --diff.")
+    parser.add_argument('-t', '--tape', type=str, help="Optional argument, followed by the path to the file specifying the tape. If this option is not present, tape is instead read from stdin.")
+    parser.add_argument('-d', '--debug', type=int, default=0, help="Debugging level. Takes an integer, default is 0 (no debugging). Maxmimum is 2.")
+    parser.add_argument('-w', '--time', type=float, default=0.0, help="Time to wait between animation frames. Default is 0, meaning no animation.")
+    parser.add_argument('-l', '--haltafter', type=int, default=0.0, help="Number of steps to run the computation before halting.")
+    parser.add_argument('-s', '--haltat', type=str, help="State at which to halt the machine.")
+    parser.add_argument('-f', '--fps', type=float, default=0.0, help="Animate, showing at most this many frames per second and skipping the rest.")
+    parser.add_argument('-i', '--step', action="store_true", help="Step through the run in the interactive debugger, which can also step backwards, jump to any step and run on to breakpoints.")
+    parser.add_argument('-a', '--ascii', action="store_true", help="Strictly enforce the 170 standard that only ASCII characters are allowed in alphabets and states.")
+    parser.add_argument('-r', '--reference', action="store_true", help="Always use the original step-by-step engine, even when debugging is off.")
+    parser.add_argument('-e', '--rle', type=int, nargs='?', const=1, default=0, help="Store the tape as runs of blocks of this many cells (default 1) and simulate whole blocks at once.")
+    parser.add_argument('-c', '--cycles', action="store_true", help="Stop with exit code 4 if the machine comes back to a configuration it has been in before.")
+    parser.add_argument('-G', '--generated', action="store_true", help="Run the machine with Python code generated for it, rather than with the compiled tables.")
+    parser.add_argument('-k', '--linked', action="store_true", help="Store the tape as a doubly-linked list rather than a compact array.")
+    parser.add_argument('-b', '--batch', type=str, help="Run the machine over many tapes: a directory of tape files, a glob pattern, or a file with one tape per line.")
+    parser.add_argument('-j', '--workers', type=int, help="Number of worker processes for batch mode, or for --ntm. Default is the number of CPUs in batch and sweep mode, and 1 with --ntm.")
+    parser.add_argument('-o', '--output', type=str, help="File to write batch results to, as CSV if it ends in .csv and JSON lines otherwise. Default is stdout. With --sweep, file to write the verdict of every input to.")
+    parser.add_argument('-x', '--lockstep', type=int, nargs='?', const=1024, default=0, help="In batch mode, run this many tapes at a time (default 1024) in lockstep with NumPy.")
+    parser.add_argument('-y', '--serve', type=str, nargs='?', const='-', help="Serve requests to run tapes, as JSON lines on stdin or on this Unix domain socket.")
+    parser.add_argument('-p', '--cache', type=str, nargs='?', const=cache.default_directory(), help="Keep compiled machines in this directory (default ~/.cache/tm), so a machine file is only parsed once.")
+    parser.add_argument('-z', '--cachesize', type=float, default=cache.LIMIT, help="Most the cache directory may hold, in megabytes. Default is {}.".format(cache.LIMIT))
+    parser.add_argument('-q', '--memo', action="store_true", help="Remember the result of each run in the cache directory, and give it again for the same machine, tape and limits without running.")
+    parser.add_argument('-g', '--checkpoint', type=str, help="Write the machine's configuration to this file every few seconds and on Ctrl+C, so the run can be carried on with --resume.")
+    parser.add_argument('-v', '--every', type=float, default=5.0, help="Seconds between checkpoints. Default is 5. If 0, a checkpoint is only written on Ctrl+C.")
+    parser.add_argument('-u', '--resume', type=str, help="Carry on the run saved in this checkpoint file instead of reading a tape. Checkpoints are written back to it unless --checkpoint names another file.")
+    parser.add_argument('-T', '--trace', type=str, help="Record every step of the run to this file, to be looked at later with --replay.")
+    parser.add_argument('-R', '--replay', type=str, help="Show the configuration of the machine after a step of the run recorded in this trace file, instead of reading a tape.")
+    parser.add_argument('-S', '--seek', type=int, help="Step to show with --replay. Default is the last step recorded.")
+    parser.add_argument('-P', '--profile', type=str, nargs='?', const='', help="Count the steps taken by each transition and state and on each cell, and print a report after the run. Given a path, the report is also written there as JSON.")
+    parser.add_argument('-B', '--bench', type=str, nargs='?', const='', help="Time every engine on the example machines and tapes, or on the machines given with -m. Given the path of results saved with --output, compare against them.")
+    parser.add_argument('-E', '--threshold', type=float, default=10.0, help="Percent by which a benchmark run may be worse than in the baseline before it counts as a regression. Default is 10.")
+    parser.add_argument('-N', '--ntm', type=str, nargs='?', const='bfs', choices=['bfs', 'iddfs'], help="Run the machine as nondeterministic, taking every transition given for a state and symbol, and accept if any branch does. Searches breadth-first (bfs, the default) or by iterative deepening (iddfs).")
+    parser.add_argument('-K', '--branches', type=int, default=0, help="With --ntm, stop after exploring this many configurations. Default is 0, meaning no limit.")
+    parser.add_argument('-F', '--first', action="store_true", help="With --ntm, stop at the first accepting branch rather than searching the whole tree.")
+    parser.add_argument('-W', '--sweep', type=int, help="Run the machine on every input up to this many symbols long, and print the verdicts and steps taken for each length, with how the steps grow. Inputs are stopped after {} steps unless --haltafter is given.".format(sweep.LIMIT))
+    parser.add_argument('-A', '--sample', type=int, default=sweep.SAMPLE, help="With --sweep, run at most this many inputs, picked at random, of any one length. Default is {}.".format(sweep.SAMPLE))
+    parser.add_argument('-D', '--diff', type=str, nargs='?', const='verdict', choices=['verdict', 'tape'], help="Compare the two machines given with -m on the inputs of --sweep, stopping at the first they disagree on and shrinking it. Compares verdicts (verdict, the default), or verdicts and final tapes (tape).")
+    parser.add_argument('-n', '--dark', action="store_true", help="Prints output in a 'dark mode', with black text. Default is light gray.")
+    parser.add_argument('-h', '--help', action="store_true", help="Shows this help message and exit.")
+
+    try:
+        args = parser.parse_args()
+    except SystemExit:
+        print("Invalid arguments given to program.")
+        exit(9)
+
+    # Batch results written to stdout are meant for other programs to read,
+    # so they are kept free of color codes.
+    plain = (args.batch is not None and args.output is None) or args.serve == '-'
+    if not plain:
+        print(colors.default, end='')
+
+    if args.help:
+        parser.print_help()
+        exit(3)
+
+    if args.dark:
+        colors.default = colors.black_16
+        colors.state_text = colors.dark_blue_16
+        colors.changed_bit = colors.dark_dark_green
+        colors.tape_box_2 = colors.dark_blue_16
+        colors.tape_head_2 = colors.dark_red_16
+        colors.tape_box_1 = colors.dark_red_16
+        colors.tape_1 = colors.grey
+        colors.accept = colors.dark_dark_green
+        colors.reject = colors.dark_red_16
+        colors.abort = colors.dark_red_16
+        colors.hlighted = colors.dark_red_16
+        colors.selected = colors.dark_dark_green
+
+    if not plain:
+        print(colors.default, end='')
+
+    debug = args.debug
+    if debug < 0 or debug > 2:
+        debug = 0
+
+    tflag = args.time
+    if tflag < 0:
+        tflag = 0
+    fps = args.fps
+    if fps < 0:
+        fps = 0
+
+    haltafter = args.haltafter
+    if haltafter < 0:
+        haltafter = 0
+
+    haltat = args.haltat
+
+    # The benchmark brings its own machines and tapes, unless it is given
+    # machines to run.
+    if args.bench is not None:
+        exit(bench.run_bench(args.machine, haltafter, args.output, args.bench, max(args.threshold, 0)))
+
+    # Read in the machine file.
+    if args.machine is None:
+        print(colors.default + "No Turing machine file specified (-m option). Exiting.")
+        exit(10)
+    store = cache.Store(args.cache, args.cachesize) if args.cache is not None else None
+    definitions = {}
+    for path in (args.machine if args.serve is not None or args.diff is not None else args.machine[-1:]):
+        try:
+            definitions[path] = load_machine(path, args.ascii, store)
+        except MachineFileError as e:
+            print(colors.default + e.message)
+            exit(e.code)
+        except MachineError as e:
+            print(e.message)
+            exit(e.code)
+    definition = definitions[args.machine[-1]]
+
+    # In server mode, every machine is kept loaded, and tapes to run on them
+    # come in as requests.
+    if args.serve is not None:
+        exit(server.run_server(definitions, args.serve, haltafter, args.cycles, args.workers))
+
+    # Two machines are compared on the inputs of a sweep. Cycles are only
+    # looked for if both machines have one tape.
+    if args.diff is not None:
+        if args.sweep is None or len(args.machine) != 2:
+            print("--diff needs two machines, each given with -m, and --sweep. Exiting.")
+            exit(48)
+        machines = [definitions[path].build(0, 0, haltafter, None, False, args.reference, args.linked)
+                    for path in args.machine]
+        cycles = args.cycles and all(machine.tapes == 1 for machine in machines)
+        exit(equiv.run_diff(machines, args.machine, args.sweep, args.workers, args.sample, cycles, args.diff == 'tape'))
+
+    if haltat not in definition.Q and haltat != None:
+        print("State to halt at '{}' not found in Q.".format(haltat))
+        exit(22)
+
+    # A machine with more than one tape is only run by the reference and
+    # compiled engines, and is never checkpointed or traced.
+    if definition.tapes > 1:
+        if args.resume is not None or args.replay is not None:
+            print("Checkpoints and traces are only kept of machines with one tape. Exiting.")
+            exit(44)
+        args.cycles = args.generated = args.step = False
+        args.rle = args.lockstep = 0
+        args.ntm = args.trace = args.profile = args.checkpoint = None
+
+    # In batch mode, the tapes are named by --batch rather than read here, and
+    # each result is written out as a record rather than printed.
+    if args.batch is not None:
+        machine = definition.build(0, 0, haltafter, haltat, False, args.reference, args.linked)
+        memo = cache.ENTRIES if args.memo else 0
+        exit(batch.run_batch(machine, args.batch, args.workers, args.output, args.rle, args.lockstep, args.cycles, memo))
+
+    # A sweep makes up its own inputs: every string over Σ up to the length
+    # given.
+    if args.sweep is not None:
+        machine = definition.build(0, 0, haltafter, haltat, False, args.reference, args.linked)
+        exit(sweep.run_sweep(machine, args.sweep, args.workers, args.output, args.sample, args.cycles))
+
+    # If we specify a file name for the tape, read from that file. Otherwise
+    # read from stdin. A resumed or replayed run already has its tape. A tape
+    # file is read straight onto the machine's tape once it is built, unless
+    # its text is needed to look up a remembered result.
+    tape = None
+    tape_file = None
+    if args.resume is not None or args.replay is not None:
+        pass
+    elif args.tape is not None:
+        tape_file = args.tape
+        if not os.path.isfile(tape_file):
+            print(colors.default + "Tape file at {} not found. Exiting.".format(tape_file))
+            exit(21)
+        if args.memo and debug == 0 and not args.step and args.ntm is None:
+            with open(tape_file, 'r') as tf:
+                tape = ''.join(tf.read().split())
+    else:
+        tape = input(colors.default + "Input: ")
+        tape = ''.join(tape.split())
+
+    # Create our turing machine, add our tape to it, and run the tape.
+    machine = definition.build(debug, tflag, haltafter, haltat, args.step, args.reference, args.linked, fps)
+
+    # A replay puts the machine where it was after the step asked for, and
+    # shows it there. With debugging output on, it is then run on from there.
+    if args.replay is not None:
+        try:
+            reader = tracefile.Reader(args.replay, machine, definition.key)
+            reader.seek(reader.span()[1] if args.seek is None else args.seek)
+            reader.close()
+        except tracefile.TraceError as e:
+            print(e.message)
+            exit(e.code)
+        print("Step {}, state {}:".format(machine.numsteps, machine.curr_state))
+        print(Renderer(machine.B, machine.ΓsubΣ, max(debug, 1), machine.langlen).frame(machine.curr_tape))
+        if debug == 0:
+            exit(0)
+
+    # Results are remembered by the machine, the tape, and everything else
+    # which can change how the run ends, in the same directory and under the
+    # same size limit as compiled machines. With debugging output on, every
+    # step has to be shown, so the machine is always run. A run being traced
+    # or profiled is run too, since a remembered result has no trace or
+    # profile, but its result is still remembered.
+    result = None
+    profile = None
+    memoize = args.memo and debug == 0 and tape is not None and not args.step and args.ntm is None
+    if memoize:
+        memo = store or cache.Store(cache.default_directory(), args.cachesize)
+        key = cache.make_key('result', definition.key, tape, str(haltafter), str(haltat), str(args.cycles))
+        if args.trace is None and args.profile is None:
+            result = memo.get(key)
+    # A checkpointed run can be stopped at any point and carried on later
+    # from where it was, with any engine but those for cycles and blocks.
+    path = args.checkpoint or args.resume
+    if result is not None:
+        out = machine.set_result(result)
+    else:
+        if tape is not None:
+            machine.add_tape(tape)
+        elif tape_file is not None:
+            try:
+                machine.load_tape(tape_file)
+            except OSError:
+                print(colors.default + "Tape file at {} not found. Exiting.".format(tape_file))
+                exit(21)
+        elif args.resume is not None:
+            try:
+                checkpoint.load(machine, definition.key, args.resume)
+            except checkpoint.CheckpointError as e:
+                print(e.message)
+                exit(e.code)
+        if args.ntm is not None:
+            out = ntm.run_ntm(machine, definition.choices, args.ntm, args.branches, args.first, args.workers)
+        elif args.step:
+            out = debugger.run_debugger(machine)
+        elif args.trace is not None and debug == 0 and not (args.reference or args.cycles or args.rle > 0):
+            try:
+                out = tracefile.run_traced(machine, definition.key, args.trace)
+            except tracefile.TraceError as e:
+                print(e.message)
+                exit(e.code)
+        elif args.profile is not None and debug == 0 and not (args.reference or args.cycles or args.rle > 0):
+            out, profile = profiler.run_profiled(machine)
+        elif path is not None and not ((args.cycles or args.rle > 0) and debug == 0 and not args.reference):
+            out = checkpoint.run_checkpointed(machine, definition.key, path, args.every, args.checkpoint is not None)
+        elif args.cycles and debug == 0 and not args.reference:
+            out = cycle.run_cycles(machine)
+        elif args.rle > 0 and debug == 0 and not args.reference:
+            out = macro.run_macro(machine, args.rle)
+        elif args.generated and debug == 0 and not args.reference:
+            out = codegen.run_generated(machine)
+        else:
+            out = machine.run_tape()
+        if memoize:
+            memo.put(key, machine.get_result())
+    print(out)
+    if profile is not None:
+        print(profile.text())
+        if args.profile:
+            try:
+                profiler.write_report(profile, args.profile)
+            except profiler.ProfileError as e:
+                print(e.message)
+                exit(e.code)
+    if machine.get_last_exit() == 4:
+        print("The configuration after step {} repeats every {} steps.".format(*machine.cycle))
+    exit(machine.get_last_exit())
+
+if __name__ == '__main__':
+    main()
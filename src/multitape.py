@@ -0,0 +1,284 @@
+from tape import ArrayTape
+from render import Stack
+from tm import TM, MISSING, BADSYM, ACCEPT, REJECT, BADDIR, HALTAT
+
+# A machine with k tapes reads a symbol from each at once, and its
+# transition writes a symbol to each and moves each head left, right, or
+# not at all (S). In the machine file, TAPES gives k, and each line of DELTA
+# gives the state, the k symbols read, the next state, the k symbols to
+# write and the k directions to move, all separated by whitespace. In δ, the
+# symbols read follow the state in the key just as the one symbol of a
+# one-tape machine does, and the symbols to write and directions to move are
+# each kept as a string of k separated by spaces. The input is written on
+# the first tape, and the others start out blank.
+#
+# Each tape is an ArrayTape of its own, sharing the machine's symbol ids.
+# The compiled table is keyed by the state and all k symbols read, as
+# ((state * nsym + c_1) * nsym + c_2) * nsym + ... + c_k, so a step is one
+# lookup however many tapes there are, and each entry gives the next state,
+# the tuple of k symbols to write and the tuple of k moves. There are
+# nsym ** k combinations of symbols for each state, nearly all of them
+# missing from δ, so the table is a dict holding only the transitions given
+# rather than a list with room for every combination. Self-loops are taken
+# a step at a time, since the run of cells one tape's head sweeps across
+# says nothing about the others.
+
+
+class MultiTM(TM):
+
+    def __init__(self, tapes, *args, **kwargs):
+        self.tapes = tapes
+        self.curr_tapes = []
+        self.S = 'S'
+        super().__init__(*args, **kwargs)
+
+    def add_tape(self, tape):
+        first = ArrayTape.gen_tape(tape, self.Σ, self.B, self.symbols, self.symids)
+        self.set_tapes([first])
+
+    def load_tape(self, path):
+        self.set_tapes([ArrayTape.load(path, self.Σ, self.B, self.symbols, self.symids)])
+
+    # Use the given tapes, followed by as many blank ones as it takes.
+    def set_tapes(self, tapes):
+        while len(tapes) < self.tapes:
+            tapes.append(ArrayTape(self.B, self.symbols, self.symids))
+        self.curr_tapes = tapes
+        self.curr_tape = tapes[0]
+
+    def remove_tape(self):
+        self.curr_tapes = []
+        self.curr_tape = None
+
+    # As TM.compile, with the k symbols read and written by each entry of δ
+    # numbered, and the table a dict of the transitions in δ.
+    def compile(self):
+        self.states = []
+        self.stateids = {}
+
+        def symbol(sym):
+            if sym not in self.symids:
+                self.symids[sym] = len(self.symbols)
+                self.symbols.append(sym)
+            return self.symids[sym]
+
+        def state(q):
+            if q not in self.stateids:
+                self.stateids[q] = len(self.states)
+                self.states.append(q)
+            return self.stateids[q]
+
+        symbol(self.B)
+        for sym in self.Γ + self.Σ:
+            symbol(sym)
+        for q in self.Q + [self.q_0, self.q_a, self.q_r]:
+            state(q)
+        transitions = []
+        for key, (newstate, newbits, directions) in self.δ.items():
+            fields = key.split(' ')
+            newbits = newbits.split(' ')
+            transitions.append((state(fields[0]), [symbol(bit) for bit in fields[1:]], state(newstate),
+                                tuple(symbol(bit) for bit in newbits), newbits, directions.split(' ')))
+
+        nsym = len(self.symbols)
+        self.table = {}
+        Γ = set(self.Γ)
+        steps = {self.L: -1, self.R: 1, self.S: 0}
+        for q, bits, newq, writes, newbits, directions in transitions:
+            i = q
+            for bit in bits:
+                i = i * nsym + bit
+            newstate = self.states[newq]
+            if any(newbit not in Γ for newbit in newbits):
+                ns = BADSYM
+            elif newstate == self.q_a:
+                ns = ACCEPT
+            elif newstate == self.q_r:
+                ns = REJECT
+            elif any(direction not in steps for direction in directions):
+                ns = BADDIR
+            elif newstate == self.haltat:
+                ns = HALTAT
+            else:
+                ns = newq
+            self.table[i] = (ns, writes, tuple(steps.get(direction, 0) for direction in directions))
+        self.compiled_haltat = self.haltat
+        self.nsym = nsym
+        self.source = None
+
+    # The compiled engine, as TM.run_compiled, over every tape at once.
+    def run_compiled(self, pause=-1):
+        if self.haltat != self.compiled_haltat or len(self.symbols) != self.nsym:
+            self.compile()
+        tapes = self.curr_tapes
+        nsym = self.nsym
+        table = self.table
+        missing = (MISSING, (), ())
+        cells = [tape.cells for tape in tapes]
+        heads = [tape.head for tape in tapes]
+        lefts = [tape.left for tape in tapes]
+        sizes = [len(c) for c in cells]
+        ks = range(0, self.tapes)
+        state = self.stateids[self.curr_state]
+        numsteps = self.numsteps
+        limit = self.haltafter if self.haltafter > 0 else -1
+        pausing = pause >= 0 and (limit < 0 or pause < limit)
+        paused = False
+        if pausing:
+            limit = pause
+        ns = HALTAT
+        if self.curr_state != self.haltat:
+            ns = 0
+            while numsteps != limit:
+                i = state
+                for j in ks:
+                    i = i * nsym + cells[j][heads[j]]
+                ns, write, move = table.get(i, missing)
+                if ns < 0 and ns != HALTAT:
+                    break
+                for j in ks:
+                    head = heads[j]
+                    cells[j][head] = write[j]
+                    head += move[j]
+                    if head < lefts[j]:
+                        head = lefts[j]
+                    elif head == sizes[j]:
+                        sizes[j] = tapes[j].grow_r()
+                    heads[j] = head
+                numsteps += 1
+                if ns == HALTAT:
+                    state = self.stateids[self.haltat]
+                    break
+                state = ns
+            else:
+                paused = pausing
+
+        self.numsteps = numsteps
+        self.curr_state = self.states[state]
+        for j in ks:
+            tapes[j].head = heads[j]
+
+        if paused:
+            return None
+        elif ns == MISSING:
+            self.lastexit = 1
+            return self.rejstr
+        elif ns == BADSYM:
+            bad = [self.symbols[c] for c in write if self.symbols[c] not in self.Γ]
+            print("Symbol '{}' on tape not recognized. Exiting.".format(bad[0]))
+            exit(34)
+        elif ns == ACCEPT:
+            self.curr_state = self.q_a
+            self.lastexit = 0
+            return self.accstr
+        elif ns == REJECT:
+            self.curr_state = self.q_r
+            self.lastexit = 1
+            return self.rejstr
+        elif ns == BADDIR:
+            print("Direction specified in δ not equal to L, R or S. Exiting.")
+            exit(36)
+
+        self.lastexit = 2
+        print()
+        return self.halstr
+
+    # The reference engine, as TM.transitions. The symbols read and written
+    # and the directions are yielded as strings of k separated by spaces.
+    def transitions(self):
+        while True:
+
+            if self.haltafter > 0 and self.numsteps == self.haltafter:
+                return HALTAT
+
+            if self.curr_state == self.haltat:
+                return HALTAT
+
+            bits = self.read()
+            try:
+                newstate, newbits, directions = self.δ[self.curr_state + ' ' + bits]
+            except KeyError:
+                return MISSING
+
+            yield bits, newstate, newbits, directions
+
+            newbits = newbits.split(' ')
+            if any(newbit not in self.Γ for newbit in newbits):
+                return BADSYM
+
+            self.curr_state = newstate
+
+            if newstate == self.q_a:
+                return ACCEPT
+            elif newstate == self.q_r:
+                return REJECT
+
+            for tape, newbit, direction in zip(self.curr_tapes, newbits, directions.split(' ')):
+                tape.write(newbit)
+                if direction == self.L:
+                    tape.l()
+                elif direction == self.R:
+                    tape.r()
+                elif direction != self.S:
+                    return BADDIR
+
+            self.numsteps += 1
+
+    # A transition which writes a symbol not in Γ is reported by the first
+    # such symbol, rather than by everything it writes.
+    def halt(self, code, move, renderer, display):
+        if code == BADSYM:
+            bad = [newbit for newbit in move[2].split(' ') if newbit not in self.Γ]
+            move = (move[0], move[1], bad[0], move[3])
+        elif code == BADDIR:
+            display.finish()
+            print("Direction specified in δ not equal to L, R or S. Exiting.")
+            exit(36)
+        return super().halt(code, move, renderer, display)
+
+    def fails(self, newbits, directions):
+        return (any(newbit not in self.Γ for newbit in newbits.split(' '))
+                or any(d != self.L and d != self.R and d != self.S for d in directions.split(' ')))
+
+    # The directions themselves, as there is no room for a word for each.
+    def heading(self, directions):
+        return directions
+
+    def renderer(self):
+        return Stack(self.tapes, self.B, self.ΓsubΣ, self.debug, self.langlen)
+
+    def frame(self, renderer):
+        return renderer.frame(self.curr_tapes)
+
+    def read(self):
+        return ' '.join(tape.read() for tape in self.curr_tapes)
+
+    # As TM.get_result, with the symbols and head position of each tape in a
+    # list, in place of those of the one tape.
+    def get_result(self):
+        syms = []
+        heads = []
+        for tape in self.curr_tapes:
+            cells = [tape.symbols[c] for c in tape.cells[tape.left:]]
+            head = tape.head - tape.left
+            end = len(cells)
+            while end > head + 1 and cells[end - 1] == self.B:
+                end -= 1
+            syms.append(cells[:end])
+            heads.append(head)
+        return (self.lastexit, self.numsteps, self.curr_state, self.cycle, syms, heads)
+
+    def set_result(self, result):
+        self.lastexit, self.numsteps, self.curr_state, self.cycle, syms, heads = result
+        tapes = []
+        for cells, head in zip(syms, heads):
+            tape = ArrayTape(self.B, self.symbols, self.symids)
+            tape.cells = ArrayTape.blanks(len(self.symbols), len(cells) + 1)
+            for i in range(0, len(cells)):
+                tape.cells[i] = tape.intern(cells[i])
+            tape.head = head
+            tapes.append(tape)
+        self.set_tapes(tapes)
+        if self.lastexit == 2:
+            print()
+        return {0: self.accstr, 1: self.rejstr, 2: self.halstr, 4: self.loopstr}[self.lastexit]
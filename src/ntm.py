@@ -0,0 +1,455 @@
+import multiprocessing
+from render import Renderer
+from tape import ArrayTape
+import cycle
+import tm
+
+# A nondeterministic machine may have more than one transition for the same
+# state and symbol, and accepts if any of its branches does. The search runs
+# the branches breadth-first, or depth-first with a bound on their length
+# which doubles until the whole tree fits under it, taking every transition
+# out of each configuration.
+#
+# Branches share their tapes. A configuration holds the cells left of the
+# head as a linked list of (symbol, rest) pairs, nearest first, and the cells
+# from the head rightwards likewise, so a step makes one or two new pairs and
+# shares the rest with the configuration it came from: a million branches of
+# a long tape take memory for the steps taken, not for a million tapes.
+# Blanks past the right end are left out of the list.
+#
+# Each configuration also carries the polynomial hash of its tape used by
+# cycle detection, updated in constant time per step, and configurations
+# already explored are kept by state, head position and hash, so a
+# configuration reached again is dropped. As there, a match is checked cell
+# by cell, so a hash collision never drops a configuration which is new.
+#
+# With worker processes, the tree is searched breadth-first until there are
+# SPLIT configurations to hand each worker, and the workers then search the
+# subtrees under them. Duplicates are then only dropped within a subtree and
+# the branch above it, which is enough to end every branch which loops.
+#
+# A branch which comes back to a configuration already explored is dropped
+# with it, so a machine none of whose branches accept is found to reject
+# even if some of them loop forever, as long as the tree of configurations
+# it can reach is finite.
+
+# Number of configurations to give each worker process.
+SPLIT = 8
+
+MOD = cycle.MOD
+BASE = cycle.BASE
+INV = cycle.INV
+
+
+class Config:
+    __slots__ = ('state', 'head', 'left', 'right', 'hash', 'power', 'steps', 'parent')
+
+    def __init__(self, state, head, left, right, hash, power, steps, parent):
+        self.state = state
+        self.head = head
+        self.left = left
+        self.right = right
+        self.hash = hash
+        self.power = power
+        self.steps = steps
+        self.parent = parent
+
+    # The configuration with the given state and tape, as a list of symbol
+    # ids from the left end, with the head at index 'head'.
+    @staticmethod
+    def make(state, cells, head, steps):
+        left = None
+        for c in cells[:head]:
+            left = (c, left)
+        right = None
+        for c in reversed(cells[head:]):
+            right = (c, right)
+        h = 0
+        for c in reversed(cells):
+            h = (h * BASE + c) % MOD
+        return Config(state, head, left, right, h, pow(BASE, head, MOD), steps, None)
+
+    def key(self):
+        return (self.state, self.head, self.hash)
+
+    # The tape as a list of symbol ids from the left end.
+    def cells(self):
+        cells = []
+        node = self.left
+        while node is not None:
+            cells.append(node[0])
+            node = node[1]
+        cells.reverse()
+        node = self.right
+        while node is not None:
+            cells.append(node[0])
+            node = node[1]
+        return cells
+
+    # Whether two configurations with the same key have the same tape,
+    # ignoring blanks at the right end. Lists they share are not walked.
+    def same(self, other):
+        a = self.left
+        b = other.left
+        while a is not b:
+            if a[0] != b[0]:
+                return False
+            a = a[1]
+            b = b[1]
+        a = self.right
+        b = other.right
+        while a is not b:
+            if a is None or b is None:
+                rest = a if a is not None else b
+                while rest is not None:
+                    if rest[0] != 0:
+                        return False
+                    rest = rest[1]
+                return True
+            if a[0] != b[0]:
+                return False
+            a = a[1]
+            b = b[1]
+        return True
+
+    # The configurations on the branch which led here, from the first.
+    def path(self):
+        path = []
+        config = self
+        while config is not None:
+            path.append(config)
+            config = config.parent
+        path.reverse()
+        return path
+
+    def flat(self):
+        return (self.state, self.cells(), self.head, self.steps)
+
+
+# Every transition of a machine, as a list indexed like the compiled tables
+# by state * nsym + symbol, of a tuple of (next state, write, move) for each
+# of its choices. Transitions which halt or fail have one of the codes from
+# tm in place of the next state (and the symbol itself to write, for
+# BADSYM). States only named by a choice are numbered after the machine's.
+def tables(machine, choices):
+    states = list(machine.states)
+    stateids = dict(machine.stateids)
+    transitions = []
+    Γ = set(machine.Γ)
+    for key, only in machine.δ.items():
+        q, bit = key.split(' ', 1)
+        options = []
+        for newstate, newbit, direction in choices.get(key, [only]):
+            if newstate not in stateids:
+                stateids[newstate] = len(states)
+                states.append(newstate)
+            if newbit not in Γ:
+                ns = tm.BADSYM
+            elif newstate == machine.q_a:
+                ns = tm.ACCEPT
+            elif newstate == machine.q_r:
+                ns = tm.REJECT
+            elif direction != machine.L and direction != machine.R:
+                ns = tm.BADDIR
+            elif newstate == machine.haltat:
+                ns = tm.HALTAT
+            else:
+                ns = stateids[newstate]
+            write = newbit if ns == tm.BADSYM else machine.symids[newbit]
+            options.append((ns, write, -1 if direction == machine.L else 1))
+        transitions.append((stateids[q], machine.symids[bit], tuple(options)))
+    nsym = machine.nsym
+    table = [()] * (len(states) * nsym)
+    for q, bit, options in transitions:
+        table[q * nsym + bit] = options
+    return states, stateids, table
+
+
+class Search:
+
+    def __init__(self, machine, states, table, limit, budget, first):
+        self.machine = machine
+        self.states = states
+        self.table = table
+        self.nsym = machine.nsym
+        self.haltat = states.index(machine.haltat) if machine.haltat in states else None
+        self.limit = limit
+        self.budget = budget
+        self.first = first
+        # Configurations on the way to those the search starts from, which
+        # are taken as explored already, so that a branch coming back to
+        # one of them is dropped.
+        self.ancestors = []
+        self.explored = 0
+        self.dropped = 0
+        self.depth = 0
+        # The configurations in which a branch accepted, in the order found.
+        self.accepted = []
+        # Whether any branch was cut short by the step limit, the budget or
+        # the state to halt at, so that the search cannot tell it would not
+        # have accepted.
+        self.cut = False
+
+    def done(self):
+        return (self.first and self.accepted) or (self.budget > 0 and self.explored >= self.budget)
+
+    # The path of the shortest branch found to accept, the first found of
+    # those as short, or an empty list if none has. A depth-first search
+    # does not find the shortest first.
+    def shortest(self):
+        if not self.accepted:
+            return []
+        return min(self.accepted, key=lambda config: config.steps).path()
+
+    # Take every transition out of a configuration, returning the new
+    # configurations. Branches which halt are noted and end here.
+    def expand(self, config):
+        self.explored += 1
+        if config.steps > self.depth:
+            self.depth = config.steps
+        right = config.right
+        c = right[0] if right is not None else 0
+        rest = right[1] if right is not None else None
+        options = self.table[config.state * self.nsym + c]
+        children = []
+        for ns, write, move in options:
+            if ns < 0:
+                if ns == tm.ACCEPT:
+                    self.accepted.append(config)
+                    if self.first:
+                        return children
+                    continue
+                elif ns == tm.REJECT:
+                    continue
+                elif ns == tm.BADSYM:
+                    print("Symbol '{}' on tape not recognized. Exiting.".format(write))
+                    exit(34)
+                elif ns == tm.BADDIR:
+                    print("Direction specified in δ not equal to L or R. Exiting.")
+                    exit(36)
+                ns = self.haltat
+            h = (config.hash + (write - c) * config.power) % MOD
+            if move > 0:
+                child = Config(ns, config.head + 1, (write, config.left), rest, h,
+                               config.power * BASE % MOD, config.steps + 1, config)
+            elif config.left is None:
+                child = Config(ns, config.head, None, (write, rest), h, config.power, config.steps + 1, config)
+            else:
+                child = Config(ns, config.head - 1, config.left[1], (config.left[0], (write, rest)), h,
+                               config.power * INV % MOD, config.steps + 1, config)
+            children.append(child)
+        return children
+
+    # Whether a branch may carry on from a configuration: it has not reached
+    # the state to halt at or the step limit.
+    def open(self, config):
+        if config.state == self.haltat or config.steps == self.limit:
+            self.cut = True
+            return False
+        return True
+
+    # Add a configuration to those explored, returning False if it was there
+    # already. 'seen' maps keys to a configuration, or to a list of them in
+    # the unlikely case of different tapes with the same hash.
+    def visit(self, seen, config):
+        key = config.key()
+        other = seen.get(key)
+        if other is None:
+            seen[key] = config
+            return True
+        others = other if isinstance(other, list) else [other]
+        for other in others:
+            if other.same(config):
+                self.dropped += 1
+                return False
+        seen[key] = others + [config]
+        return True
+
+    def bfs(self, roots):
+        seen = {}
+        for config in self.ancestors:
+            self.visit(seen, config)
+        frontier = [root for root in roots if self.visit(seen, root)]
+        while frontier and not self.done():
+            level = []
+            for config in frontier:
+                if self.done():
+                    self.cut = True
+                    break
+                if not self.open(config):
+                    continue
+                for child in self.expand(config):
+                    if self.visit(seen, child):
+                        level.append(child)
+            frontier = level
+        if frontier:
+            self.cut = True
+
+    # Search depth-first, to a bound on the length of branches which doubles
+    # for as long as some branch reaches it. A configuration is explored
+    # again within a round only if it is reached by a shorter branch.
+    def iddfs(self, roots):
+        bound = 1
+        while True:
+            if 0 < self.limit <= bound:
+                bound = self.limit
+            seen = {config.key(): config for config in self.ancestors}
+            stack = list(reversed(roots))
+            deeper = False
+            # Each round finds the accepting branches of the last again.
+            self.accepted = []
+            while stack and not self.done():
+                config = stack.pop()
+                key = config.key()
+                other = seen.get(key)
+                if other is not None and other.steps <= config.steps and other.same(config):
+                    self.dropped += 1
+                    continue
+                seen[key] = config
+                if config.state == self.haltat:
+                    self.cut = True
+                    continue
+                if config.steps >= bound:
+                    deeper = True
+                    continue
+                stack.extend(reversed(self.expand(config)))
+            if stack:
+                self.cut = True
+            if not deeper or stack or bound == self.limit:
+                if deeper:
+                    self.cut = True
+                return
+            bound *= 2
+
+    def run(self, roots, mode):
+        if mode == 'iddfs':
+            self.iddfs(roots)
+        else:
+            self.bfs(roots)
+
+    def report(self):
+        return (self.explored, self.dropped, self.depth, self.cut,
+                [config.flat() for config in self.shortest()], len(self.accepted))
+
+
+# The search each worker process runs, set up once by init_worker.
+worker_search = None
+
+
+def init_worker(machine, states, table, limit, budget, first):
+    global worker_search
+    worker_search = (machine, states, table, limit, budget, first)
+
+
+# Search the subtree under the last of the configurations on a branch. A
+# transition which ends the program there has printed why, and its exit code
+# is handed back instead.
+def run_subtree(job):
+    index, flats, mode = job
+    search = Search(*worker_search)
+    search.ancestors = [Config.make(*flat) for flat in flats]
+    root = search.ancestors.pop()
+    try:
+        search.run([root], mode)
+    except SystemExit as e:
+        return index, e.code
+    return (index,) + search.report()
+
+
+# Run a nondeterministic machine on its tape, searching its branches with
+# 'mode' ('bfs' or 'iddfs'). 'choices' holds every transition of the states
+# and symbols which have more than one. The search stops after exploring
+# 'budget' configurations, if it is nonzero, and at the first accepting
+# branch if 'first' is set; no branch runs past the machine's step limit.
+# Returns what run_tape would have: accept if any branch accepts, reject if
+# the whole tree was searched and none does, and abort otherwise.
+def run_ntm(machine, choices, mode='bfs', budget=0, first=False, workers=1):
+    tape = machine.curr_tape
+    if not isinstance(tape, ArrayTape):
+        tape = ArrayTape.from_linked(tape, machine.symbols, machine.symids)
+    if machine.nsym != len(machine.symbols):
+        machine.compile()
+    states, stateids, table = tables(machine, choices)
+    limit = machine.haltafter if machine.haltafter > 0 else -1
+    root = Config.make(stateids[machine.curr_state], list(tape.cells[tape.left:]), tape.head - tape.left,
+                       machine.numsteps)
+    search = Search(machine, states, table, limit, budget, first)
+    if workers is None or workers < 1:
+        workers = 1
+
+    found = 0
+    if workers == 1:
+        search.run([root], mode)
+        path = search.shortest()
+        found = len(search.accepted)
+    else:
+        # The first levels are searched here, breadth-first, to find
+        # subtrees to hand out.
+        frontier = [root]
+        seen = {}
+        search.visit(seen, root)
+        while frontier and len(frontier) < SPLIT * workers and not search.done():
+            level = []
+            for config in frontier:
+                if search.open(config):
+                    level.extend(child for child in search.expand(config) if search.visit(seen, child))
+            frontier = level
+        path = search.shortest()
+        found = len(search.accepted)
+        if frontier and not search.done():
+            share = 0
+            if budget > 0:
+                share = max(1, (budget - search.explored) // len(frontier))
+            pool = multiprocessing.Pool(min(workers, len(frontier)), init_worker,
+                                        (machine, states, table, limit, share, first))
+            try:
+                jobs = [(i, [config.flat() for config in frontier[i].path()], mode) for i in range(0, len(frontier))]
+                for result in pool.imap_unordered(run_subtree, jobs):
+                    if len(result) == 2:
+                        exit(result[1])
+                    i, explored, dropped, depth, cut, accepted, count = result
+                    search.explored += explored
+                    search.dropped += dropped
+                    search.depth = max(search.depth, depth)
+                    search.cut = search.cut or cut
+                    found += count
+                    if accepted and (not path or accepted[-1][3] < path[-1].steps):
+                        path = frontier[i].path()[:-1] + [Config.make(*flat) for flat in accepted]
+                    if first and found:
+                        break
+            finally:
+                pool.terminate()
+                pool.join()
+
+    print("Explored {} configurations to a depth of {} steps, dropping {} duplicates.".format(
+        search.explored, search.depth, search.dropped))
+    if path:
+        end = path[-1]
+        if found > 1:
+            print("{} accepting branches found; the shortest takes {} steps.".format(found, end.steps))
+        else:
+            print("An accepting branch takes {} steps.".format(end.steps))
+        if machine.debug > 0:
+            renderer = Renderer(machine.B, machine.ΓsubΣ, machine.debug, machine.langlen)
+            for config in path:
+                print("Step {}, state {}:".format(config.steps, states[config.state]))
+                print(renderer.frame(array_tape(machine, config)))
+        machine.numsteps = end.steps
+        machine.curr_tape = array_tape(machine, end)
+        machine.curr_state = machine.q_a
+        machine.lastexit = 0
+        return machine.accstr
+    if search.cut:
+        machine.lastexit = 2
+        return machine.halstr
+    machine.lastexit = 1
+    return machine.rejstr
+
+
+def array_tape(machine, config):
+    tape = ArrayTape(machine.B, machine.symbols, machine.symids)
+    cells = config.cells() + [0]
+    tape.cells = ArrayTape.blanks(len(machine.symbols), len(cells))
+    ArrayTape.put(tape.cells, 0, ''.join(map(chr, cells)))
+    tape.head = config.head
+    return tape
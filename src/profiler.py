@@ -0,0 +1,255 @@
+import json
+from tape import ArrayTape
+import tm
+
+# Profiling counts how often each transition is taken, in a list indexed by
+# its entry in the compiled table, and how often the head is on each cell,
+# in a list indexed by the cell, which is all the run loop has to do on top
+# of the compiled engine's work. Everything else is worked out from those
+# afterwards: the steps spent in each state are the sums of its transitions,
+# and the transitions of δ never taken are those left at 0. The last
+# transition, into the accept or reject state, is counted too, although it
+# is not a step, so shares of the run are given out of every transition
+# taken rather than out of the steps. The furthest cell the head has reached
+# is kept as the head moves right, and every SAMPLE steps that cell, the
+# head's position and the distance it has travelled are noted, to show how
+# they grow over the run.
+
+# Number of steps between samples.
+SAMPLE = 1 << 16
+
+# Number of rows in each table of the text report.
+TOP = 10
+
+# Number of bars in the head position histogram.
+BARS = 16
+
+
+class ProfileError(Exception):
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+class Profile:
+
+    def __init__(self, machine):
+        self.machine = machine
+        self.counts = [0] * len(machine.nexts)
+        self.heads = [0]
+        self.start = machine.numsteps
+        self.steps = 0
+        # Steps on which the head was already at the left end of the tape,
+        # and so did not move left.
+        self.stuck = 0
+        # Furthest cell from the left end of the tape the head has been on.
+        self.furthest = 0
+        self.samples = []
+
+    def travel(self):
+        return self.steps - self.stuck
+
+    def sample(self, head):
+        self.samples.append((self.start + self.steps, self.furthest, head, self.travel()))
+
+    # The transitions taken, hottest first, as (state, read, next state,
+    # write, move, count).
+    def transitions(self):
+        m = self.machine
+        rows = []
+        for i in range(0, len(self.counts)):
+            if self.counts[i] > 0:
+                state = m.states[i // m.nsym]
+                bit = m.symbols[i % m.nsym]
+                newstate, newbit, direction = m.δ[state + ' ' + bit]
+                rows.append((state, bit, newstate, newbit, direction, self.counts[i]))
+        rows.sort(key=lambda row: -row[5])
+        return rows
+
+    # Steps spent in each state, most first.
+    def states(self):
+        m = self.machine
+        rows = []
+        for q in range(0, len(m.states)):
+            count = sum(self.counts[q * m.nsym:(q + 1) * m.nsym])
+            if count > 0:
+                rows.append((m.states[q], count))
+        rows.sort(key=lambda row: -row[1])
+        return rows
+
+    # The entries of δ which were never taken, as "state symbol".
+    def never(self):
+        m = self.machine
+        keys = []
+        for key in m.δ:
+            q, bit = key.split(' ', 1)
+            if self.counts[m.stateids[q] * m.nsym + m.symids[bit]] == 0:
+                keys.append(key)
+        return keys
+
+    # The number of steps the head spent on each range of cells, as
+    # (first cell, last cell, steps), in at most 'bars' ranges of equal size.
+    def histogram(self, bars=BARS):
+        heads = self.heads[:self.furthest + 1]
+        width = -(-len(heads) // bars)
+        return [(lo, min(lo + width, len(heads)) - 1, sum(heads[lo:lo + width]))
+                for lo in range(0, len(heads), width)]
+
+    def report(self):
+        return {'steps': self.steps,
+                'transitions': [{'state': row[0], 'read': row[1], 'next': row[2], 'write': row[3],
+                                 'move': row[4], 'count': row[5]} for row in self.transitions()],
+                'states': [{'state': row[0], 'count': row[1]} for row in self.states()],
+                'never': self.never(),
+                'furthest': self.furthest,
+                'travel': self.travel(),
+                'samples': [{'step': s[0], 'furthest': s[1], 'head': s[2], 'travel': s[3]} for s in self.samples],
+                'heads': self.heads[:self.furthest + 1]}
+
+    # The report as text, with tables of the hottest transitions and states,
+    # the transitions never taken, and a histogram of the head's position.
+    # Percentages are of every transition taken, so each table adds up to
+    # 100% when it is shown whole.
+    def text(self):
+        taken = max(sum(self.counts), 1)
+        lines = ["Profile of {} steps. The head reached cell {} and travelled {} cells.".format(
+            self.steps, self.furthest, self.travel())]
+        transitions = self.transitions()
+        lines.append("")
+        lines.append("Hottest transitions:")
+        width = max([len('{} {} -> {} {} {}'.format(*row[:5])) for row in transitions[:TOP]], default=0)
+        for row in transitions[:TOP]:
+            name = '{} {} -> {} {} {}'.format(*row[:5])
+            lines.append("  {}  {:>12}  {:6.2f}%".format(name.ljust(width), row[5], 100 * row[5] / taken))
+        states = self.states()
+        lines.append("")
+        lines.append("Hottest states:")
+        width = max([len(row[0]) for row in states[:TOP]], default=0)
+        for row in states[:TOP]:
+            lines.append("  {}  {:>12}  {:6.2f}%".format(row[0].ljust(width), row[1], 100 * row[1] / taken))
+        never = self.never()
+        lines.append("")
+        lines.append("Transitions never taken: {}".format(len(never)))
+        for key in never[:TOP]:
+            lines.append("  " + key)
+        if len(never) > TOP:
+            lines.append("  ...")
+        lines.append("")
+        lines.append("Steps with the head on each range of cells:")
+        histogram = self.histogram()
+        most = max([bar[2] for bar in histogram], default=0)
+        width = len(str(histogram[-1][1]))
+        for lo, hi, count in histogram:
+            bar = '#' * round(40 * count / most) if most > 0 else ''
+            lines.append("  {:>{w}}-{:<{w}}  {:>12}  {}".format(lo, hi, count, bar, w=width))
+        if len(self.samples) > 1:
+            lines.append("")
+            lines.append("Furthest cell reached over the run:")
+            for s in self.samples[::max(1, len(self.samples) // TOP)]:
+                lines.append("  step {:>12}  furthest {:>10}  head {:>10}  travelled {:>12}".format(*s))
+        return '\n'.join(lines)
+
+
+# Run a machine with the compiled tables, profiling every step, and return
+# what run_tape would have along with the profile. As with tracing, the
+# loop is the compiled engine's with self-loops taken one step at a time,
+# and the machine is handed back to the compiled engine to halt.
+def run_profiled(machine):
+    if machine.haltat != machine.compiled_haltat or len(machine.symbols) != machine.nsym:
+        machine.compile()
+    original = machine.curr_tape
+    tape = original
+    if not isinstance(tape, ArrayTape):
+        tape = machine.curr_tape = ArrayTape.from_linked(tape, machine.symbols, machine.symids)
+    profile = Profile(machine)
+    nsym = machine.nsym
+    nexts = machine.nexts
+    writes = machine.writes
+    moves = machine.moves
+    counts = profile.counts
+    cells = tape.cells
+    left = tape.left
+    head = tape.head
+    size = len(cells)
+    # Cells are counted from the left end of the tape.
+    heads = [0] * (size - left)
+    far = head - left
+    state = machine.stateids[machine.curr_state]
+    numsteps = machine.numsteps
+    limit = machine.haltafter if machine.haltafter > 0 else -1
+    stuck = 0
+    haltat = machine.stateids.get(machine.haltat)
+    profile.furthest = far
+    profile.sample(far)
+
+    ns = 0
+    if machine.curr_state != machine.haltat:
+        while numsteps != limit:
+            stop = numsteps + SAMPLE
+            if 0 <= limit < stop:
+                stop = limit
+            while numsteps != stop:
+                i = state * nsym + cells[head]
+                ns = nexts[i]
+                if ns < 0:
+                    if ns == tm.SWEEP:
+                        ns = state
+                    elif ns == tm.HALTAT:
+                        ns = haltat
+                        stop = numsteps + 1
+                    else:
+                        break
+                counts[i] += 1
+                heads[head - left] += 1
+                cells[head] = writes[i]
+                head += moves[i]
+                if head < left:
+                    head = left
+                    stuck += 1
+                elif head - left > far:
+                    far = head - left
+                    if head == size:
+                        size = tape.grow_r()
+                        heads.extend([0] * (size - left - len(heads)))
+                state = ns
+                numsteps += 1
+            else:
+                profile.steps = numsteps - profile.start
+                profile.stuck = stuck
+                profile.furthest = far
+                profile.sample(head - left)
+                if state == haltat:
+                    break
+                continue
+            break
+    # The transition into the accept or reject state is not a step, but it
+    # is taken all the same.
+    if ns == tm.ACCEPT or ns == tm.REJECT:
+        counts[i] += 1
+
+    machine.curr_state = machine.states[state]
+    machine.numsteps = numsteps
+    tape.head = head
+    profile.steps = numsteps - profile.start
+    profile.stuck = stuck
+    profile.furthest = far
+    profile.heads = heads
+    if not profile.samples or profile.samples[-1][0] != numsteps:
+        profile.sample(head - left)
+
+    out = machine.run_compiled()
+    if tape is not original:
+        machine.curr_tape = tape.to_linked(original)
+    return out, profile
+
+
+# Write the report of a profile as JSON to the given path.
+def write_report(profile, path):
+    try:
+        with open(path, 'w') as f:
+            json.dump(profile.report(), f, ensure_ascii=False)
+            f.write('\n')
+    except OSError:
+        raise ProfileError("Profile report file at {} could not be opened. Exiting.".format(path), 40)
@@ -0,0 +1,276 @@
+import colors
+import re
+import shutil
+import sys
+import time
+from tape import ArrayTape
+
+# The renderer draws the tape for debug levels 1 and 2. Only the cells in a
+# window around the tape head that fits on the terminal are ever looked at,
+# so the cost of a frame does not depend on how long the tape is. The window
+# stays put until the head walks out of it, and is then moved to centre the
+# head again. Each cell is drawn from a piece of text cached by its symbol
+# and whether it is at (or just left of) the head, so a frame is just a join
+# of cached pieces, and the top and bottom of the debug level 2 tape are
+# cached whole, since they only depend on where the head is in the window.
+#
+# The window shows every cell from its left edge up to the last non-blank
+# cell or the head, whichever is further right, followed by one blank cell,
+# just as the whole tape used to be drawn. A tape running off either side of
+# the window is marked by '···' on that side.
+class Renderer:
+
+    def __init__(self, blank, highlighted, debug, langlen):
+        self.blank = blank
+        self.highlighted = set(highlighted)
+        self.debug = debug
+        self.langlen = langlen
+        self.ll = langlen - langlen % 2
+        # First cell in the window.
+        self.lo = 0
+        # The last head of a linked tape drawn, and its position, so that
+        # the position of the next one can be found without walking the
+        # whole list.
+        self.node = None
+        self.pos = 0
+        self.cells = {}
+        self.edges = {}
+
+    # Find the position of the head of a tape, counting from its left end.
+    def position(self, tape):
+        if isinstance(tape, ArrayTape):
+            return tape.head - tape.left
+        node = self.node
+        if tape is node:
+            pos = self.pos
+        elif node is not None and tape is node.after:
+            pos = self.pos + 1
+        elif node is not None and tape is node.prev:
+            pos = self.pos - 1
+        else:
+            pos = 0
+            node = tape.prev
+            while node is not None:
+                node = node.prev
+                pos += 1
+        self.node = tape
+        self.pos = pos
+        return pos
+
+    # Number of cells which fit in the window, leaving room for the '···'
+    # on either side.
+    def capacity(self):
+        termw, termh = shutil.get_terminal_size()
+        if self.debug == 2:
+            return max(1, (termw - 9) // (self.ll + 4))
+        return max(1, (termw - 8) // (self.langlen + 2))
+
+    # Return the text for the tape, without a trailing newline.
+    def frame(self, tape):
+        pos = self.position(tape)
+        cap = self.capacity()
+        if pos < self.lo or pos >= self.lo + cap:
+            self.lo = max(0, pos - cap // 2)
+        lo = self.lo
+
+        # Cut the window down to the cells worth drawing.
+        syms = tape.around(pos - lo, lo + cap - pos - 1)
+        end = len(syms)
+        while end > 0 and syms[end - 1] == self.blank:
+            end -= 1
+        syms = syms[:max(end + 1, pos - lo + 1)]
+
+        if self.debug == 2:
+            return self.frame_2(syms, pos - lo, lo > 0)
+        return self.frame_1(syms, pos - lo, lo > 0)
+
+    # Debug level 2 draws a box around each cell. Looks like this:
+    #┌───┬───┬───┬───┬───┬───┬───┬───╔═▼═╗────
+    #│ 0 │ 0 │ 1 │ 1 │ 0 │ 1 │ 0 │ 1 ║ B ║ ···
+    #└───┴───┴───┴───┴───┴───┴───┴───╚═▲═╝────
+    def frame_2(self, syms, index, cut):
+        key = (len(syms), index, cut)
+        if key not in self.edges:
+            self.edges[key] = (self.edge(len(syms), index, cut, '┌', '┬', '╔', '▼', '╗'),
+                               self.edge(len(syms), index, cut, '└', '┴', '╚', '▲', '╝'))
+        top, bottom = self.edges[key]
+
+        # If the tape head is at the left edge of the window, the left pillar
+        # has to be highlighted.
+        if index == 0:
+            pillar = colors.tape_box_2 + '║' + colors.default
+        else:
+            pillar = '│'
+        line = ['··· ' + pillar if cut else pillar]
+        cells = self.cells
+        for i in range(0, len(syms)):
+            role = 1 if i == index else 2 if i == index - 1 else 0
+            piece = cells.get((syms[i], role))
+            if piece is None:
+                piece = cells[(syms[i], role)] = self.cell_2(syms[i], role)
+            line.append(piece)
+        line.append(' ···')
+        return top + '\n' + ''.join(line) + '\n' + bottom
+
+    # Create the line above or below the cells, given the box drawing
+    # characters to use.
+    def edge(self, n, index, cut, first, mid, headl, arrow, headr):
+        ll = self.ll
+        box = '─' * (3 + ll)
+        line = '────' if cut else ''
+        if index > 0:
+            line += (mid if cut else first) + box + (mid + box) * (index - 1)
+        line += (colors.tape_box_2 + headl + '═' + '═' * (ll // 2)
+                 + colors.tape_head_2 + arrow + colors.tape_box_2
+                 + '═' * (ll // 2) + '═' + headr + colors.default)
+        return line + (box + mid) * (n - index - 1) + '────'
+
+    # Create the text for one cell and the pillar to its right. The role is
+    # 1 for the cell under the head, 2 for the cell just left of it, and 0
+    # otherwise; pillars next to the head are highlighted.
+    def cell_2(self, sym, role):
+        spaces = 1 + self.ll - len(sym)
+        halfsp = spaces // 2
+        psym = sym
+        if role == 1:
+            psym = colors.selected + sym + colors.default
+        elif sym in self.highlighted:
+            psym = colors.hlighted + sym + colors.default
+        piece = ' ' + ' ' * (halfsp + spaces % 2) + psym + ' ' * halfsp
+        if role > 0:
+            return piece + ' ' + colors.tape_box_2 + '║' + colors.default
+        return piece + ' │'
+
+    # If debug is 1, we instead want to print out each line looking like this:
+    # [o][o][1][1][0][1][0][1][B][···
+    def frame_1(self, syms, index, cut):
+        line = ['···' + colors.tape_1 + ']' + colors.default if cut else '']
+        cells = self.cells
+        for i in range(0, len(syms)):
+            role = 1 if i == index else 0
+            piece = cells.get((syms[i], role))
+            if piece is None:
+                piece = cells[(syms[i], role)] = self.cell_1(syms[i], role)
+            line.append(piece)
+        line.append(colors.tape_1 + '[' + colors.default + '···')
+        return ''.join(line)
+
+    def cell_1(self, sym, role):
+        if role == 1:
+            box = colors.tape_box_1
+            # The blank under the head is marked by its box alone.
+            if sym != self.blank:
+                sym = colors.selected + sym + colors.default
+        else:
+            box = colors.tape_1
+            if sym in self.highlighted:
+                sym = colors.hlighted + sym + colors.default
+        return box + '[' + colors.default + sym + box + ']' + colors.default
+
+
+# The tapes of a machine with more than one are drawn one above the other,
+# each by a renderer of its own, so each keeps its own window around its own
+# head. At debug level 1, a blank line after the tapes separates steps.
+class Stack:
+
+    def __init__(self, tapes, blank, highlighted, debug, langlen):
+        self.renderers = [Renderer(blank, highlighted, debug, langlen) for i in range(0, tapes)]
+        self.end = '\n' if debug == 1 else ''
+
+    def frame(self, tapes):
+        return '\n'.join(renderer.frame(tape) for renderer, tape in zip(self.renderers, tapes)) + self.end
+
+
+# The display writes each frame of debugging output to the terminal in a
+# single write. When animating, a frame is left up for the wait time (or
+# until a key is pressed), and is replaced by the same write which puts up
+# the next frame, so the terminal never shows half a frame. Only what has
+# changed is written: the cursor goes back up to the top of the last frame,
+# steps over each line which is the same in the next, and rewrites each other
+# line from the first cell on it that changed, at the column that cell is
+# drawn in. A frame with a different number of lines from the last replaces
+# it whole. Given a target frame rate, frames due less than a frame period
+# after the last one shown can be skipped before they are even drawn.
+#
+# A changed line is cut just after the last colors.default in the part it
+# has in common with the last frame, since the terminal is known to be back
+# to the default color there.
+ESCAPE = re.compile('\033\\[[0-9;]*[A-Za-z]')
+
+
+class Display:
+
+    def __init__(self, tflag, step, fps):
+        self.tflag = tflag
+        self.step = step
+        self.period = 1 / fps if fps > 0 else 0
+        self.animate = step or tflag > 0 or fps > 0
+        # Escape codes to wipe out the last frame, and to go back up to its
+        # top, and its lines.
+        self.erase = ''
+        self.up = ''
+        self.lines = None
+        self.shown = None
+        # Whether a frame has been skipped since the last one shown.
+        self.skipped = False
+
+    # Whether it is time to show another frame. Every frame is shown when
+    # stepping through by hand, or with no target frame rate.
+    def due(self):
+        if self.period == 0 or self.step or self.shown is None:
+            return True
+        if time.perf_counter() - self.shown >= self.period:
+            return True
+        self.skipped = True
+        return False
+
+    def show(self, text):
+        lines = text.split('\n')
+        if self.erase and self.lines is not None and len(lines) == len(self.lines):
+            sys.stdout.write(self.up + self.update(self.lines, lines))
+        else:
+            sys.stdout.write(self.erase + text + '\n')
+        sys.stdout.flush()
+        self.erase = ''
+        self.lines = None
+        self.skipped = False
+        self.shown = time.perf_counter()
+        if not self.animate:
+            return
+        if self.tflag > 0:
+            time.sleep(self.tflag)
+        if self.step:
+            input("")
+        # Go back up over the frame (and the line the key press moved down
+        # to), blank it out, and go back up again, ready for the next frame.
+        termw, termh = shutil.get_terminal_size()
+        count = len(lines) + (1 if self.step else 0)
+        self.up = '\033[F' * count
+        self.erase = self.up + (' ' * termw + '\n') * count + self.up
+        self.lines = lines
+
+    # The text which turns the last frame into the next, written from the
+    # top of the last frame and leaving the cursor just below the next, on
+    # a cleared line when stepping by hand.
+    def update(self, old, new):
+        out = []
+        for a, b in zip(old, new):
+            if a != b:
+                same = 0
+                while same < min(len(a), len(b)) and a[same] == b[same]:
+                    same += 1
+                cut = b.rfind(colors.default, 0, same) if colors.default else -1
+                cut = cut + len(colors.default) if cut >= 0 else 0
+                column = len(ESCAPE.sub('', b[:cut])) + 1
+                out.append('\033[{}G'.format(column) + b[cut:] + '\033[K')
+            out.append('\n')
+        if self.step:
+            out.append('\033[K')
+        return ''.join(out)
+
+    # Wipe out the last frame, if it is still up.
+    def finish(self):
+        if self.erase:
+            sys.stdout.write(self.erase)
+            sys.stdout.flush()
+            self.erase = ''
@@ -0,0 +1,240 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import stat
+import sys
+import batch
+import cycle
+
+# Server mode loads its machines once and then answers requests to run them,
+# given one JSON object per line, either on stdin (answering on stdout) or
+# from any number of clients connected to a Unix domain socket. A request
+# looks like
+#
+#     {"id": 7, "machine": "examples/0n1n.txt", "tape": "0011", "haltafter": 1000}
+#
+# where only "tape" is required: "machine" can be left out if only one
+# machine is loaded, "haltafter" and "cycles" default to the --haltafter and
+# --cycles given to the server, and "final" asks for the final tape in the
+# reply. Each reply is one line of JSON, such as
+#
+#     {"id": 7, "verdict": "accept", "steps": 11, "exit": 0}
+#
+# carrying the request's "id" (if it had one), since replies are sent as soon
+# as each run finishes rather than in the order the requests came in.
+#
+# Every request is first run in the server itself for a small number of
+# steps, which is all most of them need. Any still running after that are
+# run again from the start in a pool of worker processes, so a long run never
+# holds up the short ones behind it. The steps run in the server are run on
+# the event loop itself, so nothing else is read or answered while they run;
+# INLINE is kept small enough that this stall is a few milliseconds at most,
+# even with cycles.
+
+# Number of steps a request is run for in the server before it is handed to
+# the worker pool.
+INLINE = 1000
+
+# The definitions of the loaded machines by name, and the machines built
+# from them so far, in whichever process is running requests.
+worker_definitions = {}
+worker_machines = {}
+
+
+def init_worker(definitions):
+    global worker_definitions
+    worker_definitions = definitions
+    worker_machines.clear()
+
+
+# Run a machine on a tape from its initial state, and return the reply.
+# Anything the machine would print is swallowed, and errors which would exit
+# the program are replied with their exit code and message.
+def run_request(name, tape, haltafter, cycles, final):
+    machine = worker_machines.get(name)
+    if machine is None:
+        machine = worker_machines[name] = worker_definitions[name].build()
+    reply = {'verdict': 'error', 'steps': 0, 'exit': 0}
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            machine.haltafter = haltafter
+            machine.reset()
+            machine.cycle = None
+            machine.add_tape(tape)
+            if cycles and machine.tapes == 1:
+                cycle.run_cycles(machine)
+            else:
+                machine.run_tape()
+            reply['exit'] = machine.get_last_exit()
+            reply['verdict'] = batch.VERDICTS[reply['exit']]
+        except SystemExit as e:
+            reply['exit'] = e.code
+            reply['error'] = output.getvalue().strip()
+    reply['steps'] = machine.numsteps
+    if machine.cycle is not None and reply['exit'] == 4:
+        reply['cycle'] = list(machine.cycle)
+    if final and reply['verdict'] != 'error':
+        result = machine.get_result()
+        reply['tape'] = result[4]
+        reply['head'] = result[5]
+    return reply
+
+
+class Server:
+
+    # 'definitions' maps the name of each machine to its definition, and the
+    # other arguments give the defaults for requests and the size of the
+    # worker pool.
+    def __init__(self, definitions, haltafter, cycles, workers):
+        self.definitions = definitions
+        self.haltafter = int(haltafter)
+        self.cycles = cycles
+        self.workers = workers
+        self.pool = None
+        init_worker(definitions)
+
+    # Work out the reply to one line of a request.
+    async def answer(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {'verdict': 'error', 'exit': 9, 'error': "Request is not valid JSON."}
+        if not isinstance(request, dict):
+            return {'verdict': 'error', 'exit': 9, 'error': "Request is not a JSON object."}
+        reply = {'id': request['id']} if 'id' in request else {}
+
+        name = request.get('machine')
+        if name is None and len(self.definitions) == 1:
+            name = next(iter(self.definitions))
+        tape = request.get('tape')
+        haltafter = request.get('haltafter', self.haltafter)
+        cycles = bool(request.get('cycles', self.cycles))
+        final = bool(request.get('final', False))
+        if not isinstance(name, str) or name not in self.definitions:
+            reply.update({'verdict': 'error', 'exit': 11, 'error': "Machine '{}' is not loaded.".format(name)})
+            return reply
+        if not isinstance(tape, str):
+            reply.update({'verdict': 'error', 'exit': 9, 'error': "Request has no tape."})
+            return reply
+        if not isinstance(haltafter, int) or isinstance(haltafter, bool) or haltafter < 0:
+            reply.update({'verdict': 'error', 'exit': 9, 'error': "Request has a bad haltafter."})
+            return reply
+        tape = ''.join(tape.split())
+
+        # A request limited to INLINE steps or fewer is always answered
+        # here; any other is only handed on if it ran out of INLINE steps.
+        limit = min(haltafter or INLINE, INLINE)
+        result = run_request(name, tape, limit, cycles, final)
+        if limit == haltafter or result['exit'] != 2 or result['steps'] < INLINE:
+            reply.update(result)
+            return reply
+        if self.pool is None:
+            # The server has threads of its own by now, so the workers are
+            # started fresh rather than forked from it.
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.workers, multiprocessing.get_context('spawn'),
+                                                               init_worker, (self.definitions,))
+        loop = asyncio.get_event_loop()
+        reply.update(await loop.run_in_executor(self.pool, run_request, name, tape, haltafter, cycles, final))
+        return reply
+
+    # Answer one request, and write the reply with the given function.
+    async def handle(self, line, write):
+        reply = await self.answer(line)
+        await write((json.dumps(reply, ensure_ascii=False) + '\n').encode('utf-8'))
+
+    # Answer every request read with the given coroutine, which returns b''
+    # at the end, then wait for all the replies to be written. Requests are
+    # answered concurrently.
+    async def serve_lines(self, readline, write):
+        pending = set()
+        while True:
+            line = await readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            task = asyncio.ensure_future(self.handle(line, write))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+
+    async def serve_stdin(self):
+        loop = asyncio.get_event_loop()
+
+        async def readline():
+            return await loop.run_in_executor(None, sys.stdin.buffer.readline)
+
+        async def write(data):
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+
+        await self.serve_lines(readline, write)
+
+    async def serve_client(self, reader, writer):
+        async def write(data):
+            writer.write(data)
+            await writer.drain()
+
+        try:
+            await self.serve_lines(reader.readline, write)
+        except (ConnectionError, ValueError):
+            pass
+        writer.close()
+
+    async def serve_socket(self, path):
+        # Lines may hold long tapes, so allow them to be much longer than
+        # asyncio's default.
+        server = await asyncio.start_unix_server(self.serve_client, path, limit=1 << 30)
+        print("Serving {} on {}.".format(', '.join(self.definitions), path))
+        sys.stdout.flush()
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+
+
+# Serve requests for the given machines on stdin if 'socket' is '-', or on
+# the Unix domain socket at that path otherwise. Returns the exit code for
+# the program.
+def run_server(definitions, socket, haltafter=0, cycles=False, workers=None):
+    for definition in definitions.values():
+        if definition.tables is None:
+            definition.compile()
+    if workers is None or workers < 1:
+        workers = os.cpu_count() or 1
+    server = Server(definitions, haltafter, cycles, workers)
+    if socket == '-':
+        try:
+            asyncio.run(server.serve_stdin())
+        finally:
+            server.close()
+        return 0
+
+    # A socket left behind by an earlier server is replaced, but nothing
+    # else is.
+    try:
+        if stat.S_ISSOCK(os.stat(socket).st_mode):
+            os.remove(socket)
+    except OSError:
+        pass
+    try:
+        asyncio.run(server.serve_socket(socket))
+    except OSError:
+        print("Server socket at {} could not be opened. Exiting.".format(socket))
+        return 29
+    finally:
+        server.close()
+        try:
+            if stat.S_ISSOCK(os.stat(socket).st_mode):
+                os.remove(socket)
+        except OSError:
+            pass
+    return 0
@@ -0,0 +1,221 @@
+import contextlib
+import io
+import math
+import multiprocessing
+import os
+import random
+from array import array
+import batch
+import cycle
+
+# A sweep runs a machine on every string over its input alphabet up to a
+# given length, to check the language it recognizes and see how its running
+# time grows with the length of its input. Inputs are numbered within their
+# length by counting in base |Σ| with the symbols in the order SIGMA lists
+# them, and the workers are handed ranges of numbers rather than the strings
+# themselves, so very little goes back and forth between processes. Each
+# worker builds its machine once and runs every input it is given on it, as
+# in batch mode. Lengths with more strings than the sample size are sampled
+# at random, the same way each time.
+#
+# The verdicts are kept as one letter per input, in order, which is also how
+# they are written out, so a sweep of millions of inputs takes a few
+# megabytes. The steps taken by each input are kept too, for the maximum,
+# mean and percentiles of each length, and the maximum and mean are fitted
+# to a power of the length and to an exponential, whichever fits better.
+
+# Most inputs run for a single length. Lengths with more strings than this
+# are sampled.
+SAMPLE = 1000000
+
+# Steps each input is stopped after, unless --haltafter is given.
+LIMIT = 100000
+
+# Inputs handed to a worker at a time.
+CHUNK = 4096
+
+LETTERS = {'accept': 'A', 'reject': 'R', 'abort': 'H', 'loop': 'L', 'error': 'E'}
+
+# The machine each worker process runs, set up once by init_worker.
+worker_machine = None
+worker_alphabet = None
+worker_cycles = False
+
+
+def init_worker(machine, alphabet, cycles):
+    global worker_machine, worker_alphabet, worker_cycles
+    worker_machine = machine
+    worker_alphabet = alphabet
+    worker_cycles = cycles
+
+
+# The input of the given length with the given number.
+def nth(alphabet, length, index):
+    base = len(alphabet)
+    chars = [alphabet[0]] * length
+    for i in range(length - 1, -1, -1):
+        index, digit = divmod(index, base)
+        chars[i] = alphabet[digit]
+    return ''.join(chars)
+
+
+# Run the worker's machine on the inputs of one length with the given
+# numbers, and return the length, the letter for each verdict and the steps
+# each took. Anything the machine would print is swallowed, and an input
+# which would exit the program is an error.
+def run_inputs(job):
+    length, indices = job
+    machine = worker_machine
+    letters = []
+    steps = array('q')
+    with contextlib.redirect_stdout(io.StringIO()):
+        for index in indices:
+            try:
+                machine.reset()
+                machine.cycle = None
+                machine.add_tape(nth(worker_alphabet, length, index))
+                if worker_cycles:
+                    cycle.run_cycles(machine)
+                else:
+                    machine.run_tape()
+                letters.append(LETTERS[batch.VERDICTS.get(machine.get_last_exit(), 'error')])
+            except SystemExit:
+                letters.append(LETTERS['error'])
+            steps.append(machine.numsteps)
+    return length, ''.join(letters), steps
+
+
+# The numbers of the inputs to run of one length: all of them, or 'sample'
+# of them picked at random if there are more.
+def numbers(base, length, sample):
+    total = base ** length
+    if total <= sample:
+        return range(0, total)
+    rng = random.Random(length)
+    chosen = set()
+    while len(chosen) < sample:
+        chosen.add(rng.randrange(total))
+    return sorted(chosen)
+
+
+# The value at fraction p of the way through a sorted list.
+def percentile(values, p):
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+# Fit y = a * x^b and y = a * b^x to the given points by least squares on
+# the logarithm of y, and return the better as (kind, a, b, R²), with kind
+# 'power' or 'exponential'. Points with x or y below 1 are left out, and
+# None is returned if fewer than three are left.
+def fit(points):
+    points = [(x, y) for x, y in points if x >= 1 and y >= 1]
+    if len(points) < 3:
+        return None
+    ys = [math.log(y) for x, y in points]
+    best = None
+    for kind, xs in (('power', [math.log(x) for x, y in points]), ('exponential', [x for x, y in points])):
+        n = len(xs)
+        mx = sum(xs) / n
+        my = sum(ys) / n
+        sxx = sum((x - mx) ** 2 for x in xs)
+        slope = sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / sxx
+        intercept = my - slope * mx
+        total = sum((y - my) ** 2 for y in ys)
+        residual = sum((y - intercept - slope * x) ** 2 for x, y in zip(xs, ys))
+        r2 = 1 - residual / total if total > 0 else 1.0
+        b = slope if kind == 'power' else math.exp(slope)
+        if best is None or r2 > best[3]:
+            best = (kind, math.exp(intercept), b, r2)
+    return best
+
+
+def describe(result):
+    if result is None:
+        return "too few lengths to fit"
+    kind, a, b, r2 = result
+    if kind == 'power':
+        return "{:.3g} * n^{:.2f} (R² {:.4f})".format(a, b, r2)
+    return "{:.3g} * {:.3f}^n (R² {:.4f})".format(a, b, r2)
+
+
+# Run a machine on every input up to 'length' symbols long (sampling 'sample'
+# inputs of any length with more) with the given number of worker processes,
+# stopping each after the machine's haltafter steps, or LIMIT if it has no
+# limit. A table of the verdicts and steps for each length is printed, with
+# the fitted growth of the steps, and the verdict of every input is written
+# to 'output' if it is given. Returns the exit code for the program.
+def run_sweep(machine, length, workers, output, sample=SAMPLE, cycles=False):
+    alphabet = [c for c in machine.Σ if len(c) == 1]
+    if machine.haltafter <= 0:
+        machine.haltafter = LIMIT
+    sample = max(sample, 1)
+    sampled = set()
+    jobs = []
+    for n in range(0, max(length, 0) + 1):
+        inputs = numbers(len(alphabet), n, sample)
+        if isinstance(inputs, list):
+            sampled.add(n)
+        for i in range(0, len(inputs), CHUNK):
+            jobs.append((n, inputs[i:i + CHUNK]))
+    if workers is None or workers < 1:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+
+    try:
+        out = open(output, 'w') if output is not None else None
+    except OSError:
+        print("Sweep output file at {} could not be opened. Exiting.".format(output))
+        return 46
+
+    letters = {}
+    steps = {}
+    if workers == 1:
+        init_worker(machine, alphabet, cycles)
+        results = map(run_inputs, jobs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers, init_worker, (machine, alphabet, cycles))
+        results = pool.imap(run_inputs, jobs)
+    try:
+        for n, chunk, counts in results:
+            letters.setdefault(n, []).append(chunk)
+            steps.setdefault(n, array('q')).extend(counts)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    print("{:>6} {:>9} {:>9} {:>9} {:>7} {:>7} {:>7} {:>11} {:>11} {:>9} {:>9} {:>9}".format(
+        'length', 'inputs', 'accept', 'reject', 'abort', 'loop', 'error', 'max steps', 'mean steps',
+        'median', 'p90', 'p99'))
+    maxima = []
+    means = []
+    for n in sorted(letters):
+        verdicts = ''.join(letters[n])
+        values = sorted(steps[n])
+        mean = sum(values) / len(values)
+        maxima.append((n, values[-1]))
+        means.append((n, mean))
+        print("{:>6} {:>9} {:>9} {:>9} {:>7} {:>7} {:>7} {:>11} {:>11.1f} {:>9} {:>9} {:>9}".format(
+            str(n) + ('*' if n in sampled else ''), len(values), verdicts.count('A'), verdicts.count('R'),
+            verdicts.count('H'), verdicts.count('L'), verdicts.count('E'), values[-1], mean,
+            percentile(values, 0.5), percentile(values, 0.9), percentile(values, 0.99)))
+    if sampled:
+        print("* sampled, {} inputs of each.".format(sample))
+    print("")
+    print("Max steps grow like {}.".format(describe(fit(maxima))))
+    print("Mean steps grow like {}.".format(describe(fit(means))))
+
+    if out is not None:
+        with out:
+            out.write("# Inputs over {}, one letter per input in order: A accept, R reject, "
+                      "H abort, L loop, E error.\n".format(' '.join(alphabet)))
+            for n in sorted(letters):
+                verdicts = ''.join(letters[n])
+                if n in sampled:
+                    inputs = [index for chunk in jobs if chunk[0] == n for index in chunk[1]]
+                    out.write("{} sampled {}\n".format(n, ' '.join(
+                        '{}:{}'.format(nth(alphabet, n, index), letter) for index, letter in zip(inputs, verdicts))))
+                else:
+                    out.write("{} {}\n".format(n, verdicts))
+    return 0
@@ -1,11 +1,22 @@
-import colors
-import shutil
+import codecs
+import os
+from array import array
+
+# Tape files are read this many bytes at a time.
+CHUNK = 1 << 24
+
+# Largest window run_length compares at once, in cells.
+WINDOW = 1 << 20
+
+# Characters skipped in tape files.
+WHITESPACE = b' \t\n\r\v\f\x1c\x1d\x1e\x1f'
 
 # The tape structure is a doubly-linked list with no access to
 # its head or tail. Each space contains a character 'bit', and
 # we store a blank character. 'None' is used for blank nodes.
 class Tape:
-    
+    __slots__ = ('bit', 'blank', 'prev', 'after')
+
     def __init__(self, blank, bit, prev=None, after=None):
         self.bit = bit
         self.blank = blank
@@ -18,10 +29,12 @@ class Tape:
     @staticmethod
     def gen_tape(tapestr, alphabet, blank):
         t = Tape(blank, blank, None, None)
+        allowed = set(alphabet)
+        allowed.add(blank)
         # reverse the string
         s = tapestr[::-1]
         for i in range(0, len(s)):
-            if s[i] not in alphabet and s[i] != blank:
+            if s[i] not in allowed:
                 print("Symbol on initial tape not in input alphabet. Exiting.")
                 exit(32)
             # add each character's node to the left of the previous one.
@@ -60,189 +73,290 @@ class Tape:
         newr = Tape(self.blank, newbit, self, self.after)
         self.after = newr
 
-    # Print the tape, depending on the current debug settings.
-    # Debug = 0 means no printing occurs. Debug = 1 prints a 
-    # minimal array representation on a single line. Debug = 2
-    # prints a full, ASCII art tape with pretty colors.
-    def print_tape(self, highlighted, direction, debug=2, langlen=1):
-
-        # Make a copy of our linked list, go all the way to the
-        # left, and then walk it to build up an array containing
-        # all of the elements of the tape for easy formatting.
-        arr = []
-        index = 0
-        head = self.l()
-        prevhead = self
-        # Go as far left as possible.
-        while prevhead != head:
-            temp = head.l()
-            prevhead = head
-            head = temp
-            index += 1
-        curr = head
-        # Walk the list and add to array.
-        while curr is not None and curr.read() != self.blank:
-            arr.append(curr.read())
-            curr = curr.r()
-        
-        # Full, pretty tape printing. Looks like this:
-        #┌───┬───┬───┬───┬───┬───┬───┬───╔═▼═╗────
-        #│ 0 │ 0 │ 1 │ 1 │ 0 │ 1 │ 0 │ 1 ║ B ║ ···
-        #└───┴───┴───┴───┴───┴───┴───┴───╚═▲═╝────
-        if debug == 2:
-            termw, termh = shutil.get_terminal_size()
-            ll = langlen - langlen % 2
-            # Between middle boxes, we use the character '┬', but at the
-            # beginning we need '┌'.
-            openboxt = '┌───' + '─' * ll
-            openboxb = '└───' + '─' * ll
-            if index == 0:
-                openboxt = ''
-                openboxb = ''
-                index = 0
-
-            # create a line looking like this: ┌───┬───┬───┬───┬───┬───┬───┬───╔═▼═╗────
-            overlines = (openboxt 
-                        + (('┬───' + '─' * ll) * (index - 1)) 
-                        + (colors.tape_box_2 + '╔═' + '═' * (ll // 2) 
-                        + colors.tape_head_2 + '▼' + colors.tape_box_2
-                        + '═' * (ll // 2) + '═╗' + colors.default)
-                        + (('─' * ll + '───┬') * (len(arr) - index)) 
-                        + '────')
-            
-            toomanychars = False
-            if len(overlines) > termw:
-                toomanychars = True
-                difflen = len(overlines) - termw
-                csperelem = len(overlines) / len(arr)
-                overby = int(difflen / (csperelem))
-                arr = arr[:len(arr) - overby]
-                index = min(index, len(arr))
-                if index >= len(arr):
-                    overlines = (openboxt 
-                                + (('┬───' + '─' * ll) * (index - 1)) 
-                                + colors.tape_box_2 + '╔═' + '═' * (ll // 2) 
-                                + '═' 
-                                + '═' * (ll // 2) 
-                                + '══' + colors.default)
-                else:
-                    overlines = (openboxt 
-                                + (('┬───' + '─' * ll) * (index - 1)) 
-                                + (colors.tape_box_2 + '╔═' + '═' * (ll // 2) 
-                                + colors.tape_head_2 + '▼' + colors.tape_box_2 
-                                + '═' * (ll // 2) + '═╗' + colors.default) 
-                                + ('─' * ll + '───┬') * (len(arr) - index - 1) 
-                                + '────')
-
-            # create a line looking like this: └───┴───┴───┴───┴───┴───┴───┴───╚═▲═╝────
-            if toomanychars:
-                if index >= len(arr):
-                    underlines = (openboxb 
-                                 + (('┴───' + '─' * ll) * (index - 1)) 
-                                 + colors.tape_box_2 + '╚═' + '═' * (ll // 2) 
-                                 + '═' 
-                                 + '═' * (ll // 2) 
-                                 + '══' + colors.default)
-                else:
-                    underlines = (openboxb 
-                                 + (('┴───' + '─' * ll) * (index - 1)) 
-                                 + (colors.tape_box_2 + '╚═' + '═' * (ll // 2)
-                                 + colors.tape_head_2 + '▲' + colors.tape_box_2
-                                 + '═' * (ll // 2) + '═╝' + colors.default) 
-                                 + ('─' * ll + '───┴') * (len(arr) - index - 1)
-                                 + '────')
-            else:
-                underlines = (openboxb 
-                             + (('┴───' + '─' * ll) * (index - 1)) 
-                             + (colors.tape_box_2 + '╚═' + '═' * (ll // 2) 
-                             + colors.tape_head_2 + '▲' + colors.tape_box_2 
-                             + '═' * (ll // 2) + '═╝' + colors.default) 
-                             + (('─' * ll + '───┴') * (len(arr) - index)) 
-                             + '────')
-            print(overlines)
-            
-            # If we are at the tape head, before even starting, i.e. the head is at
-            # the beginning of the tape, the left pillar has to be highlighted.
-            if index == 0:
-                print(colors.tape_box_2 + '║' + colors.default, end='')
+    # Return the symbols in the cells from 'before' cells left of this one
+    # to 'after' cells right of it, without adding any cells to the tape.
+    # There must be at least 'before' cells to the left.
+    def around(self, before, after):
+        node = self
+        for i in range(0, before):
+            node = node.prev
+        syms = []
+        for i in range(0, before + after + 1):
+            if node is None:
+                syms.append(self.blank)
             else:
-                print('│', end='')
-
-            # Looping through the elements in the array, we want to print out vertical
-            # bars between the characters on the tape, with the tape head highlighted
-            # with thicker vertical bars. We keep track of how far away from the tape
-            # head we are in 'index'
-            for elem in arr:
-                lenbox = 1 + ll
-                spaces = lenbox - len(elem)
-                exsp = spaces % 2
-                halfsp = spaces // 2
-                pelem = elem
-                if index == 0:
-                    pelem = colors.selected + elem + colors.default
-                elif elem in highlighted:
-                    pelem = colors.hlighted + elem + colors.default
-                
-                print(' ' + ' ' * (halfsp + exsp) 
-                      + pelem 
-                      + ' ' * (halfsp), end='')
-                
-                if index == 1 or index == 0:
-                    print(' ' + colors.tape_box_2 
-                          + '║' + colors.default, end='')
-                else:
-                    print(' │', end='')
-                index -= 1
-            # If the tape head is on the blank space, we want to highlight the blank
-            # manually.
-            if not toomanychars:
-                if index == 0:
-                    print(' ' + ' ' * (ll // 2) 
-                          + colors.selected + self.blank + colors.default 
-                          + ' ' + ' ' * (ll // 2) 
-                          + colors.tape_box_2 + '║' + colors.default + ' ···')
-                else:
-                    print(' ' + ' ' * (ll // 2) 
-                          + self.blank 
-                          + ' ' + ' ' * (ll // 2) + '│ ···')
-            else:
-                if index == 0 and direction == 'R':
-                    #➤
-                    print(colors.tape_head_2 + ' ⮞⮞⮞' + colors.default)
-                elif index == 0 and direction == 'L':
-                    print(colors.tape_head_2 + ' ⮜⮜⮜' + colors.default)
-                else:
-                    print(' ···')
-            print(underlines)
-
-        # If debug is 1, we instead want to print out each line looking like this:
-        # [o][o][1][1][0][1][0][1][B][···
-        # coloring is done using index, as above.
-        elif debug == 1:
-            for elem in arr:
-                if index == 0:
-                    print(colors.tape_box_1 + '[' + colors.default, end='')
-                    print(colors.selected + elem + colors.default, end='')
+                syms.append(node.bit)
+                node = node.after
+        return syms
+
+
+# The array tape holds the same tape as a contiguous buffer of symbol ids,
+# with the tape head kept as an index into it. This costs one byte per cell
+# rather than a whole Python object per cell. Symbol 0 is always the blank,
+# so the buffer is extended with blanks simply by appending zeros; it grows
+# by doubling at either end. The 'symbols' list and 'ids' dictionary map ids
+# to symbols and back, and may be shared with the machine using the tape.
+class ArrayTape:
+    __slots__ = ('blank', 'symbols', 'ids', 'cells', 'left', 'head')
+
+    def __init__(self, blank, symbols=None, ids=None):
+        if symbols is None:
+            symbols = [blank]
+            ids = {blank: 0}
+        self.blank = blank
+        self.symbols = symbols
+        self.ids = ids
+        self.cells = ArrayTape.blanks(len(symbols), 1)
+        self.left = 0
+        self.head = 0
+
+    # Create a buffer of n blank cells, wide enough to hold nsym symbols.
+    @staticmethod
+    def blanks(nsym, n):
+        if nsym <= 256:
+            return bytearray(n)
+        elif nsym <= 65536:
+            return array('H', bytes(2 * n))
+        return array('L', bytes(array('L').itemsize * n))
+
+    # This method creates a tape from a string, exactly as Tape.gen_tape
+    # does, with the head on the first character.
+    @staticmethod
+    def gen_tape(tapestr, alphabet, blank, symbols=None, ids=None):
+        t = ArrayTape(blank, symbols, ids)
+        allowed = set(alphabet)
+        allowed.add(blank)
+        for c in set(tapestr):
+            if c not in allowed:
+                print("Symbol on initial tape not in input alphabet. Exiting.")
+                exit(32)
+            t.intern(c)
+        cells = ArrayTape.blanks(len(t.symbols), len(tapestr) + 1)
+        ArrayTape.put(cells, 0, tapestr.translate({ord(c): t.ids[c] for c in set(tapestr)}))
+        t.cells = cells
+        return t
+
+    # Create a tape from a file, as gen_tape does from its contents with the
+    # whitespace taken out, without ever holding them as a string. The file
+    # is read a chunk at a time straight into a buffer the size of the file:
+    # the bytes of each chunk are checked against the alphabet by deleting
+    # the allowed ones, and turned into symbol ids by translating them
+    # through a table, both at C speed. A file with characters outside ASCII
+    # is decoded from there on, a chunk at a time, and its characters are
+    # checked and translated the same way.
+    @staticmethod
+    def load(path, alphabet, blank, symbols=None, ids=None):
+        t = ArrayTape(blank, symbols, ids)
+        chars = [c for c in alphabet if len(c) == 1]
+        if len(blank) == 1:
+            chars.append(blank)
+        # Every symbol which can be on the tape is given an id up front, so
+        # the table is never out of date and the buffer never widens.
+        for c in chars:
+            t.intern(c)
+        narrow = [c for c in chars if ord(c) < 128]
+        table = bytearray(256)
+        for c in narrow:
+            table[ord(c)] = t.ids[c]
+        valid = bytes(ord(c) for c in narrow) + WHITESPACE
+        table = bytes(table) if len(t.symbols) <= 256 else None
+        texts = {ord(c): t.ids[c] for c in chars}
+        decoder = None
+        with open(path, 'rb') as f:
+            cells = ArrayTape.blanks(len(t.symbols), os.fstat(f.fileno()).st_size + 1)
+            n = 0
+            while True:
+                chunk = f.read(CHUNK)
+                if decoder is None and chunk.translate(None, valid):
+                    if chunk.isascii():
+                        ArrayTape.invalid()
+                    decoder = codecs.getincrementaldecoder('utf-8')()
+                if decoder is None and table is not None:
+                    data = chunk.translate(table, WHITESPACE)
+                    cells[n:n + len(data)] = data
+                    n += len(data)
                 else:
-                    print(colors.tape_1 + '[' + colors.default, end='')
-                    if elem in highlighted:
-                        print(colors.hlighted + elem + colors.default, end='')
+                    if decoder is not None:
+                        try:
+                            text = decoder.decode(chunk, not chunk)
+                        except UnicodeDecodeError:
+                            ArrayTape.invalid()
                     else:
-                        print(elem, end='')
-                if index == 0:
-                    print(colors.tape_box_1 + ']' + colors.default, end='')
-                else:
-                    print(colors.tape_1 + ']' + colors.default, end='')
-                index -= 1
-
-            if index == 0:
-                print(colors.tape_box_1 + '[' + colors.default 
-                      + self.blank 
-                      + colors.tape_box_1 + ']' + colors.default 
-                      + colors.tape_1 + '[' + colors.default + '···', end='')
-            else:
-                print(colors.tape_1 + '[' + colors.default 
-                      + self.blank 
-                      + colors.tape_1 + ']' + colors.default 
-                      + colors.tape_1 + '[' + colors.default + '···', end='')
+                        text = chunk.decode('ascii')
+                    for c in set(text):
+                        if ord(c) not in texts:
+                            if not c.isspace():
+                                ArrayTape.invalid()
+                            texts[ord(c)] = None
+                    n = ArrayTape.put(cells, n, text.translate(texts))
+                if not chunk:
+                    break
+        del cells[n + 1:]
+        t.cells = cells
+        return t
+
+    @staticmethod
+    def invalid():
+        print("Symbol on initial tape not in input alphabet. Exiting.")
+        exit(32)
+
+    # Write a string of symbol ids, each held as the character with that
+    # code, into a buffer starting at index n, and return the index after
+    # the last one written.
+    @staticmethod
+    def put(cells, n, ids):
+        if isinstance(cells, bytearray):
+            cells[n:n + len(ids)] = ids.encode('latin-1')
+        else:
+            cells[n:n + len(ids)] = array(cells.typecode, map(ord, ids))
+        return n + len(ids)
+
+    # Copy a linked list tape into a new array tape, keeping the position
+    # of the tape head.
+    @staticmethod
+    def from_linked(tape, symbols=None, ids=None):
+        t = ArrayTape(tape.blank, symbols, ids)
+        node = tape
+        while node.prev is not None:
+            node = node.prev
+            t.head += 1
+        bits = []
+        while node is not None:
+            bits.append(t.intern(node.bit))
+            node = node.after
+        t.cells = ArrayTape.blanks(len(t.symbols), len(bits))
+        for i in range(0, len(bits)):
+            t.cells[i] = bits[i]
+        return t
+
+    # Write the contents of this tape back over the linked list tape
+    # containing the given node, extending it to the right where needed,
+    # and return the node under the tape head.
+    def to_linked(self, tape):
+        node = tape
+        while node.prev is not None:
+            node = node.prev
+        headnode = node
+        for i in range(self.left, len(self.cells)):
+            node.bit = self.symbols[self.cells[i]]
+            if i == self.head:
+                headnode = node
+            if i < len(self.cells) - 1 and node.after is None:
+                node.add_r(self.blank)
+            node = node.after
+        return headnode
+
+    # Return the id of a symbol, giving it a new id if it has none yet.
+    def intern(self, bit):
+        if bit not in self.ids:
+            self.ids[bit] = len(self.symbols)
+            self.symbols.append(bit)
+            if len(self.symbols) == 257 or len(self.symbols) == 65537:
+                cells = ArrayTape.blanks(len(self.symbols), len(self.cells))
+                for i in range(0, len(self.cells)):
+                    cells[i] = self.cells[i]
+                self.cells = cells
+        return self.ids[bit]
+
+    # Double the buffer to the right, returning its new length.
+    def grow_r(self):
+        self.cells.extend(ArrayTape.blanks(len(self.symbols), len(self.cells)))
+        return len(self.cells)
+
+    # Grow the buffer to the right, in one go, to hold at least n cells.
+    def grow_to(self, n):
+        if n > len(self.cells):
+            self.cells.extend(ArrayTape.blanks(len(self.symbols), n - len(self.cells)))
+        return len(self.cells)
+
+    # Double the buffer to the left. Indices into the buffer shift over.
+    def grow_l(self):
+        n = len(self.cells)
+        cells = ArrayTape.blanks(len(self.symbols), n)
+        cells.extend(self.cells)
+        self.cells = cells
+        self.left += n
+        self.head += n
+
+    # Count how many cells in a row hold the symbol id 'bit', starting at
+    # index i and walking right if step is 1 or left if it is -1, up to the
+    # ends of the buffer. Byte buffers are compared a window at a time, with
+    # the window doubling in size up to WINDOW, so long runs are counted at
+    # C speed without copying much of the buffer at once.
+    def run_length(self, i, bit, step):
+        cells = self.cells
+        if isinstance(cells, bytearray):
+            pad = bytes((bit,))
+            w = 16
+            if step > 0:
+                j = i
+                while j < len(cells):
+                    chunk = cells[j:j + w]
+                    rest = len(chunk.lstrip(pad))
+                    if rest:
+                        return j + len(chunk) - rest - i
+                    j += len(chunk)
+                    w = min(2 * w, WINDOW)
+                return len(cells) - i
+            j = i + 1
+            while j > self.left:
+                lo = max(self.left, j - w)
+                rest = len(cells[lo:j].rstrip(pad))
+                if rest:
+                    return i + 1 - lo - rest
+                j = lo
+                w = min(2 * w, WINDOW)
+            return i + 1 - self.left
+        n = 0
+        end = len(cells) if step > 0 else self.left - 1
+        while i != end and cells[i] == bit:
+            n += 1
+            i += step
+        return n
+
+    # Set every cell with an index in [lo, hi) to the symbol id 'bit'.
+    def fill(self, lo, hi, bit):
+        if isinstance(self.cells, bytearray):
+            self.cells[lo:hi] = bytes((bit,)) * (hi - lo)
+        else:
+            self.cells[lo:hi] = array(self.cells.typecode, [bit]) * (hi - lo)
+
+    def r(self):
+        self.head += 1
+        if self.head == len(self.cells):
+            self.grow_r()
+        return self
+
+    # As with the linked list, moving left off the end of the tape
+    # leaves the head where it is.
+    def l(self):
+        if self.head > self.left:
+            self.head -= 1
+        return self
+
+    def read(self):
+        return self.symbols[self.cells[self.head]]
+
+    def write(self, bit):
+        old = self.read()
+        self.cells[self.head] = self.intern(bit)
+        return old
+
+    def add_l(self, newbit):
+        bit = self.intern(newbit)
+        if self.head == self.left:
+            if self.left == 0:
+                self.grow_l()
+            self.left -= 1
+            self.cells[self.left] = bit
+        else:
+            self.cells.insert(self.head, bit)
+            self.head += 1
+
+    def add_r(self, newbit):
+        self.cells.insert(self.head + 1, self.intern(newbit))
 
+    def around(self, before, after):
+        ids = self.cells[self.head - before:self.head + after + 1]
+        syms = [self.symbols[i] for i in ids]
+        return syms + [self.blank] * (before + after + 1 - len(syms))
@@ -1,16 +1,58 @@
-from tape import Tape
+from tape import Tape, ArrayTape
+from render import Renderer, Display
 import colors
 import time
 import shutil
 
+# Codes stored in place of a next state in the compiled transition table.
+# Any negative entry sends the compiled engine off its fast path; they are
+# listed in the order the reference engine checks for them.
+MISSING = -1
+BADSYM = -2
+ACCEPT = -3
+REJECT = -4
+BADDIR = -5
+HALTAT = -6
+# Not a halting code: a transition which stays in the same state, and so
+# sweeps across every cell holding the symbol it reads in one operation.
+SWEEP = -7
+# Not a halting code either: a breakpoint set by the debugger, at which the
+# compiled engine stops before taking the transition, as if it had paused.
+# Tables only hold these while the debugger is running them.
+BREAK = -8
+
+# Number of steps run between looks at the clock, when running against a
+# deadline.
+SLICE = 4096
+
+# Everything a TM works out for itself from the machine definition, rather
+# than from the options it is run with. These can be saved from one TM and
+# handed to another made from the same definition, which then has nothing
+# left to work out.
+TABLES = ('maxlen', 'langlen', 'ΓsubΣ', 'symbols', 'symids', 'states', 'stateids',
+          'nexts', 'writes', 'moves', 'compiled_haltat', 'nsym', 'source')
+
+
+# A machine sweeping right over the blanks past the end of its tape, with no
+# step limit, never halts, and no tape could hold everywhere it goes, so the
+# run just waits to be stopped by Ctrl+C.
+def forever():
+    while True:
+        time.sleep(1)
+
 class TM:
 
+    # Number of tapes. Machines with more than one are run by
+    # multitape.MultiTM.
+    tapes = 1
+
     # Our core turing machine structure is essentially the classic
     # 7-tuple with some fluff: the debug level, the time step between
     # animation steps, the name of the machine, and the blank character.
-    def __init__(self, debug, tflag, haltafter, haltat, step, name, B, Q, Σ, Γ, q_0, q_a, q_r, δ):
+    def __init__(self, debug, tflag, haltafter, haltat, step, name, B, Q, Σ, Γ, q_0, q_a, q_r, δ, reference=False, linked=False, fps=0, tables=None):
         self.debug = debug
         self.tflag = tflag
+        self.fps = fps
         self.haltafter = haltafter
         self.haltat = haltat
         self.lastexit = 0
@@ -37,16 +79,22 @@ class TM:
                                        "└────────────────────┘" + '\n'
                                        + colors.default)
 
+        self.loopstr = (colors.abort + "┌────────────────────┐" + '\n' +
+                                       "│    ┬  ┌─┐┌─┐┌─┐    │" + '\n' +
+                                       "│    │  │ ││ │├─┘    │" + '\n' +
+                                       "│    ┴─┘└─┘└─┘┴      │" + '\n' +
+                                       "└────────────────────┘" + '\n'
+                                       + colors.default)
+
         if debug != 2:
             self.accstr = colors.accept + "Accept" + colors.default
             self.rejstr = colors.reject + "Reject" + colors.default
             self.halstr = colors.abort + "Abort" + colors.default
-
-        # Store the number of characters in the longest state, for formatting.
-        self.maxlen = max([len(q) for q in Q])
-        self.langlen = max([len(g) for g in Γ])
+            self.loopstr = colors.abort + "Loop" + colors.default
 
         self.numsteps = 0
+        # The (start, period) of the cycle found by cycle detection.
+        self.cycle = None
         self.name = name
         self.B = B
         self.Q = Q
@@ -54,7 +102,6 @@ class TM:
         # PEP 3131 in 2007 (Python 3.0).
         self.Σ = Σ
         self.Γ = Γ
-        self.ΓsubΣ = [s for s in Γ if s not in Σ and s != B]
         self.q_0 = q_0
         self.q_a = q_a
         self.q_r = q_r
@@ -63,28 +110,344 @@ class TM:
         self.curr_state = q_0
         self.R = 'R'
         self.L = 'L'
+        self.reference = reference
+        self.linked = linked
+        if tables is not None:
+            self.set_tables(tables)
+        else:
+            # Store the number of characters in the longest state, for formatting.
+            self.maxlen = max([len(q) for q in Q])
+            self.langlen = max([len(g) for g in Γ])
+            self.ΓsubΣ = [s for s in Γ if s not in Σ and s != B]
+            self.symbols = [B]
+            self.symids = {B: 0}
+        if tables is None or self.compiled_haltat != haltat:
+            self.compile()
+
+    # The tables worked out from the definition (see TABLES above).
+    def get_tables(self):
+        return {name: getattr(self, name) for name in TABLES}
+
+    # Take tables from another TM. The symbols are copied, since tapes may
+    # add to them.
+    def set_tables(self, tables):
+        for name in TABLES:
+            setattr(self, name, tables[name])
+        self.symbols = list(self.symbols)
+        self.symids = dict(self.symids)
 
     # Run the gen_tape function on the string tape to create our
-    # tape data structure.
+    # tape data structure. Unless a linked list tape was asked for, the
+    # tape shares the machine's symbol ids so the compiled engine can run
+    # directly over its buffer.
     def add_tape(self, tape):
-        self.curr_tape = Tape.gen_tape(tape, self.Σ, self.B)
+        if self.linked:
+            self.curr_tape = Tape.gen_tape(tape, self.Σ, self.B)
+        else:
+            self.curr_tape = ArrayTape.gen_tape(tape, self.Σ, self.B, self.symbols, self.symids)
+
+    # Read the tape from a file, as add_tape would from the file's contents
+    # with the whitespace taken out. However long the file, it is read
+    # straight into an array tape, which a linked list is made from if one
+    # was asked for.
+    def load_tape(self, path):
+        tape = ArrayTape.load(path, self.Σ, self.B, self.symbols, self.symids)
+        self.curr_tape = tape.to_linked(Tape(self.B, self.B)) if self.linked else tape
 
     def remove_tape(self):
         self.curr_tape = None
 
-    # This is the core of the machine. Here we run through 
-    # each state of the Turing machine.
+    # Put the machine back in its start state, ready to run another tape.
+    def reset(self):
+        self.curr_state = self.q_0
+        self.numsteps = 0
+        self.lastexit = 0
+
+    # Intern every state and symbol to a small integer and flatten δ into
+    # three parallel lists (next state, symbol to write, head movement)
+    # indexed by state * len(symbols) + symbol. The blank is always symbol 0.
+    # Transitions which halt or fail store one of the codes above instead of
+    # a next state, so the compiled engine never builds strings or scans Γ.
+    # Symbol ids are only ever added to, since tapes may share them.
+    def compile(self):
+        self.states = []
+        self.stateids = {}
+
+        def symbol(sym):
+            if sym not in self.symids:
+                self.symids[sym] = len(self.symbols)
+                self.symbols.append(sym)
+            return self.symids[sym]
+
+        def state(q):
+            if q not in self.stateids:
+                self.stateids[q] = len(self.states)
+                self.states.append(q)
+            return self.stateids[q]
+
+        symbol(self.B)
+        for sym in self.Γ + self.Σ:
+            symbol(sym)
+        for q in self.Q + [self.q_0, self.q_a, self.q_r]:
+            state(q)
+        # Most states and symbols are already numbered by now, so look them up
+        # directly and only fall back on numbering them.
+        stateids = self.stateids
+        symids = self.symids
+        transitions = []
+        for key, (newstate, newbit, direction) in self.δ.items():
+            q, bit = key.split(' ', 1)
+            transitions.append((stateids[q] if q in stateids else state(q),
+                                symids[bit] if bit in symids else symbol(bit),
+                                stateids[newstate] if newstate in stateids else state(newstate),
+                                symids[newbit] if newbit in symids else symbol(newbit),
+                                newbit, direction))
+
+        nsym = len(self.symbols)
+        size = len(self.states) * nsym
+        self.nexts = [MISSING] * size
+        self.writes = [0] * size
+        self.moves = [0] * size
+        Γ = set(self.Γ)
+        for q, bit, newq, write, newbit, direction in transitions:
+            i = q * nsym + bit
+            newstate = self.states[newq]
+            if newbit not in Γ:
+                self.nexts[i] = BADSYM
+            elif newstate == self.q_a:
+                self.nexts[i] = ACCEPT
+            elif newstate == self.q_r:
+                self.nexts[i] = REJECT
+            elif direction != self.L and direction != self.R:
+                self.nexts[i] = BADDIR
+            elif newstate == self.haltat:
+                self.nexts[i] = HALTAT
+            elif newq == q:
+                self.nexts[i] = SWEEP
+            else:
+                self.nexts[i] = newq
+            self.writes[i] = write
+            self.moves[i] = -1 if direction == self.L else 1
+        self.compiled_haltat = self.haltat
+        self.nsym = nsym
+        # The source of the generated engine (see codegen.py), written the
+        # first time it is needed for these tables.
+        self.source = None
+
+    # Pick an engine: the compiled one whenever nothing has to be printed
+    # between steps, and the original step-by-step one otherwise.
     def run_tape(self):
-        # Until the machine explicitly halts or aborts, run.
-        termw, termh = shutil.get_terminal_size()
+        if self.debug == 0 and not self.reference:
+            return self.run_compiled()
+        return self.run_reference()
+
+    # The compiled engine. This behaves exactly like run_reference at debug
+    # level 0, but runs over the tables built by compile(). If 'pause' is
+    # given, the machine stops once it has taken that many steps in all, and
+    # None is returned unless it has halted; running it again carries on.
+    # It is also returned when a breakpoint (BREAK) is reached.
+    def run_compiled(self, pause=-1):
+        tape = self.curr_tape
+        if not isinstance(tape, ArrayTape):
+            tape = ArrayTape.from_linked(tape, self.symbols, self.symids)
+        if self.haltat != self.compiled_haltat or len(self.symbols) != self.nsym:
+            self.compile()
+        nsym = self.nsym
+        nexts = self.nexts
+        writes = self.writes
+        moves = self.moves
+        cells = tape.cells
+        head = tape.head
+        left = tape.left
+        size = len(cells)
+        state = self.stateids[self.curr_state]
+        numsteps = self.numsteps
+        limit = self.haltafter if self.haltafter > 0 else -1
+        # Pausing is stopping at a step limit without aborting.
+        pausing = pause >= 0 and (limit < 0 or pause < limit)
+        paused = False
+        if pausing:
+            limit = pause
+        # The machine may already be sitting in the state to halt at.
+        ns = HALTAT
+        if self.curr_state != self.haltat:
+            ns = 0
+            while numsteps != limit:
+                i = state * nsym + cells[head]
+                ns = nexts[i]
+                if ns < 0:
+                    # A self-loop repeats for as long as the head keeps reading
+                    # the same symbol, so the whole run is rewritten at once,
+                    # stopping early if the step limit falls inside it.
+                    if ns == SWEEP:
+                        move = moves[i]
+                        run = tape.run_length(head, cells[head], move)
+                        # Every cell past the right end of the tape is blank,
+                        # so a sweep right over blanks which reaches it goes
+                        # on to the step limit, and the tape is grown once to
+                        # fit the whole of it.
+                        if move > 0 and cells[head] == 0 and head + run == size:
+                            if limit < 0:
+                                forever()
+                            run = limit - numsteps
+                            size = tape.grow_to(head + run + 1)
+                        if 0 <= limit - numsteps < run:
+                            run = limit - numsteps
+                        if move > 0:
+                            if writes[i] != cells[head]:
+                                tape.fill(head, head + run, writes[i])
+                            head += run
+                            if head == size:
+                                size = tape.grow_r()
+                        else:
+                            if writes[i] != cells[head]:
+                                tape.fill(head - run + 1, head + 1, writes[i])
+                            head -= run
+                            if head < left:
+                                head = left
+                        numsteps += run
+                        continue
+                    if ns == HALTAT:
+                        cells[head] = writes[i]
+                        head += moves[i]
+                        if head < left:
+                            head = left
+                        elif head == size:
+                            size = tape.grow_r()
+                        state = self.stateids[self.haltat]
+                        numsteps += 1
+                    break
+                cells[head] = writes[i]
+                head += moves[i]
+                if head < left:
+                    head = left
+                elif head == size:
+                    size = tape.grow_r()
+                state = ns
+                numsteps += 1
+            else:
+                paused = pausing
+
+        self.numsteps = numsteps
+        self.curr_state = self.states[state]
+        tape.head = head
+        if tape is not self.curr_tape:
+            self.curr_tape = tape.to_linked(self.curr_tape)
+
+        if paused or ns == BREAK:
+            return None
+        elif ns == MISSING:
+            self.lastexit = 1
+            return self.rejstr
+        elif ns == BADSYM:
+            print("Symbol '{}' on tape not recognized. Exiting.".format(self.symbols[writes[i]]))
+            exit(34)
+        elif ns == ACCEPT:
+            self.curr_state = self.q_a
+            self.lastexit = 0
+            return self.accstr
+        elif ns == REJECT:
+            self.curr_state = self.q_r
+            self.lastexit = 1
+            return self.rejstr
+        elif ns == BADDIR:
+            print("Direction specified in δ not equal to L or R. Exiting.")
+            exit(36)
+
+        self.lastexit = 2
+        print()
+        return self.halstr
+
+    # Run the machine a few steps at a time. This is a generator which yields
+    # the number of steps taken so far after every 'every' steps (or never,
+    # if 'every' is 0), and once the machine halts returns what run_tape
+    # would have. A different number of steps until the next yield may be
+    # sent to it. Nothing is lost by dropping it partway through: the machine
+    # is left as it was after the last step, and a new call carries on from
+    # there. With debugging on, each step is drawn just as run_tape would.
+    def steps(self, every=1):
+        if self.debug == 0 and not self.reference:
+            while True:
+                out = self.run_compiled(self.numsteps + every if every > 0 else -1)
+                if out is not None:
+                    return out
+                sent = yield self.numsteps
+                if sent:
+                    every = sent
 
+        renderer = self.renderer()
+        display = Display(self.tflag, self.step, self.fps)
+        moves = self.transitions()
+        move = None
+        n = 0
+        while True:
+            # Taking the next transition from the reference engine also
+            # takes the one before it, so this is where the machine is
+            # between steps.
+            try:
+                move = next(moves)
+            except StopIteration as stop:
+                return self.halt(stop.value, move, renderer, display)
+            if every > 0 and n == every:
+                n = 0
+                sent = yield self.numsteps
+                if sent:
+                    every = sent
+            if self.debug > 0:
+                self.draw(move, renderer, display)
+            n += 1
+
+    # Run for at most 'max_steps' more steps, stopping early once
+    # time.perf_counter() passes 'deadline', if either is given. Returns
+    # what run_tape would have if the machine halts, and None if it was
+    # stopped first, in which case calling run again carries on.
+    def run(self, max_steps=None, deadline=None):
+        start = self.numsteps
+
+        # Number of steps to take before looking at the limits again.
+        def budget():
+            n = SLICE if deadline is not None else 0
+            if max_steps is not None:
+                left = max_steps - (self.numsteps - start)
+                n = min(n, left) if n > 0 else left
+            return n
+
+        if max_steps is not None and max_steps <= 0:
+            return None
+        steps = self.steps(budget())
+        try:
+            next(steps)
+            while True:
+                if max_steps is not None and self.numsteps - start >= max_steps:
+                    return None
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return None
+                steps.send(budget())
+        except StopIteration as stop:
+            return stop.value
+
+    # This is the core of the machine. Here we run through each state of
+    # the Turing machine, showing every step if debugging is on.
+    def run_reference(self):
+        try:
+            next(self.steps(0))
+        except StopIteration as stop:
+            return stop.value
+
+    # The original step-by-step engine, as a generator. Each transition is
+    # yielded as (bit read, next state, symbol to write, direction) before
+    # it is taken, and is taken when the generator is resumed. Once the
+    # machine stops, the reason is returned as one of the codes above, with
+    # HALTAT standing for any abort.
+    def transitions(self):
+        # Until the machine explicitly halts or aborts, run.
         while True:
 
             if self.haltafter > 0 and self.numsteps == self.haltafter:
-                break
+                return HALTAT
 
             if self.curr_state == self.haltat:
-                break
+                return HALTAT
 
             bit = self.curr_tape.read()
             # attempt to extract a transition corresponding to this current bit on
@@ -93,127 +456,23 @@ class TM:
             try:
                 newstate, newbit, direction = self.δ[self.curr_state + ' ' + bit]
             except KeyError:
-                if self.debug > 0:
-                    print("No valid transition function found from state {} on input {}".format(self.curr_state, bit))
-                self.lastexit = 1
-                return self.rejstr
+                return MISSING
 
-            # Store a copy of the bit-to-write so we can add color codes to it.
-            printbit = newbit
+            yield bit, newstate, newbit, direction
 
-            # Print out the state and turing machine tape.
-            if self.debug == 2:
-                # Create a 5-character word for the direction we're moving.
-                move = 'RIGHT'
-                if direction == 'L':
-                    move = 'LEFT '
-                if newstate == self.q_a:
-                    move = '     '
-                    printbit = ' '
-                
-                # Store the raw length of every string we're going to print, as
-                # adding color codes changes the length.
-                writelen = len('│ WRITE: {} '.format(printbit))
-                statelen = len('│ STATE: {} '.format(self.curr_state) + ' ' * (self.maxlen - len(self.curr_state)))
-                readlen = len('│ READ: {} '.format(bit))
-                gotolen = len('│ GO TO: {} '.format(newstate) + ' ' * (self.maxlen - len(newstate)))
-                movelen = len('│ MOVE: {} │'.format(move))
-
-                # Format the box for printing the state. Looks like this:
-                #┌─────────────┬─────────┬──────────┬─────────────┬─────────────┐
-                #│ STATE: q0   │ READ: 0 │ WRITE: 1 │ GO TO: q1   │ MOVE: LEFT  │
-                #└─────────────┴─────────┴──────────┴─────────────┴─────────────┘
-                state = '│ ' + colors.state_text + 'STATE: ' + colors.default + '{} '.format(self.curr_state) + ' ' * (self.maxlen - len(self.curr_state))
-                read = '│ ' + colors.state_text + 'READ: ' + colors.default + '{} '.format(bit)
-                if bit == printbit:
-                    write = '│ ' + colors.state_text + 'WRITE: {} '.format(colors.default + printbit)
-                else:
-                    write = '│ ' + colors.state_text + 'WRITE: {} '.format(colors.changed_bit + printbit + colors.default)
-                if newstate == self.q_a:
-                    goto = '│ ' + colors.state_text + 'GO TO: ' + colors.default + '{} '.format(colors.accept + newstate + colors.default) + ' ' * (self.maxlen - len(newstate))
-                elif newstate == self.q_r:
-                    goto = '│ ' + colors.state_text + 'GO TO: ' + colors.default + '{} '.format(colors.reject + newstate + colors.default) + ' ' * (self.maxlen - len(newstate))
-                else:
-                    goto = '│ ' + colors.state_text + 'GO TO: ' + colors.default + '{} '.format(newstate) + ' ' * (self.maxlen - len(newstate))
-                move = '│ ' + colors.state_text + 'MOVE: {} │     '.format(colors.default + move)
-
-                top = '┌' + (statelen - 1) * '─' + '┬' + (readlen - 1) * '─' + '┬' + (writelen - 1) * '─' + '┬' + (gotolen - 1) * '─' + '┬' + (movelen - 2) * '─' + '┐     '
-                mid = state + read + write + goto + move
-                bottom = '└' + (statelen - 1) * '─' + '┴' + (readlen - 1) * '─' + '┴' + (writelen - 1) * '─' + '┴' + (gotolen - 1) * '─' + '┴' + (movelen - 2) * '─' + '┘     '
-                print(top)
-                print(mid)
-                print(bottom)
-                
-            # If our debug level is 1 or 2, print the tape. The print function
-            # handles the difference between debug level 1 and 2.
-            # We print a newline after, to separate states.
-            if self.debug > 0:
-                self.curr_tape.print_tape(self.ΓsubΣ, direction, self.debug, self.langlen)
-                print("")
-
-            # If tflag is nonzero, then the user has requested an animated
-            # output and we need to deal with that. If debug level is 2, then
-            # we have six lines of input.
-            if self.debug == 2 and (self.step == True or self.tflag > 0):
-                # first, sleep after we have printed out the step for the desired time.
-                if self.tflag > 0:
-                    time.sleep(self.tflag)
-                if self.step == True:
-                    input("")
-                # Bring the terminal output cursor up six lines.
-                for i in range(0, 7):
-                    print('\033[F', end = '')
-                # store the length of the biggest line of output in tapecs.
-                spaces = ' ' * termw
-                # flush the output clear, by printing out that many spaces.
-                for i in range(0, 6):
-                    print(spaces)
-                if self.tflag > 0:
-                    print(spaces)
-                # After flushing, go back up six lines again, in preparation for
-                # printing out the next frame of our output.
-                for i in range(0, 7):
-                    print('\033[F', end = '')
-                
-            # If we have debug == 1, we do the same thing, except we only
-            # have one line of output.
-            elif self.debug == 1 and (self.step == True or self.tflag > 0):
-                if self.tflag > 0:
-                    time.sleep(self.tflag)
-                if self.step == True:
-                    input("")
-
-                time.sleep(self.tflag)
-                print('\033[F', end = '')
-                if self.step == True:
-                    print('\033[F', end = '')
-                spaces = ' ' * termw
-                print(spaces)
-                if self.step == True:
-                    print(spaces)
-                print('\033[F', end = '')
-                if self.step == True:
-                    print('\033[F', end = '')
-    
             # Check that the bits we're dealing with, and the state
             # we are being sent to, are in their respective sets.
             if newbit not in self.Γ:
-                print("Symbol '{}' on tape not recognized. Exiting.".format(newbit))
-                exit(34)
-                
+                return BADSYM
+
             # Send the machine to the next state
             self.curr_state = newstate
 
             # If we have reached an accept or reject state, end the machine.
-            if self.debug == 2 and (newstate == self.q_a or newstate == self.q_r):
-                spaces = ' ' * termw
-                print(spaces)
             if newstate == self.q_a:
-                self.lastexit = 0
-                return self.accstr
+                return ACCEPT
             elif newstate == self.q_r:
-                self.lastexit = 1
-                return self.rejstr
+                return REJECT
 
             # Write to the tape in accordance with the state we were at.
             self.curr_tape.write(newbit)
@@ -225,14 +484,167 @@ class TM:
             elif direction == self.R:
                 self.curr_tape = self.curr_tape.r()
             else:
-                print("Direction specified in δ not equal to L or R. Exiting.")
-                exit(36)
+                return BADDIR
 
             self.numsteps += 1
 
+    # Draw a transition about to be taken by the reference engine.
+    def draw(self, move, renderer, display):
+        bit, newstate, newbit, direction = move
+
+        # Store a copy of the bit-to-write so we can add color codes to it.
+        printbit = newbit
+
+        # We show a frame, unless we are running faster than the target
+        # frame rate. The frame before the machine halts or fails is always
+        # shown.
+        show = (display.due()
+                or newstate == self.q_a or newstate == self.q_r
+                or newstate == self.haltat
+                or self.numsteps + 1 == self.haltafter
+                or self.fails(newbit, direction))
+        if not show:
+            return
+
+        # Print out the state and turing machine tape.
+        if self.debug == 2:
+            move = self.heading(direction)
+            if newstate == self.q_a:
+                move = '     '
+                printbit = ' '
+            
+            # Store the raw length of every string we're going to print, as
+            # adding color codes changes the length.
+            writelen = len('│ WRITE: {} '.format(printbit))
+            statelen = len('│ STATE: {} '.format(self.curr_state) + ' ' * (self.maxlen - len(self.curr_state)))
+            readlen = len('│ READ: {} '.format(bit))
+            gotolen = len('│ GO TO: {} '.format(newstate) + ' ' * (self.maxlen - len(newstate)))
+            movelen = len('│ MOVE: {} │'.format(move))
+
+            # Format the box for printing the state. Looks like this:
+            #┌─────────────┬─────────┬──────────┬─────────────┬─────────────┐
+            #│ STATE: q0   │ READ: 0 │ WRITE: 1 │ GO TO: q1   │ MOVE: LEFT  │
+            #└─────────────┴─────────┴──────────┴─────────────┴─────────────┘
+            state = '│ ' + colors.state_text + 'STATE: ' + colors.default + '{} '.format(self.curr_state) + ' ' * (self.maxlen - len(self.curr_state))
+            read = '│ ' + colors.state_text + 'READ: ' + colors.default + '{} '.format(bit)
+            if bit == printbit:
+                write = '│ ' + colors.state_text + 'WRITE: {} '.format(colors.default + printbit)
+            else:
+                write = '│ ' + colors.state_text + 'WRITE: {} '.format(colors.changed_bit + printbit + colors.default)
+            if newstate == self.q_a:
+                goto = '│ ' + colors.state_text + 'GO TO: ' + colors.default + '{} '.format(colors.accept + newstate + colors.default) + ' ' * (self.maxlen - len(newstate))
+            elif newstate == self.q_r:
+                goto = '│ ' + colors.state_text + 'GO TO: ' + colors.default + '{} '.format(colors.reject + newstate + colors.default) + ' ' * (self.maxlen - len(newstate))
+            else:
+                goto = '│ ' + colors.state_text + 'GO TO: ' + colors.default + '{} '.format(newstate) + ' ' * (self.maxlen - len(newstate))
+            move = '│ ' + colors.state_text + 'MOVE: {} │     '.format(colors.default + move)
+
+            top = '┌' + (statelen - 1) * '─' + '┬' + (readlen - 1) * '─' + '┬' + (writelen - 1) * '─' + '┬' + (gotolen - 1) * '─' + '┬' + (movelen - 2) * '─' + '┐     '
+            mid = state + read + write + goto + move
+            bottom = '└' + (statelen - 1) * '─' + '┴' + (readlen - 1) * '─' + '┴' + (writelen - 1) * '─' + '┴' + (gotolen - 1) * '─' + '┴' + (movelen - 2) * '─' + '┘     '
+            # A blank line after the tape separates states.
+            display.show('\n'.join([top, mid, bottom, self.frame(renderer), '']))
+        else:
+            display.show(self.frame(renderer))
+
+    # Whether a transition writes a symbol not in Γ or moves in a direction
+    # other than L or R, and so fails.
+    def fails(self, newbit, direction):
+        return newbit not in self.Γ or (direction != self.L and direction != self.R)
+
+    # A 5-character word for the direction we're moving.
+    def heading(self, direction):
+        if direction == self.L:
+            return 'LEFT '
+        return 'RIGHT'
+
+    # The renderer for debugging output, and the text it draws for the tape.
+    def renderer(self):
+        return Renderer(self.B, self.ΓsubΣ, self.debug, self.langlen)
+
+    def frame(self, renderer):
+        return renderer.frame(self.curr_tape)
+
+    # The symbol under the head.
+    def read(self):
+        return self.curr_tape.read()
+
+    # Finish a run of the reference engine which stopped for the given
+    # reason, after the given transition (if it got as far as one).
+    def halt(self, code, move, renderer, display):
+        if code == MISSING:
+            self.end_frames(renderer, display)
+            if self.debug > 0:
+                print("No valid transition function found from state {} on input {}".format(self.curr_state, self.read()))
+            self.lastexit = 1
+            return self.rejstr
+        elif code == BADSYM:
+            display.finish()
+            print("Symbol '{}' on tape not recognized. Exiting.".format(move[2]))
+            exit(34)
+        elif code == ACCEPT or code == REJECT:
+            display.finish()
+            if self.debug == 2:
+                termw, termh = shutil.get_terminal_size()
+                spaces = ' ' * termw
+                print(spaces)
+            if code == ACCEPT:
+                self.lastexit = 0
+                return self.accstr
+            self.lastexit = 1
+            return self.rejstr
+        elif code == BADDIR:
+            display.finish()
+            print("Direction specified in δ not equal to L or R. Exiting.")
+            exit(36)
+
+        self.end_frames(renderer, display)
         self.lastexit = 2
         print()
         return self.halstr
 
+    # Finish off the frames shown by run_reference. If the frame for the
+    # last step was skipped, the tape as the machine left it is shown instead.
+    def end_frames(self, renderer, display):
+        if display.skipped:
+            if self.debug == 2:
+                display.show(self.frame(renderer) + '\n')
+            else:
+                display.show(self.frame(renderer))
+        display.finish()
+
     def get_last_exit(self):
-        return self.lastexit
\ No newline at end of file
+        return self.lastexit
+
+    # The outcome of the last run, which can be saved and handed to
+    # set_result to leave a machine exactly where this run left it without
+    # running it again: the exit code, the number of steps, the state, the
+    # cycle found (if any), and the tape as a list of its symbols from the
+    # left end up to the last non-blank cell or the head, whichever is
+    # further right, with the position of the head in it.
+    def get_result(self):
+        tape = self.curr_tape
+        if not isinstance(tape, ArrayTape):
+            tape = ArrayTape.from_linked(tape)
+        syms = [tape.symbols[c] for c in tape.cells[tape.left:]]
+        head = tape.head - tape.left
+        end = len(syms)
+        while end > head + 1 and syms[end - 1] == self.B:
+            end -= 1
+        return (self.lastexit, self.numsteps, self.curr_state, self.cycle, syms[:end], head)
+
+    # Put the machine where a saved run left it, and print and return what
+    # running it would have.
+    def set_result(self, result):
+        self.lastexit, self.numsteps, self.curr_state, self.cycle, syms, head = result
+        tape = ArrayTape(self.B, self.symbols, self.symids)
+        tape.cells = ArrayTape.blanks(len(self.symbols), len(syms) + 1)
+        for i in range(0, len(syms)):
+            tape.cells[i] = tape.intern(syms[i])
+        tape.head = head
+        if self.linked:
+            tape = tape.to_linked(Tape(self.B, self.B))
+        self.curr_tape = tape
+        if self.lastexit == 2:
+            print()
+        return {0: self.accstr, 1: self.rejstr, 2: self.halstr, 4: self.loopstr}[self.lastexit]
\ No newline at end of file
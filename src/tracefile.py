@@ -0,0 +1,354 @@
+import bisect
+import json
+import struct
+import sys
+from array import array
+from tape import ArrayTape
+import checkpoint
+import tm
+
+# A trace is a record of every step of a run, in a binary file which can be
+# read back to find the configuration of the machine after any step. Each
+# step is recorded as the index of the transition it took in the compiled
+# tables, state * nsym + symbol read, which with the tables gives the state,
+# the symbol read, the symbol written, the move and the next state. That
+# takes one byte a step for machines with up to 256 entries in their tables,
+# two for up to 65536, and four otherwise.
+#
+# After a line naming the format and a line of JSON describing the machine,
+# the file is a series of frames, each starting with one byte saying what it
+# is:
+#
+#     K  a keyframe: the whole configuration, as in a checkpoint
+#     R  a count (4 bytes, little-endian) and that many step records
+#     X  the index: a line of JSON listing the step and file offset of
+#        every keyframe, followed by the offset of the X (8 bytes)
+#
+# A keyframe is written before the first step, and again whenever the steps
+# since the last one outnumber both KEYFRAME and the cells on the tape, so
+# keyframes never take up more of the file than the records do. Finding the
+# configuration after a step is then a binary search of the index for the
+# last keyframe before it, and a replay of the records from there. A trace
+# cut short, say by Ctrl+C, has no index, and is scanned frame by frame for
+# its keyframes instead.
+MAGIC = b'TM TRACE 1\n'
+
+# Number of steps recorded between writes to the file.
+BLOCK = 1 << 16
+
+# Least number of steps between keyframes.
+KEYFRAME = 1 << 18
+
+
+class TraceError(Exception):
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.message = message
+        self.code = code
+
+
+# The typecode of an array just wide enough to hold indices into tables of
+# the given size.
+def typecode(size):
+    if size <= 256:
+        return 'B'
+    elif size <= 65536:
+        return 'H'
+    return 'I' if array('I').itemsize >= 4 else 'L'
+
+
+class Writer:
+
+    def __init__(self, f, machine, key, code):
+        self.f = f
+        self.key = key
+        self.keyframes = []
+        self.steps = machine.numsteps
+        header = {'machine': key, 'haltat': machine.haltat, 'typecode': code,
+                  'width': array(code).itemsize, 'byteorder': sys.byteorder}
+        f.write(MAGIC)
+        f.write(json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n')
+
+    def keyframe(self, machine):
+        self.keyframes.append((machine.numsteps, self.f.tell()))
+        self.f.write(b'K')
+        checkpoint.write(self.f, machine, self.key)
+
+    def records(self, records):
+        if records:
+            self.f.write(b'R' + struct.pack('<I', len(records)))
+            self.f.write(records)
+            self.steps += len(records)
+
+    def close(self):
+        offset = self.f.tell()
+        index = {'keyframes': self.keyframes, 'steps': self.steps}
+        self.f.write(b'X' + json.dumps(index).encode('utf-8') + b'\n')
+        self.f.write(struct.pack('<Q', offset))
+        self.f.close()
+
+
+# Run a machine with the compiled tables, recording every step to a trace at
+# the given path, and return what run_tape would have. The loop is the
+# compiled engine's, except that self-loops are stepped one at a time; the
+# machine is handed back to the compiled engine to halt. The trace is closed
+# properly even if the run is cut short by an exception, such as the
+# SystemExit of Ctrl+C.
+def run_traced(machine, key, path):
+    if machine.haltat != machine.compiled_haltat or len(machine.symbols) != machine.nsym:
+        machine.compile()
+    try:
+        f = open(path, 'wb')
+    except OSError:
+        raise TraceError("Trace file at {} could not be written. Exiting.".format(path), 37)
+    original = machine.curr_tape
+    tape = original
+    if not isinstance(tape, ArrayTape):
+        tape = machine.curr_tape = ArrayTape.from_linked(tape, machine.symbols, machine.symids)
+    nsym = machine.nsym
+    nexts = machine.nexts
+    writes = machine.writes
+    moves = machine.moves
+    cells = tape.cells
+    head = tape.head
+    left = tape.left
+    size = len(cells)
+    state = machine.stateids[machine.curr_state]
+    numsteps = machine.numsteps
+    limit = machine.haltafter if machine.haltafter > 0 else -1
+    records = array(typecode(len(nexts)))
+    append = records.append
+    base = numsteps
+
+    writer = Writer(f, machine, key, records.typecode)
+    writer.keyframe(machine)
+    last = numsteps
+    try:
+        if machine.curr_state != machine.haltat:
+            while numsteps != limit:
+                stop = numsteps + BLOCK
+                if 0 <= limit < stop:
+                    stop = limit
+                while numsteps != stop:
+                    i = state * nsym + cells[head]
+                    ns = nexts[i]
+                    if ns < 0:
+                        if ns == tm.SWEEP:
+                            ns = state
+                        elif ns == tm.HALTAT:
+                            ns = machine.stateids[machine.haltat]
+                            stop = numsteps + 1
+                        else:
+                            break
+                    cells[head] = writes[i]
+                    head += moves[i]
+                    if head < left:
+                        head = left
+                    elif head == size:
+                        size = tape.grow_r()
+                    state = ns
+                    append(i)
+                    numsteps += 1
+                else:
+                    writer.records(records)
+                    del records[:]
+                    base = numsteps
+                    if state == machine.stateids.get(machine.haltat):
+                        break
+                    if numsteps - last >= max(KEYFRAME, size - left):
+                        machine.curr_state = machine.states[state]
+                        machine.numsteps = numsteps
+                        tape.head = head
+                        writer.keyframe(machine)
+                        last = numsteps
+                    continue
+                break
+    finally:
+        machine.curr_state = machine.states[state]
+        machine.numsteps = numsteps
+        tape.head = head
+        # A step interrupted after being recorded, but before being
+        # counted, is left out.
+        writer.records(records[:numsteps - base])
+        writer.close()
+
+    out = machine.run_compiled()
+    if tape is not original:
+        machine.curr_tape = tape.to_linked(original)
+    return out
+
+
+class Reader:
+
+    # Open a trace of a run of the machine from the file with the given key,
+    # and read its index.
+    def __init__(self, path, machine, key):
+        self.path = path
+        self.machine = machine
+        try:
+            self.f = open(path, 'rb')
+        except OSError:
+            raise self.unreadable()
+        try:
+            if self.f.readline() != MAGIC:
+                raise ValueError
+            self.header = json.loads(self.f.readline().decode('utf-8'))
+            self.code = self.header['typecode']
+            if array(self.code).itemsize != self.header['width']:
+                raise ValueError
+            self.start = self.f.tell()
+        except (ValueError, KeyError, TypeError):
+            raise self.unreadable()
+        if self.header['machine'] != key or (self.header['haltat'] is not None
+                                             and self.header['haltat'] not in machine.stateids):
+            raise TraceError("Trace at {} was not recorded of this machine. Exiting.".format(path), 38)
+        self.index()
+
+    def unreadable(self):
+        return TraceError("Trace file at {} could not be read. Exiting.".format(self.path), 37)
+
+    # Find the steps and offsets of the keyframes, and the last step.
+    def index(self):
+        f = self.f
+        try:
+            end = f.seek(-8, 2)
+            offset = struct.unpack('<Q', f.read(8))[0]
+            if 0 < offset < end:
+                f.seek(offset)
+                if f.read(1) == b'X':
+                    index = json.loads(f.readline().decode('utf-8'))
+                    if f.tell() == end:
+                        self.keyframes = [(k[0], k[1]) for k in index['keyframes']]
+                        self.steps = index['steps']
+                        return
+        except (OSError, ValueError, KeyError, TypeError, IndexError, struct.error):
+            pass
+        self.scan()
+
+    # Find the keyframes of a trace without an index by reading it from the
+    # start. Only the headers of frames are read; their contents are skipped.
+    def scan(self):
+        f = self.f
+        f.seek(self.start)
+        self.keyframes = []
+        self.steps = None
+        width = self.header['width']
+        while True:
+            offset = f.tell()
+            kind = f.read(1)
+            if kind == b'K':
+                try:
+                    header = json.loads(f.readline().decode('utf-8'))
+                    f.seek(header['cells'] * header['width'], 1)
+                    self.keyframes.append((header['steps'], offset))
+                    self.steps = header['steps']
+                except (ValueError, KeyError, TypeError):
+                    break
+            elif kind == b'R' and self.steps is not None:
+                count = f.read(4)
+                if len(count) < 4:
+                    break
+                count = struct.unpack('<I', count)[0]
+                # A block cut off at the end of the file holds only as many
+                # records as were written.
+                written = (f.seek(0, 2) - offset - 5) // width
+                self.steps += min(count, written)
+                if written < count:
+                    break
+                f.seek(offset + 5 + count * width)
+            else:
+                break
+        if not self.keyframes:
+            raise self.unreadable()
+
+    # The first and last steps in the trace.
+    def span(self):
+        return self.keyframes[0][0], self.steps
+
+    # Put the machine in the configuration it was in after the given step.
+    def seek(self, step):
+        machine = self.machine
+        first, last = self.span()
+        if not first <= step <= last:
+            raise TraceError("Step {} is not in the trace at {}, which has steps {} to {}. Exiting.".format(step, self.path, first, last), 39)
+        if machine.haltat != self.header['haltat']:
+            machine.haltat = self.header['haltat']
+        if machine.haltat != machine.compiled_haltat:
+            machine.compile()
+        k = bisect.bisect_right(self.keyframes, (step, float('inf'))) - 1
+        f = self.f
+        f.seek(self.keyframes[k][1])
+        try:
+            if f.read(1) != b'K':
+                raise ValueError
+            header, source = checkpoint.read(f)
+            if header['state'] not in machine.stateids:
+                raise ValueError
+            checkpoint.restore(machine, header, source)
+            if machine.numsteps != self.keyframes[k][0]:
+                raise ValueError
+            self.replay(step)
+        except (ValueError, IndexError, KeyError, TypeError, struct.error):
+            raise self.unreadable()
+
+    # Carry the machine on from a keyframe to the given step, with the
+    # records that follow it.
+    def replay(self, step):
+        machine = self.machine
+        if machine.numsteps == step:
+            return
+        if len(machine.symbols) != machine.nsym:
+            machine.compile()
+        nsym = machine.nsym
+        nexts = machine.nexts
+        writes = machine.writes
+        moves = machine.moves
+        tape = machine.curr_tape
+        if not isinstance(tape, ArrayTape):
+            tape = ArrayTape.from_linked(tape, machine.symbols, machine.symids)
+        cells = tape.cells
+        head = tape.head
+        left = tape.left
+        size = len(cells)
+        f = self.f
+        width = self.header['width']
+        numsteps = machine.numsteps
+        i = None
+        while numsteps < step:
+            if f.read(1) != b'R':
+                raise ValueError
+            count = struct.unpack('<I', f.read(4))[0]
+            n = min(count, step - numsteps)
+            records = array(self.code)
+            records.frombytes(f.read(n * width))
+            f.seek((count - n) * width, 1)
+            if self.header['byteorder'] != sys.byteorder:
+                records.byteswap()
+            if len(records) < n:
+                raise ValueError
+            for i in records:
+                cells[head] = writes[i]
+                head += moves[i]
+                if head < left:
+                    head = left
+                elif head == size:
+                    size = tape.grow_r()
+            numsteps += n
+
+        # Only the last step decides the state the machine is left in.
+        ns = nexts[i]
+        if ns == tm.SWEEP:
+            ns = i // nsym
+        elif ns == tm.HALTAT:
+            ns = machine.stateids[machine.haltat]
+        elif ns < 0:
+            raise ValueError
+        machine.curr_state = machine.states[ns]
+        machine.numsteps = numsteps
+        tape.head = head
+        if tape is not machine.curr_tape:
+            machine.curr_tape = tape.to_linked(machine.curr_tape)
+
+    def close(self):
+        self.f.close()
@@ -0,0 +1,73 @@
+import contextlib
+import io
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import batch
+from machine import load_machine
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'examples', '0n1n.txt')
+
+TAPES = ['', '01', '0011', '0010', '0' * 30 + '1' * 30, '0' * 30 + '1' * 29, '0a1', '10' * 20]
+
+
+# Run a batch of the tapes above, one per line of a file, and return the
+# records written.
+def run(tmp_path, machine, workers, **options):
+    source = str(tmp_path / 'tapes.txt')
+    output = str(tmp_path / 'results.jsonl')
+    with open(source, 'w') as f:
+        f.write('\n'.join(TAPES) + '\n')
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert batch.run_batch(machine, source, workers, output, **options) == 0
+    with open(output, 'r') as f:
+        return [json.loads(line) for line in f]
+
+
+# The verdict and steps of each tape, as a run of it on its own gives them.
+def expected(definition, haltafter):
+    results = []
+    for tape in TAPES:
+        machine = definition.build(0, 0, haltafter)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                machine.add_tape(tape)
+                machine.run_tape()
+            results.append((batch.VERDICTS[machine.get_last_exit()], machine.numsteps, machine.get_last_exit()))
+        except SystemExit as e:
+            results.append(('error', 0, e.code))
+    return results
+
+
+# A batch gives every tape, in order, the result of running it on its own,
+# however many workers run it, in lockstep or not, and with its results
+# remembered or not.
+@pytest.mark.parametrize('options', [{}, {'memo': 4}, {'rows': 3}, {'rle': 1}, {'cycles': True}])
+@pytest.mark.parametrize('workers', [1, 2])
+def test_batch_matches_single(tmp_path, workers, options):
+    if 'rows' in options:
+        pytest.importorskip('numpy')
+    definition = load_machine(EXAMPLE)
+    for haltafter in [0, 20]:
+        records = run(tmp_path, definition.build(0, 0, haltafter), workers, **options)
+        assert [record['tape'] for record in records] == \
+               ['{}:{}'.format(tmp_path / 'tapes.txt', i + 1) for i in range(0, len(TAPES))]
+        got = [(record['verdict'], record['steps'], record['exit']) for record in records]
+        assert got == expected(definition, haltafter)
+
+
+# A tape file which cannot be found is an error with code 21, and takes no
+# steps, even after a tape which did.
+def test_missing_tape(tmp_path):
+    path = str(tmp_path / 'tape.txt')
+    with open(path, 'w') as f:
+        f.write('000111')
+    batch.init_worker(load_machine(EXAMPLE).build(), 0, False, 0)
+    assert batch.run_job((path, path, None))['steps'] > 0
+    record = batch.run_job(('missing', str(tmp_path / 'missing.txt'), None))
+    assert (record['verdict'], record['steps'], record['exit']) == ('error', 0, 21)
@@ -0,0 +1,89 @@
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import checkpoint
+from machine import load_machine
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+MACHINE = os.path.join(EXAMPLES, 'bitwise-double-oi.txt')
+TAPE = '0011110000110011' + '01' + '01100101'
+
+
+# Run a machine to the end, and return how it ended.
+def finish(machine):
+    with contextlib.redirect_stdout(io.StringIO()):
+        machine.run_tape()
+    return machine.get_result()
+
+
+# A machine stopped after any number of steps, saved and loaded into a new
+# machine, whether or not either keeps its tape as a linked list, ends just
+# as a run which was never stopped does.
+@pytest.mark.parametrize('linked', [False, True])
+def test_round_trip(tmp_path, linked):
+    path = str(tmp_path / 'run.checkpoint')
+    definition = load_machine(MACHINE)
+    whole = definition.build()
+    whole.add_tape(TAPE)
+    expected = finish(whole)
+    for steps in [0, 1, 17, 100, expected[1] - 1]:
+        machine = definition.build(0, 0, 0, None, False, False, linked)
+        machine.add_tape(TAPE)
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert machine.run(max_steps=steps) is None
+        checkpoint.save(machine, definition.key, path)
+        resumed = definition.build(0, 0, 0, None, False, False, not linked)
+        checkpoint.load(resumed, definition.key, path)
+        assert (resumed.numsteps, resumed.curr_state) == (steps, machine.curr_state)
+        assert finish(resumed) == expected, steps
+
+
+# A checkpoint of another machine, or a file which is not a whole checkpoint,
+# is refused with the code the command line exits with.
+def test_refused(tmp_path):
+    path = str(tmp_path / 'run.checkpoint')
+    definition = load_machine(MACHINE)
+    other = load_machine(os.path.join(EXAMPLES, '0n1n.txt'))
+    machine = definition.build()
+    machine.add_tape(TAPE)
+    with contextlib.redirect_stdout(io.StringIO()):
+        machine.run(max_steps=20)
+    checkpoint.save(machine, definition.key, path)
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    with pytest.raises(checkpoint.CheckpointError) as e:
+        checkpoint.load(other.build(), other.key, path)
+    assert e.value.code == 31
+
+    for broken in [b'', data[:len(checkpoint.MAGIC) + 10], data[:-1], b'TM TRACE 1\n' + data[len(checkpoint.MAGIC):]]:
+        with open(path, 'wb') as f:
+            f.write(broken)
+        with pytest.raises(checkpoint.CheckpointError) as e:
+            checkpoint.load(definition.build(), definition.key, path)
+        assert e.value.code == 30
+
+    with pytest.raises(checkpoint.CheckpointError) as e:
+        checkpoint.load(definition.build(), definition.key, str(tmp_path / 'missing'))
+    assert e.value.code == 30
+
+
+# A checkpointed run removes its checkpoint once the machine halts, unless
+# it was resumed from it.
+@pytest.mark.parametrize('remove', [True, False])
+def test_run_checkpointed(tmp_path, remove):
+    path = str(tmp_path / 'run.checkpoint')
+    definition = load_machine(MACHINE)
+    machine = definition.build()
+    machine.add_tape(TAPE)
+    checkpoint.save(machine, definition.key, path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        checkpoint.run_checkpointed(machine, definition.key, path, 0, remove)
+    assert machine.get_last_exit() == 0
+    assert os.path.exists(path) != remove
@@ -0,0 +1,85 @@
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import cycle
+from machine import load_machine
+
+# Walks right over its input, then bounces forever between the last symbol
+# and the blank after it.
+BOUNCER = """NAME: bouncer
+STATE: q0 q1 q2
+SIGMA: 0 1
+GAMMA: 0 1 B
+START: q0
+ACCEPT: qa
+REJECT: qr
+DELTA:
+q0 1 q0 1 R
+q0 0 q1 0 R
+q1 0 q1 0 R
+q1 B q2 B L
+q2 0 q1 0 R
+END
+"""
+
+# Writes 0 1 0 1 ... rightwards forever, and so never repeats itself.
+WRITER = """NAME: writer
+STATE: q0 q1
+SIGMA: 0 1
+GAMMA: 0 1 B
+START: q0
+ACCEPT: qa
+REJECT: qr
+DELTA:
+q0 0 q1 0 R
+q0 B q1 0 R
+q1 B q0 1 R
+END
+"""
+
+
+# The configuration of a machine after it has been run for the given number
+# of steps.
+def after(definition, tape, steps):
+    machine = definition.build(0, 0, 0, None, False, True)
+    machine.add_tape(tape)
+    with contextlib.redirect_stdout(io.StringIO()):
+        machine.run(max_steps=steps)
+    result = machine.get_result()
+    return result[2], result[4], result[5]
+
+
+# A machine which loops is stopped with code 4, and the cycle it reports
+# starts at the first configuration to come round again, and comes round
+# again after the period it gives.
+@pytest.mark.parametrize('tape', ['0', '00', '1110', '111000'])
+def test_finds_cycle(tape):
+    definition = load_machine(BOUNCER)
+    machine = definition.build()
+    machine.add_tape(tape)
+    with contextlib.redirect_stdout(io.StringIO()):
+        cycle.run_cycles(machine)
+    assert machine.get_last_exit() == 4
+    start, period = machine.cycle
+    assert period == 2
+    assert after(definition, tape, start) == after(definition, tape, start + period)
+    if start > 0:
+        assert after(definition, tape, start - 1) != after(definition, tape, start - 1 + period)
+
+
+# A machine which never halts but never repeats itself runs to its step
+# limit and aborts, just as without cycle detection.
+def test_no_cycle():
+    definition = load_machine(WRITER)
+    for haltafter in [1, 100, 5000]:
+        machine = definition.build(0, 0, haltafter)
+        machine.add_tape('0')
+        with contextlib.redirect_stdout(io.StringIO()):
+            cycle.run_cycles(machine)
+        assert (machine.get_last_exit(), machine.numsteps, machine.cycle) == (2, haltafter, None)
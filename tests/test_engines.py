@@ -0,0 +1,124 @@
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import codegen
+import cycle
+import macro
+from machine import load_machine
+
+HERE = os.path.dirname(__file__)
+EXAMPLES = os.path.join(HERE, '..', 'examples')
+INPUTS = os.path.join(HERE, '..', 'inputs')
+
+# The single-tape machines in examples/.
+MACHINES = sorted(name for name in os.listdir(EXAMPLES) if '2tape' not in name)
+
+# Step limits each machine is run with, 0 being none.
+LIMITS = [0, 1, 7, 100]
+
+# Runs which never halt, and so are only made with a step limit.
+ENDLESS = {('write-1.txt', '')}
+
+ENGINES = ['compiled', 'linked', 'rle', 'rle3', 'cycles', 'generated']
+
+# A machine which sweeps right across its input, back to the left end, and
+# then right again forever over the blanks past the end of its tape. Every
+# one of its steps but three is taken by a self-loop.
+SWEEPER = """NAME: sweeper
+STATE: q0 q1 q2
+SIGMA: 0 1
+GAMMA: 0 1 x B
+START: q0
+ACCEPT: qa
+REJECT: qr
+DELTA:
+q0 0 q0 x R
+q0 1 q1 1 L
+q1 x q1 0 L
+q1 0 q2 0 R
+q2 0 q2 0 R
+q2 1 q2 1 R
+q2 B q2 B R
+END
+"""
+
+
+# The tapes in inputs/ and a few more, with their whitespace taken out.
+def tapes():
+    found = ['', '0011', '0' * 30 + '1' * 30, '0' * 30 + '1' * 29, '0110' * 12]
+    for name in sorted(os.listdir(INPUTS)):
+        with open(os.path.join(INPUTS, name), 'r') as f:
+            found.append(''.join(f.read().split()))
+    return found
+
+
+# Run a machine on a tape with one engine, and return how it ended, or the
+# code it exited with.
+def run(definition, tape, engine, haltafter=0, haltat=None):
+    machine = definition.build(0, 0, haltafter, haltat, False, engine == 'reference', engine == 'linked')
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            machine.add_tape(tape)
+            if engine == 'rle':
+                macro.run_macro(machine, 1)
+            elif engine == 'rle3':
+                macro.run_macro(machine, 3)
+            elif engine == 'cycles':
+                cycle.run_cycles(machine)
+            elif engine == 'generated':
+                codegen.run_generated(machine)
+            else:
+                machine.run_tape()
+    except SystemExit as e:
+        return ('exit', e.code)
+    result = machine.get_result()
+    return (result[0], result[1], result[2], result[4], result[5])
+
+
+# Every engine ends every example machine on every tape just as the
+# reference engine does, with and without step limits and a state to halt at.
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('name', MACHINES)
+def test_engines_match_reference(name, engine):
+    definition = load_machine(os.path.join(EXAMPLES, name))
+    haltats = [None] + [q for q in definition.Q[1:2] if q not in (definition.q_a, definition.q_r)]
+    for tape in tapes():
+        for haltafter in LIMITS:
+            if haltafter == 0 and (name, tape) in ENDLESS:
+                continue
+            for haltat in haltats:
+                expected = run(definition, tape, 'reference', haltafter, haltat)
+                if expected == ('exit', 32):
+                    break
+                got = run(definition, tape, engine, haltafter, haltat)
+                if engine == 'cycles' and got[0] == 4:
+                    assert expected[0] == 2
+                    continue
+                assert got == expected, (tape, haltafter, haltat)
+
+
+# A step limit which falls partway through a self-loop stops it there, in
+# either direction, and one past the end of the tape grows the tape to fit.
+@pytest.mark.parametrize('engine', ENGINES)
+def test_sweeps_stop_at_limit(engine):
+    definition = load_machine(SWEEPER)
+    for haltafter in [1, 2, 25, 50, 51, 52, 75, 101, 102, 103, 150, 1000]:
+        tape = '0' * 50 + '1'
+        expected = run(definition, tape, 'reference', haltafter)
+        assert expected[:2] == (2, haltafter)
+        assert run(definition, tape, engine, haltafter) == expected, haltafter
+
+
+# A machine given a state to halt at which a sweep leads into stops as soon
+# as it takes the transition into it, at the end of the sweep.
+def test_haltat_in_sweep():
+    definition = load_machine(SWEEPER)
+    for engine in ['reference'] + ENGINES:
+        result = run(definition, '0' * 10 + '1', engine, 0, 'q1')
+        assert result[:3] == (2, 11, 'q1'), engine
@@ -0,0 +1,57 @@
+import contextlib
+import io
+import itertools
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import lockstep
+from machine import load_machine
+
+pytest.importorskip('numpy')
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+MACHINES = ['0n1n.txt', 'bitwise-double-0x1x.txt', 'bitwise-double-oi.txt', 'test-lengths.txt']
+
+
+# Every string over 0 and 1 up to 6 symbols long, a few longer ones, and one
+# with a symbol outside the input alphabet.
+def tapes():
+    found = [''.join(bits) for n in range(0, 7) for bits in itertools.product('01', repeat=n)]
+    return found + ['0' * 40 + '1' * 40, '00110101' * 5, '0a1']
+
+
+# Run a machine on each tape on its own with the compiled engine, and return
+# what lockstep would for each, leaving out the time taken.
+def single(definition, tapes, haltafter, haltat):
+    results = []
+    for tape in tapes:
+        machine = definition.build(0, 0, haltafter, haltat)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                machine.add_tape(tape)
+                machine.run_tape()
+            results.append((machine.get_last_exit(), machine.numsteps, machine.curr_state))
+        except SystemExit as e:
+            results.append((e.code, machine.numsteps, machine.curr_state))
+    return results
+
+
+# Lockstep gives each tape the exit code, steps and final state a run of it
+# on its own would have, whether the rows are stepped as arrays to the end or
+# handed to the compiled engine partway.
+@pytest.mark.parametrize('stragglers', [0, lockstep.STRAGGLERS])
+@pytest.mark.parametrize('name', MACHINES)
+def test_lockstep_matches_single(name, stragglers, monkeypatch):
+    monkeypatch.setattr(lockstep, 'STRAGGLERS', stragglers)
+    definition = load_machine(os.path.join(EXAMPLES, name))
+    for haltafter, haltat in [(0, None), (5, None), (30, None), (0, definition.Q[1])]:
+        machine = definition.build(0, 0, haltafter, haltat)
+        got = [result[:3] for result in lockstep.run_lockstep(machine, tapes())]
+        expected = single(definition, tapes(), haltafter, haltat)
+        for tape, a, b in zip(tapes(), got, expected):
+            assert a == b, (tape, haltafter, haltat)
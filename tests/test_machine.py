@@ -0,0 +1,88 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import cache
+from machine import load_machine, parse_machine, MachineError, MachineFileError, MissingFieldError, \
+    DeltaError, AsciiError, TapesError
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'examples', '0n1n.txt')
+
+HEADER = ["NAME: test", "STATE: q0 q1", "SIGMA: 0 1", "GAMMA: 0 1 B", "START: q0", "ACCEPT: qa", "REJECT: qr"]
+
+
+# The text of a machine file with the given lines before and in DELTA.
+def text(header, delta):
+    return '\n'.join(header + ["DELTA:"] + delta + ["END", ""])
+
+
+# Each problem with a machine file is raised with the exit code the command
+# line uses for it, and the line it was found on.
+@pytest.mark.parametrize('source,kind,code,line', [
+    (text(HEADER, ["q0 0 q1 1 R", "q5 1 q1 1 R"]), DeltaError, 12, 10),
+    (text(HEADER, ["q0 0 q1"]), DeltaError, 13, 9),
+    (text(HEADER[:1] + HEADER[2:], []), MissingFieldError, 15, 7),
+    (text(HEADER[:6], []), MissingFieldError, 20, 7),
+    (text(HEADER[1:], []), MissingFieldError, 14, 7),
+    (text(HEADER[:1] + ["TAPES: 0"] + HEADER[1:], []), TapesError, 45, 2),
+    (text(HEADER[:1] + ["TAPES: two"] + HEADER[1:], []), TapesError, 45, 2),
+])
+def test_parse_errors(source, kind, code, line):
+    with pytest.raises(kind) as e:
+        parse_machine(source)
+    assert (e.value.code, e.value.line) == (code, line)
+
+
+# States and symbols outside ASCII are only refused when ASCII was asked for.
+@pytest.mark.parametrize('field,code', [(1, 23), (2, 24), (3, 25)])
+def test_ascii(field, code):
+    header = list(HEADER)
+    header[field] += ' γ'
+    parse_machine(text(header, []))
+    with pytest.raises(AsciiError) as e:
+        parse_machine(text(header, []), True)
+    assert e.value.code == code
+
+
+# A missing file is code 11. Anything with a newline in it is read as the
+# text of a machine rather than a path, and gives the same machine as its
+# file.
+def test_load(tmp_path):
+    with pytest.raises(MachineFileError) as e:
+        load_machine(str(tmp_path / 'missing.txt'))
+    assert e.value.code == 11
+    assert isinstance(e.value, MachineError)
+    with open(EXAMPLE, 'r', newline='') as f:
+        source = f.read()
+    from_path = load_machine(EXAMPLE)
+    from_text = load_machine(source)
+    assert from_path.key == from_text.key
+    assert from_path.δ == from_text.δ
+
+
+# Choices keep every transition given for a state and symbol, in order, and
+# δ the last of them.
+def test_choices():
+    definition = parse_machine(text(HEADER, ["q0 0 q0 0 R", "q0 0 q1 1 L", "q0 1 qa"]))
+    assert definition.choices == {'q0 0': [('q0', '0', 'R'), ('q1', '1', 'L')]}
+    assert definition.δ['q0 0'] == ('q1', '1', 'L')
+    assert definition.δ['q0 1'] == ('qa', 'B', 'L')
+
+
+# A machine loaded through a cache is compiled once, and read back from the
+# cache by the contents of its file after that.
+def test_cached(tmp_path, monkeypatch):
+    store = cache.Store(str(tmp_path), 1)
+    first = load_machine(EXAMPLE, False, store)
+    assert first.tables is not None
+
+    def parse(text, ascii=False):
+        raise AssertionError("machine was parsed again")
+
+    monkeypatch.setattr(sys.modules['machine'], 'parse_machine', parse)
+    second = load_machine(EXAMPLE, False, store)
+    assert second.key == first.key
+    assert second.δ == first.δ
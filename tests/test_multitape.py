@@ -0,0 +1,48 @@
+import contextlib
+import io
+import itertools
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from machine import load_machine
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+TAPES = [''.join(bits) for n in range(0, 7) for bits in itertools.product('01', repeat=n)] + [
+    '0' * 50 + '1' * 50, '0' * 50 + '1' * 49]
+
+
+# Run a machine on a tape, and return how it ended.
+def run(definition, tape, haltafter=0, haltat=None, reference=False, linked=False):
+    machine = definition.build(0, 0, haltafter, haltat, False, reference, linked)
+    with contextlib.redirect_stdout(io.StringIO()):
+        machine.add_tape(tape)
+        machine.run_tape()
+    return machine.get_result()
+
+
+# The compiled engine, on either kind of tape, ends a two-tape machine just
+# as the reference engine does, with and without step limits and a state to
+# halt at.
+@pytest.mark.parametrize('linked', [False, True])
+def test_compiled_matches_reference(linked):
+    definition = load_machine(os.path.join(EXAMPLES, '0n1n-2tape.txt'))
+    for tape in TAPES:
+        for haltafter, haltat in [(0, None), (1, None), (9, None), (0, 'q2')]:
+            expected = run(definition, tape, haltafter, haltat, reference=True)
+            assert run(definition, tape, haltafter, haltat, linked=linked) == expected, (tape, haltafter, haltat)
+
+
+# The two-tape machine decides the same language as the one-tape one, in
+# steps linear in the length of its input.
+def test_same_language_as_one_tape():
+    two = load_machine(os.path.join(EXAMPLES, '0n1n-2tape.txt'))
+    one = load_machine(os.path.join(EXAMPLES, '0n1n.txt'))
+    for tape in TAPES:
+        result = run(two, tape)
+        assert result[0] == run(one, tape)[0], tape
+        assert result[1] <= 2 * len(tape) + 1
@@ -0,0 +1,86 @@
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import ntm
+from machine import load_machine
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+MACHINES = ['0n1n.txt', 'bitwise-double-0x1x.txt', 'bitwise-double-oi.txt']
+
+TAPES = ['', '01', '0011', '0010', '0' * 8 + '1' * 8, '00110101', '0000110011', '0110']
+
+# Accepts the strings with 11 in them, by guessing at each 1 whether it is
+# the first of them. The last transition given for a choice is the one the
+# deterministic engines take, so they only ever look at the first 1.
+GUESSER = """NAME: guess 11
+STATE: q0 q1
+SIGMA: 0 1
+GAMMA: 0 1 B
+START: q0
+ACCEPT: qa
+REJECT: qr
+DELTA:
+q0 0 q0 0 R
+q0 1 q0 1 R
+q0 1 q1 1 R
+q1 1 qa
+END
+"""
+
+
+def search(definition, tape, haltafter=0, mode='bfs', workers=1):
+    machine = definition.build(0, 0, haltafter)
+    with contextlib.redirect_stdout(io.StringIO()):
+        machine.add_tape(tape)
+        ntm.run_ntm(machine, definition.choices, mode, 0, False, workers)
+    return machine
+
+
+# On a deterministic machine the search follows its one branch, and ends as
+# the reference engine does: accepting after the same steps with the same
+# tape, or rejecting. A branch cut off by the step limit aborts, unless it
+# was dropped for coming back to where it had been, which rejects.
+@pytest.mark.parametrize('mode', ['bfs', 'iddfs'])
+@pytest.mark.parametrize('name', MACHINES)
+def test_deterministic_matches_reference(name, mode):
+    definition = load_machine(os.path.join(EXAMPLES, name))
+    for tape in TAPES:
+        for haltafter in [0, 10]:
+            reference = definition.build(0, 0, haltafter, None, False, True)
+            with contextlib.redirect_stdout(io.StringIO()):
+                reference.add_tape(tape)
+                reference.run_tape()
+            machine = search(definition, tape, haltafter, mode)
+            if reference.lastexit == 2:
+                assert machine.lastexit in (1, 2), (tape, haltafter)
+                continue
+            assert machine.lastexit == reference.lastexit, (tape, haltafter)
+            if machine.lastexit == 0:
+                assert machine.numsteps == reference.numsteps
+                assert machine.get_result()[4:] == reference.get_result()[4:]
+
+
+# A nondeterministic machine accepts when any branch does, after the steps
+# its shortest accepting branch takes, searched either way and split among
+# worker processes or not.
+@pytest.mark.parametrize('workers', [1, 2])
+@pytest.mark.parametrize('mode', ['bfs', 'iddfs'])
+def test_any_branch_accepts(mode, workers):
+    definition = load_machine(GUESSER)
+    for tape, steps in [('1011', 3), ('0000110', 5), ('1' * 10, 1)]:
+        machine = search(definition, tape, 0, mode, workers)
+        assert (machine.lastexit, machine.numsteps) == (0, steps), tape
+    for tape in ['', '1010', '0100101']:
+        assert search(definition, tape, 0, mode, workers).lastexit == 1, tape
+    deterministic = definition.build()
+    with contextlib.redirect_stdout(io.StringIO()):
+        deterministic.add_tape('1011')
+        deterministic.run_tape()
+    assert deterministic.lastexit == 1
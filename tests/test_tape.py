@@ -0,0 +1,93 @@
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import tape
+from machine import load_machine
+from tape import ArrayTape
+
+# Alphabets the files below are written over: one of ASCII symbols, one with
+# symbols outside ASCII, and one too large for a tape of bytes.
+ASCII = ['0', '1', 'a']
+GREEK = ['0', 'α', 'γ', 'ω']
+WIDE = [chr(0x100 + i) for i in range(0, 300)]
+
+CONTENTS = [
+    (ASCII, ''),
+    (ASCII, ' \n\t '),
+    (ASCII, '0101a\n1a0\r\n  001\n'),
+    (ASCII, '01' * 500 + '\n'),
+    (GREEK, '0αγ\nγω0 α\n'),
+    (GREEK, 'ωωω0\n' * 50),
+    (GREEK, '00000000αγ'),
+    (WIDE, ' '.join(WIDE) + '\n' + ''.join(reversed(WIDE))),
+]
+
+
+# The symbols on a tape, from its left end.
+def symbols(t):
+    return [t.symbols[c] for c in t.cells[t.left:]], t.head - t.left
+
+
+# A tape loaded from a file holds what one made from the file's contents with
+# the whitespace taken out does, however the file falls into chunks, even
+# when a chunk ends partway through a character.
+@pytest.mark.parametrize('chunk', [1, 2, 3, 7, tape.CHUNK])
+@pytest.mark.parametrize('alphabet,text', CONTENTS)
+def test_load_matches_gen_tape(tmp_path, monkeypatch, chunk, alphabet, text):
+    monkeypatch.setattr(tape, 'CHUNK', chunk)
+    path = str(tmp_path / 'tape.txt')
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    loaded = ArrayTape.load(path, alphabet, 'B')
+    made = ArrayTape.gen_tape(''.join(text.split()), alphabet, 'B')
+    assert symbols(loaded) == symbols(made)
+
+
+# A file with a symbol outside the input alphabet, or which is not UTF-8,
+# exits with code 32, wherever the symbol falls.
+@pytest.mark.parametrize('chunk', [1, 3, tape.CHUNK])
+@pytest.mark.parametrize('alphabet,data', [
+    (ASCII, b'0101x'),
+    (ASCII, b'01 \xce\xb1 10'),
+    (GREEK, b'0\xce\xb1 1'),
+    (GREEK, b'0\xce\xb1\xce'),
+    (GREEK, b'\xff0'),
+    (WIDE, b'0'),
+])
+def test_load_invalid(tmp_path, monkeypatch, capsys, chunk, alphabet, data):
+    monkeypatch.setattr(tape, 'CHUNK', chunk)
+    path = str(tmp_path / 'tape.txt')
+    with open(path, 'wb') as f:
+        f.write(data)
+    with pytest.raises(SystemExit) as e:
+        ArrayTape.load(path, alphabet, 'B')
+    assert e.value.code == 32
+    assert "not in input alphabet" in capsys.readouterr().out
+
+
+# A machine loading its tape from a file, onto either kind of tape, ends
+# just as one given the file's contents does.
+@pytest.mark.parametrize('linked', [False, True])
+def test_machine_load_tape(tmp_path, linked):
+    path = str(tmp_path / 'tape.txt')
+    with open(path, 'w') as f:
+        f.write('000 000\n111\n111\n')
+    definition = load_machine(os.path.join(os.path.dirname(__file__), '..', 'examples', '0n1n.txt'))
+    results = []
+    for load in [True, False]:
+        machine = definition.build(0, 0, 0, None, False, False, linked)
+        if load:
+            machine.load_tape(path)
+        else:
+            machine.add_tape('000000111111')
+        with contextlib.redirect_stdout(io.StringIO()):
+            machine.run_tape()
+        results.append(machine.get_result())
+    assert results[0] == results[1]
+    assert results[0][0] == 0
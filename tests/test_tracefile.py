@@ -0,0 +1,112 @@
+import contextlib
+import io
+import os
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import tracefile
+from machine import load_machine
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'examples', '0n1n.txt')
+
+
+def record(path, monkeypatch):
+    monkeypatch.setattr(tracefile, 'KEYFRAME', 1000)
+    definition = load_machine(EXAMPLE, False)
+    machine = definition.build(0, 0, 0, None, False, False, False)
+    machine.add_tape('0' * 200 + '1' * 200)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracefile.run_traced(machine, definition.key, path)
+    return definition, machine.numsteps
+
+
+# A trace closed properly is opened and seeked through its index alone,
+# without scanning the file from the start.
+def test_seek_uses_index(tmp_path, monkeypatch):
+    path = str(tmp_path / 'run.trace')
+    definition, steps = record(path, monkeypatch)
+
+    def scan(self):
+        raise AssertionError("trace was scanned instead of using its index")
+
+    monkeypatch.setattr(tracefile.Reader, 'scan', scan)
+    machine = definition.build(0, 0, 0, None, False, False, False)
+    reader = tracefile.Reader(path, machine, definition.key)
+    assert reader.span() == (0, steps)
+    assert len(reader.keyframes) > 1
+    reader.seek(steps // 2)
+    assert machine.numsteps == steps // 2
+
+
+# The configuration of a machine run for some steps.
+def configuration(machine):
+    result = machine.get_result()
+    return result[1], result[2], result[4], result[5]
+
+
+# The machine run straight to the given step from the start.
+def run_to(definition, step):
+    machine = definition.build(0, 0, 0, None, False, False, False)
+    machine.add_tape('0' * 200 + '1' * 200)
+    with contextlib.redirect_stdout(io.StringIO()):
+        machine.run(max_steps=step)
+    return configuration(machine)
+
+
+# Seeking to any step, on either side of a keyframe, leaves the machine just
+# as running it to that step from the start does, and seeking backwards
+# works as well as forwards.
+def test_seek_matches_run(tmp_path, monkeypatch):
+    path = str(tmp_path / 'run.trace')
+    definition, steps = record(path, monkeypatch)
+    machine = definition.build(0, 0, 0, None, False, False, False)
+    reader = tracefile.Reader(path, machine, definition.key)
+    first = reader.keyframes[1][0]
+    for step in [0, 1, 999, first - 1, first, first + 1, steps // 3, steps - 1, steps, 5]:
+        reader.seek(step)
+        assert configuration(machine) == run_to(definition, step), step
+    reader.close()
+
+
+# A trace cut short, with no index and its last block of records only
+# partly written, is scanned for its keyframes, and holds every step whose
+# record was written.
+def test_cut_short(tmp_path, monkeypatch):
+    path = str(tmp_path / 'run.trace')
+    definition, steps = record(path, monkeypatch)
+    with open(path, 'rb') as f:
+        data = f.read()
+    index = struct.unpack('<Q', data[-8:])[0]
+    with open(path, 'wb') as f:
+        f.write(data[:index - 100])
+    machine = definition.build(0, 0, 0, None, False, False, False)
+    reader = tracefile.Reader(path, machine, definition.key)
+    assert reader.span() == (0, steps - 100)
+    reader.seek(steps - 100)
+    assert configuration(machine) == run_to(definition, steps - 100)
+    reader.close()
+
+
+# A trace of another machine, a step outside the trace and a file which is
+# not a trace are refused with the codes the command line exits with.
+def test_refused(tmp_path, monkeypatch):
+    path = str(tmp_path / 'run.trace')
+    definition, steps = record(path, monkeypatch)
+    other = load_machine(os.path.join(os.path.dirname(EXAMPLE), 'bitwise-double-oi.txt'))
+    with pytest.raises(tracefile.TraceError) as e:
+        tracefile.Reader(path, other.build(), other.key)
+    assert e.value.code == 38
+    reader = tracefile.Reader(path, definition.build(), definition.key)
+    with pytest.raises(tracefile.TraceError) as e:
+        reader.seek(steps + 1)
+    assert e.value.code == 39
+    reader.close()
+    with open(path, 'wb') as f:
+        f.write(b'TM CHECKPOINT 1\n')
+    with pytest.raises(tracefile.TraceError) as e:
+        tracefile.Reader(path, definition.build(), definition.key)
+    assert e.value.code == 37